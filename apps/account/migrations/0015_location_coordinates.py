@@ -0,0 +1,57 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:40
+
+import math
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+
+def parse_coordinate(value, limit):
+    try:
+        number = float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+    if not math.isfinite(number) or abs(number) > limit:
+        return None
+    return number
+
+
+def backfill_coordinates(apps, schema_editor):
+    UserLocation = apps.get_model('account', 'UserLocation')
+    last_id = 0
+    while True:
+        locations = list(UserLocation.objects.filter(id__gt=last_id).order_by('id')
+                         .only('id', 'latitude', 'longitude')[:CHUNK_SIZE])
+        if not locations:
+            break
+        changed = []
+        for location in locations:
+            lat = parse_coordinate(location.latitude, 90) if location.latitude is not None else None
+            lng = parse_coordinate(location.longitude, 180) if location.longitude is not None else None
+            if lat is not None and lng is not None:
+                location.lat, location.lng = lat, lng
+                changed.append(location)
+        UserLocation.objects.bulk_update(changed, ['lat', 'lng'])
+        last_id = locations[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0014_carta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userlocation',
+            name='lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userlocation',
+            name='lng',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_coordinates, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import math
+
 from celery.utils.log import base_logger
 from django.db import models
 from django.db.models.signals import pre_save
@@ -6,6 +8,8 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.template.defaultfilters import title
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
+from config.cache import invalidate_on_change
+from config.thumbnails import thumbnails_on_save
 
 
 class UserManager(BaseUserManager):
@@ -54,11 +58,27 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.name
 
 
+def parse_coordinate(value, limit):
+    """Matn ko'rinishidagi koordinatani float ga o'giradi ("41,31" ham qabul qilinadi). Noto'g'ri bo'lsa None."""
+    if value is None:
+        return None
+    try:
+        number = float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+    if not math.isfinite(number) or abs(number) > limit:
+        return None
+    return number
+
+
 class UserLocation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='location')
     location = models.CharField(max_length=123, null=True, blank=True)
     latitude = models.CharField(max_length=100, null=True, blank=True)
     longitude = models.CharField(max_length=100, null=True, blank=True)
+    # latitude/longitude matnidan saqlashda hisoblanadi
+    lat = models.FloatField(null=True, blank=True, editable=False)
+    lng = models.FloatField(null=True, blank=True, editable=False)
     floor = models.CharField(max_length=123, null=True, blank=True)
     apartment = models.CharField(max_length=123, null=True, blank=True)
     modified_date = models.DateTimeField(auto_now=True)
@@ -67,6 +87,15 @@ class UserLocation(models.Model):
     def __str__(self):
         return f"Location of {self.user}: ({self.latitude}, {self.longitude}), ({self.floor}, {self.apartment})"
 
+    def save(self, *args, **kwargs):
+        self.lat = parse_coordinate(self.latitude, 90)
+        self.lng = parse_coordinate(self.longitude, 180)
+        if self.lat is None or self.lng is None:
+            self.lat = self.lng = None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'lat', 'lng'}
+        super().save(*args, **kwargs)
+
 
 class UserToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -128,3 +157,8 @@ class Carta(models.Model):
     def __str__(self):
         return f"{self.user_carta_name}  --->  {self.bank_name}"
 
+
+invalidate_on_change(NewBlock, Advice, Call, Banner)
+
+thumbnails_on_save(User, 'avatar')
+thumbnails_on_save(Banner, 'image')
@@ -7,6 +7,7 @@ from django.contrib.auth.password_validation import validate_password, password_
 from apps.account.models import User, UserToken
 from .models import UserLocation, NewBlock, Advice, Call, Banner, Carta
 from django.contrib.auth import get_user_model
+from config.thumbnails import ThumbnailField
 
 
 class UserRegisterSerializer(serializers.ModelSerializer):
@@ -60,10 +61,12 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    avatar_thumbnails = ThumbnailField(source='avatar')
+
     class Meta:
         model = User
         fields = (
-            'id', 'name', 'phone', 'avatar', 'is_active', 'is_superuser', 'is_staff', 'modified_date',
+            'id', 'name', 'phone', 'avatar', 'avatar_thumbnails', 'is_active', 'is_superuser', 'is_staff', 'modified_date',
             'created_date')
 
 
@@ -85,7 +88,8 @@ class UserLocationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = UserLocation
-        fields = ['id', 'user', 'location', 'latitude', 'longitude', 'floor', 'apartment', ]
+        fields = ['id', 'user', 'location', 'latitude', 'longitude', 'lat', 'lng', 'floor', 'apartment', ]
+        read_only_fields = ['lat', 'lng']
 
     def create(self, validated_data):
         user = self.context['request'].user
@@ -94,9 +98,11 @@ class UserLocationSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    avatar_thumbnails = ThumbnailField(source='avatar')
+
     class Meta:
         model = User
-        fields = ['id', 'name', 'phone', 'avatar', ]
+        fields = ['id', 'name', 'phone', 'avatar', 'avatar_thumbnails', ]
 
 
 class UserUpdateSerializer(serializers.ModelSerializer):
@@ -137,9 +143,11 @@ class CallSerializer(serializers.ModelSerializer):
 
 
 class BannerSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailField(source='image')
+
     class Meta:
         model = Banner
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'thumbnails']
 
 
 class CartaSerializer(serializers.ModelSerializer):
@@ -27,6 +27,7 @@ from .permissions import IsOwnerOrReadOnly, IsAdminOrReadOnly
 from .models import UserLocation, NewBlock, Advice, Call, Carta
 from .serializers import UserLocationSerializer
 from ..product.permissions import IsAdminOrReadOnly
+from config.cache import CachedListMixin
 
 
 class UserLocationUpdateAPIView(viewsets.ModelViewSet):
@@ -141,7 +142,7 @@ class UserDeleteView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class NewBlockListCreateView(generics.ListCreateAPIView):
+class NewBlockListCreateView(CachedListMixin, generics.ListCreateAPIView):
     queryset = NewBlock.objects.all()
     serializer_class = NewBlockSerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -155,7 +156,7 @@ class NewBlockDetailView(generics.RetrieveUpdateDestroyAPIView):
     parser_classes = [MultiPartParser, FormParser]
 
 
-class AdviceViewSet(viewsets.ModelViewSet):
+class AdviceViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = Advice.objects.all()
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = AdviceSerializer
@@ -166,7 +167,7 @@ class AdviceViewSet(viewsets.ModelViewSet):
         return Response({'deleted': True}, status=status.HTTP_200_OK)
 
 
-class CallViewSet(viewsets.ModelViewSet):
+class CallViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = Call.objects.all()
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = CallSerializer
@@ -177,7 +178,7 @@ class CallViewSet(viewsets.ModelViewSet):
         return Response({'deleted': True}, status=status.HTTP_200_OK)
 
 
-class BannerViewSet(viewsets.ModelViewSet):
+class BannerViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = Banner.objects.all()
     serializer_class = BannerSerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -1,25 +1,87 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.utils.html import format_html
-from django.core.exceptions import ValidationError
-from .models import CartItem, Order, Promo, Courier
+from .models import CartItem, Order, Promo, PromoRedemption, Courier
+from .dispatch import auto_dispatch
+from .exports import orders_export_response
+from .routing import dispatch_waves
+from .promos import expire_promos, fill_batch, iter_promo_chunks, stream_promos_csv
+from .receipts import (EXPORT_PDF_MAX_ORDERS, receipt_data, receipt_digest, receipt_path, receipts_pdf_response,
+                       receipts_zip_response, render_receipt_file)
 from django.urls import path, reverse
-from django.http import HttpResponse
-from django.db import transaction
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.utils.safestring import mark_safe
 import json
 from django.contrib.admin.widgets import AdminRadioSelect
 from django.db import models  # Bu qatorni qo'shing
+from config.pagination import EstimatedCountPaginator
+
+COURIER_GROUP = 'Courier'
+
+
+class PromoRedemptionInline(admin.TabularInline):
+    model = PromoRedemption
+    fields = ('user', 'order', 'created_date')
+    readonly_fields = ('user', 'order', 'created_date')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class PromoActionForm(ActionForm):
+    count = forms.IntegerField(required=False, min_value=1, max_value=100000, label="Kodlar soni")
+    batch = forms.CharField(required=False, max_length=32, label="Kampaniya")
+
+
+def promos_csv_response(chunks, filename):
+    response = StreamingHttpResponse(stream_promos_csv(chunks), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 @admin.register(Promo)
 class PromoAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'name', 'discount', 'min_price', 'expire_date', 'is_expired', 'created_date')
+    list_display = ('id', 'user', 'name', 'batch', 'discount', 'min_price', 'expire_date', 'is_expired',
+                    'created_date')
     date_hierarchy = 'created_date'
-    list_filter = ('is_expired',)
-    filter_horizontal = ('members',)
+    list_filter = ('is_expired', 'batch')
+    inlines = (PromoRedemptionInline,)
+    action_form = PromoActionForm
+    actions = ('generate_codes', 'export_codes', 'expire_codes')
     readonly_fields = ('created_date',)
     search_fields = ('user__username', 'user__full_name')
 
+    @admin.action(description="Tanlangan promo shartlari bilan kampaniyani kodlar soniga to'ldirish (CSV)")
+    def generate_codes(self, request, queryset):
+        try:
+            count = int(request.POST.get('count') or 0)
+        except ValueError:
+            count = 0
+        batch = request.POST.get('batch', '').strip()[:32]
+        if queryset.count() != 1 or not 0 < count <= 100000 or not batch:
+            self.message_user(request, "Bitta namuna promo, kodlar soni va kampaniya nomini kiriting.",
+                              level=messages.ERROR)
+            return None
+        sample = queryset.get()
+        # Kodlar javob uzatilishidan oldin yoziladi: yuklab olish uzilsa ham kampaniya to'liq qoladi,
+        # mavjud kampaniya uchun esa faqat yetishmagan kodlar qo'shiladi
+        fill_batch(count, batch, user=request.user, discount=sample.discount, min_price=sample.min_price,
+                   expire_date=sample.expire_date, description=sample.description)
+        chunks = iter_promo_chunks(Promo.objects.filter(batch=batch))
+        return promos_csv_response(chunks, f'promo_{batch}.csv')
+
+    @admin.action(description="Tanlangan kodlarni yuklab olish (CSV)")
+    def export_codes(self, request, queryset):
+        return promos_csv_response(iter_promo_chunks(queryset), 'promo_codes.csv')
+
+    @admin.action(description="Tanlangan kodlar muddatini tugatish")
+    def expire_codes(self, request, queryset):
+        expired = expire_promos(queryset)
+        self.message_user(request, f"{expired} ta promo muddati o'tgan deb belgilandi.")
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
@@ -30,11 +92,18 @@ class CartItemAdmin(admin.ModelAdmin):
 
     @admin.register(Courier)
     class CourierAdmin(admin.ModelAdmin):
-        list_display = ('user', 'phone', 'group')
+        list_display = ('user', 'phone', 'group', 'is_available', 'capacity', 'position_date')
         search_fields = ('user', 'phone', 'group__name')
         list_filter = ('group',)
 
 
+class CourierListFilter(admin.RelatedFieldListFilter):
+    """Kuryer nomi foydalanuvchisidan olinadi, shuning uchun ro'yxat har kuryer uchun alohida so'rovsiz quriladi."""
+
+    def field_choices(self, field, request, model_admin):
+        return [(courier.pk, str(courier)) for courier in Courier.objects.select_related('user').order_by('id')]
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = (
@@ -47,6 +116,14 @@ class OrderAdmin(admin.ModelAdmin):
               'courier',
               'created_date', 'formatted_location_data']
     date_hierarchy = 'created_date'
+    list_filter = ('status', ('courier', CourierListFilter))
+    # Sahifadagi 100 ta buyurtma uchun foydalanuvchi va kuryer bitta JOIN bilan olinadi
+    list_select_related = ('user', 'courier__user')
+    list_per_page = 100
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('export_orders_csv', 'export_orders_xlsx', 'export_receipts_zip', 'export_receipts_pdf',
+               'dispatch_to_nearest_couriers', 'dispatch_in_waves')
     readonly_fields = ('get_amount', 'formatted_items', 'formatted_items_data', 'get_user_name', 'get_user_phone',
                        'assigned_date',
                        'delivered_date', 'created_date', 'modified_date', 'formatted_location_data')
@@ -60,32 +137,39 @@ class OrderAdmin(admin.ModelAdmin):
 
     payment_confirmed.short_description = "Tulov holati"  # O'zgartirildi
 
+    def get_courier_role(self, request):
+        """
+        (kuryermi, Courier yozuvi yoki None). Guruh va kuryer so'rov davomida bir marta aniqlanadi, chunki
+        get_queryset, has_change_permission va get_readonly_fields bir so'rovda bir necha marta chaqiriladi.
+        """
+        if not hasattr(request, '_courier_role'):
+            is_courier = request.user.groups.filter(name=COURIER_GROUP).exists()
+            courier = Courier.objects.filter(user=request.user).first() if is_courier else None
+            request._courier_role = (is_courier, courier)
+        return request._courier_role
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if request.user.is_staff and not request.user.groups.filter(name='Courier').exists():
+        is_courier, courier = self.get_courier_role(request)
+        if request.user.is_staff and not is_courier:
             return qs
-        elif request.user.groups.filter(name='Courier').exists():
-            try:
-                courier = Courier.objects.get(user=request.user)
-                return qs.filter(courier=courier)
-            except Courier.DoesNotExist:
-                return qs.none()
+        elif is_courier and courier:
+            return qs.filter(courier=courier)
         else:
             return qs.none()
 
     def has_change_permission(self, request, obj=None):
-        if request.user.is_staff and not request.user.groups.filter(name='Courier').exists():
+        is_courier, courier = self.get_courier_role(request)
+        if request.user.is_staff and not is_courier:
             return True
-        elif request.user.groups.filter(name='Courier').exists():
-            if obj and obj.courier and obj.courier.user == request.user:
-                return True
-            return False
+        elif is_courier:
+            return bool(obj and courier and obj.courier_id == courier.id)
         return False
 
     def get_readonly_fields(self, request, obj=None):
-        if request.user.groups.filter(name='Courier').exists():
+        if self.get_courier_role(request)[0]:
             all_fields = [f.name for f in self.model._meta.fields] + [f.name for f in self.model._meta.many_to_many]
-            return [f for f in all_fields if f != 'status']
+            return [*self.readonly_fields, *(f for f in all_fields if f != 'status' and f not in self.readonly_fields)]
         else:
             return self.readonly_fields
 
@@ -123,6 +207,10 @@ class OrderAdmin(admin.ModelAdmin):
 
     get_file_link.short_description = "Fayl"
 
+    @admin.display(description="Summa", ordering='total')
+    def get_amount(self, obj):
+        return obj.total
+
     def get_user_name(self, obj):
         return obj.user.name
 
@@ -164,38 +252,6 @@ class OrderAdmin(admin.ModelAdmin):
 
     formatted_items_data.short_description = "Mahsulotlar Ma'lumotlari"
 
-    def save_model(self, request, obj, form, change):
-        with transaction.atomic():
-            super().save_model(request, obj, form, change)
-            obj.refresh_from_db()
-            items = obj.items.all()
-            for item in items:
-                product = item.product
-                if item.quantity > product.quantity:
-                    raise ValidationError(
-                        f"{product.name} mahsulotidan yetarli miqdorda mavjud emas. "
-                        f"Qoldiq: {product.quantity} ta."
-                    )
-                product.quantity -= item.quantity
-                product.save()
-
-    formatted_items_data.short_description = "Mahsulotlar data"
-
-    def save_model(self, request, obj, form, change):
-        with transaction.atomic():
-            super().save_model(request, obj, form, change)
-            obj.refresh_from_db()
-            items = obj.items.all()
-            for item in items:
-                product = item.product
-                if item.quantity > product.quantity:
-                    raise ValidationError(
-                        f"{product.name} mahsulotidan yetarli miqdorda mavjud emas. "
-                        f"Qoldiq: {product.quantity} ta."
-                    )
-                product.quantity -= item.quantity
-                product.save()
-
     def pdf_receipt_link(self, obj):
         if obj.status == 'delivered':
             url = reverse('admin:order-pdf', args=[obj.id])
@@ -214,7 +270,40 @@ class OrderAdmin(admin.ModelAdmin):
     def download_pdf(self, request, order_id):
         order = self.get_object(request, order_id)
         if order and order.status == 'delivered':
-            response = HttpResponse(order.generate_pdf_receipt, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="order_{order_id}_receipt.pdf"'
-            return response
+            # Admin kutib turmasligi uchun chek tayyor bo'lmasa shu yerning o'zida yaratiladi
+            data = receipt_data(order)
+            path = render_receipt_file(data, receipt_path(order.id, receipt_digest(data)))
+            return FileResponse(default_storage.open(path, 'rb'), content_type='application/pdf', as_attachment=True,
+                                filename=f'order_{order_id}_receipt.pdf')
         return HttpResponse("Chek mavjud emas", status=404)
+
+    @admin.action(description="Eng yaqin bo'sh kuryerlarga biriktirish")
+    def dispatch_to_nearest_couriers(self, request, queryset):
+        assigned = auto_dispatch(queryset)
+        self.message_user(request, f"{assigned} ta buyurtma kuryerlarga biriktirildi.")
+
+    @admin.action(description="Yaqinligi bo'yicha guruhlab kuryerlarga marshrut bilan berish")
+    def dispatch_in_waves(self, request, queryset):
+        waves = dispatch_waves(queryset)
+        assigned = sum(len(ids) for ids in waves.values())
+        self.message_user(request, f"{assigned} ta buyurtma {len(waves)} ta kuryerga marshrut bilan biriktirildi.")
+
+    @admin.action(description="Tanlangan buyurtmalarni qatorlari bilan yuklab olish (CSV)")
+    def export_orders_csv(self, request, queryset):
+        return orders_export_response(queryset, 'csv')
+
+    @admin.action(description="Tanlangan buyurtmalarni qatorlari bilan yuklab olish (XLSX)")
+    def export_orders_xlsx(self, request, queryset):
+        return orders_export_response(queryset, 'xlsx')
+
+    @admin.action(description="Tanlangan buyurtmalar cheklarini yuklab olish (ZIP)")
+    def export_receipts_zip(self, request, queryset):
+        return receipts_zip_response(queryset)
+
+    @admin.action(description="Tanlangan buyurtmalar cheklarini yuklab olish (bitta PDF)")
+    def export_receipts_pdf(self, request, queryset):
+        if queryset.count() > EXPORT_PDF_MAX_ORDERS:
+            self.message_user(request, f"Bitta PDF ga ko'pi bilan {EXPORT_PDF_MAX_ORDERS} ta buyurtma sig'adi, "
+                                       f"ZIP ni tanlang.", level=messages.ERROR)
+            return None
+        return receipts_pdf_response(queryset)
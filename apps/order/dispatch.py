@@ -0,0 +1,309 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from apps.account.models import parse_coordinate
+from .models import Courier, Order
+
+KM_PER_DEGREE = 111.32
+# To'r katakchasi o'lchami (km) va koordinatalar tekislikka proyeksiyalanadigan kenglik (Toshkent)
+GRID_CELL_SIZE = getattr(settings, 'DISPATCH_GRID_CELL_SIZE', 1.0)
+REFERENCE_LATITUDE = getattr(settings, 'DISPATCH_REFERENCE_LATITUDE', 41.3)
+# Indeks bazadagi o'zgarishlar bilan qancha vaqtda bir solishtiriladi va qachon butunlay qayta quriladi (soniya)
+INDEX_SYNC_INTERVAL = getattr(settings, 'DISPATCH_INDEX_SYNC_INTERVAL', 5)
+INDEX_REBUILD_INTERVAL = getattr(settings, 'DISPATCH_INDEX_REBUILD_INTERVAL', 10 * 60)
+# Kech commit qilingan o'zgarishlar tushib qolmasligi uchun oxirgi sinxronlash vaqtidan shuncha oldin olinadi
+SYNC_OVERLAP = timedelta(seconds=5)
+DISPATCH_CHUNK_SIZE = 1000
+
+
+def location_coordinates(location_data):
+    """Order.location_data dan (lat, lng). Eski buyurtmalarda faqat matnli latitude/longitude bo'ladi."""
+    if not isinstance(location_data, dict):
+        return None
+    lat, lng = location_data.get('lat'), location_data.get('lng')
+    if lat is None or lng is None:
+        lat = parse_coordinate(location_data.get('latitude'), 90)
+        lng = parse_coordinate(location_data.get('longitude'), 180)
+    if lat is None or lng is None:
+        return None
+    return lat, lng
+
+
+class CourierGrid:
+    """
+    Kuryerlar joylashuvi uchun xotiradagi to'r (grid) indeks. Koordinatalar REFERENCE_LATITUDE atrofida
+    tekislikka (km) proyeksiyalanadi, shahar miqyosida xatolik sezilarli emas.
+    Eng yaqin kuryerlar so'ralgan nuqtaning katakchasidan boshlab halqa-halqa kengayib qidiriladi.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE, reference_latitude=REFERENCE_LATITUDE):
+        self.cell_size = cell_size
+        self.kx = KM_PER_DEGREE * math.cos(math.radians(reference_latitude))
+        self.ky = KM_PER_DEGREE
+        self.cells = defaultdict(dict)  # (cx, cy) -> {key: (x, y)}
+        self.points = {}  # key -> ((cx, cy), x, y)
+        self.bounds = None  # band katakchalar chegarasi: (min_cx, min_cy, max_cx, max_cy)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, key):
+        return key in self.points
+
+    def copy(self):
+        grid = CourierGrid.__new__(CourierGrid)
+        grid.cell_size, grid.kx, grid.ky, grid.bounds = self.cell_size, self.kx, self.ky, self.bounds
+        grid.cells = defaultdict(dict, {cell: dict(bucket) for cell, bucket in self.cells.items()})
+        grid.points = dict(self.points)
+        return grid
+
+    def _project(self, lat, lng):
+        x, y = lng * self.kx, lat * self.ky
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size)), x, y
+
+    def update(self, key, lat, lng):
+        cell, x, y = self._project(lat, lng)
+        previous = self.points.get(key)
+        if previous is not None and previous[0] != cell:
+            self._discard(key, previous[0])
+        self.cells[cell][key] = (x, y)
+        self.points[key] = (cell, x, y)
+        cx, cy = cell
+        if self.bounds is None:
+            self.bounds = (cx, cy, cx, cy)
+        else:
+            min_cx, min_cy, max_cx, max_cy = self.bounds
+            self.bounds = (min(min_cx, cx), min(min_cy, cy), max(max_cx, cx), max(max_cy, cy))
+
+    def remove(self, key):
+        previous = self.points.pop(key, None)
+        if previous is not None:
+            self._discard(key, previous[0])
+
+    def _discard(self, key, cell):
+        bucket = self.cells[cell]
+        bucket.pop(key, None)
+        if not bucket:
+            del self.cells[cell]
+
+    def _ring(self, cx, cy, radius):
+        if radius == 0:
+            yield cx, cy
+            return
+        for dx in range(-radius, radius + 1):
+            yield cx + dx, cy - radius
+            yield cx + dx, cy + radius
+        for dy in range(-radius + 1, radius):
+            yield cx - radius, cy + dy
+            yield cx + radius, cy + dy
+
+    def nearest(self, lat, lng, n=1, max_distance=None):
+        """Eng yaqin n ta kuryer: [(key, masofa_km), ...] yaqinidan boshlab."""
+        if not self.points or n <= 0:
+            return []
+        (cx, cy), x, y = self._project(lat, lng)
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        max_radius = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+        if max_distance is not None:
+            max_radius = min(max_radius, math.ceil(max_distance / self.cell_size))
+        best = []  # (-masofa^2, key) max-heap, eng uzog'i tepada
+        cells = self.cells
+        radius = 0
+        while radius <= max_radius:
+            for cell in self._ring(cx, cy, radius):
+                bucket = cells.get(cell)
+                if not bucket:
+                    continue
+                for key, (px, py) in bucket.items():
+                    distance = (px - x) ** 2 + (py - y) ** 2
+                    if len(best) < n:
+                        heapq.heappush(best, (-distance, key))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, key))
+            # Keyingi halqadagi har qanday nuqta kamida radius * cell_size km uzoqlikda
+            if len(best) == n and -best[0][0] <= (radius * self.cell_size) ** 2:
+                break
+            radius += 1
+        result = sorted((math.sqrt(-distance), key) for distance, key in best)
+        if max_distance is not None:
+            result = [item for item in result if item[0] <= max_distance]
+        return [(key, distance) for distance, key in result]
+
+
+class CourierIndex:
+    """
+    Jarayon ichidagi bo'sh kuryerlar indeksi. Bazadan faqat oxirgi sinxronlashdan keyin o'zgargan kuryerlar
+    (modified_date bo'yicha) o'qiladi, INDEX_REBUILD_INTERVAL da bir marta esa butunlay qayta quriladi.
+    """
+
+    def __init__(self):
+        self.grid = CourierGrid()
+        self.capacities = {}
+        self.synced_to = None
+        self.checked_at = 0.0
+        self.rebuilt_at = 0.0
+        self.lock = threading.Lock()
+
+    def apply(self, courier_id, latitude, longitude, is_available, capacity):
+        with self.lock:
+            self._apply(courier_id, latitude, longitude, is_available, capacity)
+
+    def _apply(self, courier_id, latitude, longitude, is_available, capacity):
+        if is_available and latitude is not None and longitude is not None and capacity:
+            self.grid.update(courier_id, latitude, longitude)
+            self.capacities[courier_id] = capacity
+        else:
+            self.grid.remove(courier_id)
+            self.capacities.pop(courier_id, None)
+
+    def discard(self, courier_id):
+        with self.lock:
+            self._apply(courier_id, None, None, False, 0)
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.checked_at < INDEX_SYNC_INTERVAL:
+            return
+        with self.lock:
+            rebuild = force or self.synced_to is None or now - self.rebuilt_at >= INDEX_REBUILD_INTERVAL
+            couriers = Courier.objects.all()
+            if rebuild:
+                self.grid, self.capacities = CourierGrid(), {}
+                self.rebuilt_at = now
+            else:
+                couriers = couriers.filter(modified_date__gte=self.synced_to - SYNC_OVERLAP)
+            rows = couriers.values_list('id', 'latitude', 'longitude', 'is_available', 'capacity', 'modified_date')
+            for courier_id, latitude, longitude, is_available, capacity, modified_date in rows.iterator():
+                self._apply(courier_id, latitude, longitude, is_available, capacity)
+                if self.synced_to is None or modified_date > self.synced_to:
+                    self.synced_to = modified_date
+            if not rebuild and self.capacities:
+                # O'chirilgan kuryer qatori qolmaydi, modified_date bo'yicha ko'rinmaydi: indeksdagilar borligi
+                # tekshiriladi (boshqa jarayonda yoki queryset.delete() bilan o'chirilganlar uchun)
+                existing = set(Courier.objects.filter(id__in=list(self.capacities)).values_list('id', flat=True))
+                for courier_id in set(self.capacities) - existing:
+                    self._apply(courier_id, None, None, False, 0)
+            self.checked_at = now
+
+    def nearest(self, lat, lng, n=5, max_distance=None):
+        self.sync()
+        with self.lock:
+            return self.grid.nearest(lat, lng, n, max_distance)
+
+    def snapshot(self):
+        self.sync()
+        with self.lock:
+            return self.grid.copy(), dict(self.capacities)
+
+
+courier_index = CourierIndex()
+
+
+def courier_post_save(sender, instance, **kwargs):
+    # Indeks tranzaksiya commit bo'lgach yangilanadi: bekor qilingan o'zgarish indeksga tushmasligi kerak
+    values = (instance.id, instance.latitude, instance.longitude, instance.is_available, instance.capacity)
+    transaction.on_commit(lambda: courier_index.apply(*values))
+
+
+def courier_post_delete(sender, instance, **kwargs):
+    courier_id = instance.id
+    transaction.on_commit(lambda: courier_index.discard(courier_id))
+
+
+post_save.connect(courier_post_save, sender=Courier)
+post_delete.connect(courier_post_delete, sender=Courier)
+
+
+def update_courier_position(courier, latitude, longitude):
+    """Kuryer joylashuvini yozadi. Courier.save() ishlatilmaydi: u har safar foydalanuvchi guruhlarini qayta yozadi."""
+    now = timezone.now()
+    Courier.objects.filter(pk=courier.pk).update(latitude=latitude, longitude=longitude, position_date=now,
+                                                 modified_date=now)
+    courier.latitude, courier.longitude, courier.position_date, courier.modified_date = latitude, longitude, now, now
+    values = (courier.id, latitude, longitude, courier.is_available, courier.capacity)
+    transaction.on_commit(lambda: courier_index.apply(*values))
+
+
+def nearest_couriers(order, n=5, max_distance=None):
+    """Buyurtma manziliga eng yaqin n ta bo'sh kuryer: [(courier_id, masofa_km), ...]."""
+    coordinates = location_coordinates(order.location_data)
+    if coordinates is None:
+        return []
+    return courier_index.nearest(*coordinates, n=n, max_distance=max_distance)
+
+
+def active_loads():
+    return dict(Order.objects.filter(status='out_for_delivery', courier__isnull=False)
+                .values_list('courier').annotate(count=Count('id')).values_list('courier', 'count'))
+
+
+def plan_dispatch(orders, grid, capacities, loads):
+    """
+    Bazaga murojaat qilmaydi. orders - [(order_id, lat, lng)], navbat tartibida.
+    Har bir buyurtma bo'sh joyi bor eng yaqin kuryerga beriladi, to'lgan kuryer grid dan olib tashlanadi
+    (grid va loads o'zgaradi). {order_id: courier_id} qaytaradi.
+    """
+    assignments = {}
+    for order_id, lat, lng in orders:
+        if not len(grid):
+            break
+        found = grid.nearest(lat, lng, 1)
+        if not found:
+            continue
+        courier_id = found[0][0]
+        loads[courier_id] = loads.get(courier_id, 0) + 1
+        if loads[courier_id] >= capacities.get(courier_id, 0):
+            grid.remove(courier_id)
+        assignments[order_id] = courier_id
+    return assignments
+
+
+def auto_dispatch(orders=None, chunk_size=DISPATCH_CHUNK_SIZE):
+    """
+    Kuryeri yo'q "tayyorlanmoqda" holatidagi buyurtmalarni eng yaqin bo'sh kuryerlarga biriktiradi.
+    Buyurtmalar bo'laklab qulflanadi (skip_locked), parallel ishga tushgan dispatch ularni o'tkazib yuboradi.
+    Biriktirilgan buyurtmalar sonini qaytaradi.
+    """
+    grid, capacities = courier_index.snapshot()
+    loads = active_loads()
+    for courier_id, load in loads.items():
+        if courier_id in grid and load >= capacities.get(courier_id, 0):
+            grid.remove(courier_id)
+
+    pending = Order.objects.filter(status='preparing', courier__isnull=True)
+    if orders is not None:
+        pending = pending.filter(pk__in=orders.values('pk'))
+    assigned = 0
+    last_id = 0
+    while len(grid):
+        with transaction.atomic():
+            chunk = list(pending.filter(id__gt=last_id).order_by('id').select_for_update(skip_locked=True)
+                         .only('id', 'location_data')[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            points = [(order.id, *coordinates) for order in chunk
+                      if (coordinates := location_coordinates(order.location_data)) is not None]
+            plan = plan_dispatch(points, grid, capacities, loads)
+            now = timezone.now()
+            changed = []
+            for order in chunk:
+                if order.id in plan:
+                    order.courier_id = plan[order.id]
+                    order.assigned_date = now
+                    order.status = 'out_for_delivery'
+                    order.modified_date = now
+                    changed.append(order)
+            Order.objects.bulk_update(changed, ['courier', 'assigned_date', 'status', 'modified_date'])
+            assigned += len(changed)
+    return assigned
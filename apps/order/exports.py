@@ -0,0 +1,32 @@
+from config.exports import EXPORT_CHUNK_SIZE, export_response
+
+# (ustun nomi, values_list maydoni). lines__ maydonlari LEFT JOIN bilan olinadi, har bir buyurtma qatori alohida satr
+ORDER_EXPORT_FIELDS = (
+    ('order_id', 'id'),
+    ('created_date', 'created_date'),
+    ('customer', 'user__name'),
+    ('phone', 'user__phone'),
+    ('status', 'status'),
+    ('courier', 'courier__user__name'),
+    ('promo', 'promo'),
+    ('subtotal', 'subtotal'),
+    ('discount', 'discount'),
+    ('total', 'total'),
+    ('product_id', 'lines__product'),
+    ('product_name', 'lines__product_name'),
+    ('quantity', 'lines__quantity'),
+    ('unit_price', 'lines__unit_price'),
+    ('line_discount', 'lines__discount'),
+    ('line_total', 'lines__line_total'),
+)
+
+
+def order_rows(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    """Bitta so'rov, natija server tomonidagi kursor orqali chunk_size tadan o'qiladi."""
+    return orders.order_by('id', 'lines__id').values_list(
+        *(field for _, field in ORDER_EXPORT_FIELDS)).iterator(chunk_size=chunk_size)
+
+
+def orders_export_response(orders, output='csv', filename='orders'):
+    return export_response(output, [name for name, _ in ORDER_EXPORT_FIELDS], order_rows(orders), filename,
+                           sheet_name='Orders')
@@ -0,0 +1,13 @@
+import django_filters
+
+from .models import Order
+
+
+class OrderExportFilter(django_filters.FilterSet):
+    """Yetkazish to'lqini bo'yicha buyurtmalar: sana oralig'i, holati va kuryeri."""
+    date_from = django_filters.DateFilter(field_name='created_date', lookup_expr='date__gte')
+    date_to = django_filters.DateFilter(field_name='created_date', lookup_expr='date__lte')
+
+    class Meta:
+        model = Order
+        fields = ['status', 'courier']
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+# Shu vaqtdan ko'p "bajarilmoqda" holatida qolgan kalit tashlab ketilgan hisoblanadi (jarayon to'xtab qolgan).
+# Eng sekin so'rovdan ancha uzun bo'lishi kerak, aks holda bajarilayotgan so'rov ikkinchi marta ishga tushadi
+IDEMPOTENCY_LEASE = getattr(settings, 'IDEMPOTENCY_LEASE', 10 * 60)
+# Parallel takroriy so'rov birinchisini shuncha kutadi, keyin 409 qaytaradi
+IDEMPOTENCY_WAIT_TIMEOUT = getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 30)
+POLL_INTERVAL = 0.1
+
+
+def request_fingerprint(request):
+    # Multipart chegarasi har safar boshqacha bo'lishi mumkin, shuning uchun xom body emas, ajratilgan maydonlar olinadi
+    data = request.data
+    fields = sorted((key, [str(value) for value in data.getlist(key)]) for key in data) \
+        if hasattr(data, 'getlist') else data
+    files = sorted((key, [(f.name, f.size) for f in request.FILES.getlist(key)]) for key in request.FILES)
+    payload = json.dumps([request.method, request.path, fields, files], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """Kalitni egallaydi. Yangi yaratilgan bo'lsa (record, True), aks holda mavjud yozuv bilan False qaytaradi."""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint,
+                expire_date=now + timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+            ), True
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        return _claim(user, key, fingerprint)
+    abandoned = (record.response_status is None
+                 and record.created_date < now - timedelta(seconds=IDEMPOTENCY_LEASE))
+    if record.expire_date <= now or abandoned:
+        IdempotencyKey.objects.filter(pk=record.pk, created_date=record.created_date).delete()
+        return _claim(user, key, fingerprint)
+    return record, False
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.response_body), status=record.response_status,
+                            content_type=record.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(method):
+    """
+    View metodini Idempotency-Key sarlavhasi bo'yicha bir martalik qiladi.
+    Bajarilgan so'rov javobi IDEMPOTENCY_KEY_TTL davomida saqlanadi va takroriy so'rovga baytma-bayt qaytariladi.
+    Parallel takroriy so'rov birinchisi tugashini kutadi. Kalit egallanishi va javob saqlanishi alohida qisqa
+    tranzaksiyalarda, view esa ulardan tashqarida bajariladi: reserve() kabi tranzaksiyadan tashqarida ishlashi
+    kerak bo'lgan kod uchun, va kalit qatori uzoq qulflanib qolmasligi uchun.
+    """
+
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'detail': f"{IDEMPOTENCY_HEADER} juda uzun."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            record, created = _claim(request.user, key, fingerprint)
+            if created:
+                break
+            if record.fingerprint != fingerprint:
+                return Response({'detail': f"Bu {IDEMPOTENCY_HEADER} boshqa so'rov uchun ishlatilgan."},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record.response_status is not None:
+                return _replay(record)
+            if time.monotonic() >= deadline:
+                return Response({'detail': "Shu kalit bilan so'rov hali bajarilmoqda."},
+                                status=status.HTTP_409_CONFLICT)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = method(self, request, *args, **kwargs)
+            if isinstance(response, Response):
+                response.accepted_renderer = request.accepted_renderer
+                response.accepted_media_type = request.accepted_media_type
+                response.renderer_context = self.get_renderer_context()
+                response.render()
+            if response.status_code < 500:
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    response_status=response.status_code,
+                    response_body=response.content,
+                    content_type=response.get('Content-Type', ''),
+                )
+                return response
+        except BaseException:
+            # Xato bo'lsa kalit bo'shatiladi, mijoz so'rovni qayta yuborishi mumkin
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.order.models import TOTAL_FIELDS, Order, calculate_totals, promo_discounts
+
+
+class Command(BaseCommand):
+    help = ("Mavjud buyurtmalar uchun subtotal, discount, promo_discount va total ustunlarini hisoblaydi. "
+            "0015 migratsiyasidan keyin bir marta ishga tushirilishi shart: ungacha eski buyurtmalar summasi 0 "
+            "ko'rinadi, oddiy save esa ularni tuzatmaydi")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        total = 0
+        while True:
+            orders = list(Order.objects.filter(id__gt=last_id).order_by('id')
+                          .only('id', 'items_data', 'promo').prefetch_related('items__product')[:chunk_size])
+            if not orders:
+                break
+            discounts = promo_discounts(order.promo for order in orders)
+            for order in orders:
+                items_data = order.items_data
+                if not items_data:
+                    # Eski buyurtmalarda items_data bo'lmasa, savatcha qatorlaridan olinadi
+                    items_data = [{'price': str(item.get_amount)} for item in order.items.all() if item.product]
+                order.promo_discount = discounts.get(order.promo, 0)
+                order.subtotal, order.discount, order.total = calculate_totals(items_data, order.promo_discount)
+            with transaction.atomic():
+                Order.objects.bulk_update(orders, TOTAL_FIELDS)
+            last_id = orders[-1].id
+            total += len(orders)
+            self.stdout.write(f'{total} ta buyurtma hisoblandi')
+        self.stdout.write(self.style.SUCCESS(f'Tayyor: {total} ta buyurtma'))
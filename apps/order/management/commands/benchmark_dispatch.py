@@ -0,0 +1,73 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.order.dispatch import CourierGrid, plan_dispatch
+from apps.order.routing import build_waves
+
+# Toshkent atrofidagi hudud
+CENTER = (41.31, 69.28)
+SPREAD = (0.15, 0.2)
+
+
+class Command(BaseCommand):
+    help = "Kuryerlar indeksi va avtomatik biriktirishni xotiradagi sun'iy ma'lumot bilan o'lchaydi (bazaga yozmaydi)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--couriers', type=int, default=10_000)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--capacity', type=int, default=10)
+        parser.add_argument('--queries', type=int, default=10_000)
+        parser.add_argument('--nearest', type=int, default=5)
+        parser.add_argument('--wave-orders', type=int, default=5_000)
+        parser.add_argument('--wave-couriers', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+
+        def point():
+            return CENTER[0] + rng.uniform(-1, 1) * SPREAD[0], CENTER[1] + rng.uniform(-1, 1) * SPREAD[1]
+
+        started = time.perf_counter()
+        grid = CourierGrid()
+        for courier_id in range(1, options['couriers'] + 1):
+            grid.update(courier_id, *point())
+        self.stdout.write(f"{len(grid)} ta kuryer indeksga {(time.perf_counter() - started) * 1000:.1f}ms da qo'shildi")
+
+        timings = []
+        for _ in range(options['queries']):
+            lat, lng = point()
+            started = time.perf_counter()
+            grid.nearest(lat, lng, options['nearest'])
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f"nearest({options['nearest']}): p50={statistics.median(timings):.0f}us "
+                          f"p95={p95:.0f}us max={timings[-1]:.0f}us")
+
+        # Kuryerlar joylashuvi yangilanganda indeks qayta qurilmaydi, faqat katakchasi almashadi
+        started = time.perf_counter()
+        for courier_id in range(1, options['couriers'] + 1):
+            grid.update(courier_id, *point())
+        moved = time.perf_counter() - started
+        self.stdout.write(f"{options['couriers']} ta joylashuv yangilanishi: {moved * 1000:.1f}ms")
+
+        orders = [(order_id, *point()) for order_id in range(1, options['orders'] + 1)]
+        capacities = dict.fromkeys(range(1, options['couriers'] + 1), options['capacity'])
+        started = time.perf_counter()
+        plan = plan_dispatch(orders, grid.copy(), capacities, {})
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(orders)} ta buyurtmadan {len(plan)} tasi {elapsed:.2f}s da biriktirildi "
+            f"({len(plan) / elapsed:,.0f} buyurtma/s, {elapsed / max(len(plan), 1) * 1_000_000:.0f}us/buyurtma)"))
+
+        orders = [point() for _ in range(options['wave_orders'])]
+        couriers = {courier_id: (*point(), options['capacity']) for courier_id in range(1, options['wave_couriers'] + 1)}
+        started = time.perf_counter()
+        waves = build_waves(orders, couriers)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(orders)} ta buyurtma {len(waves)} ta kuryerga guruhlab marshrut bilan {elapsed:.2f}s da taqsimlandi "
+            f"({sum(map(len, waves.values()))} tasi biriktirildi)"))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.account.models import User
+from apps.order.models import Promo
+from apps.order.promos import CHUNK_SIZE, expire_promos, generate_promos, stream_promos_csv
+
+
+class Command(BaseCommand):
+    help = "Kampaniya uchun ko'p sonli bir martalik promo kodlarni yaratadi va CSV qilib chiqaradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, nargs='?')
+        parser.add_argument('--discount', type=int)
+        parser.add_argument('--min-price', default='100')
+        parser.add_argument('--expire-date', help="YYYY-MM-DD")
+        parser.add_argument('--batch', help="Kampaniya nomi (yangi bo'lishi kerak)")
+        parser.add_argument('--user', help="Promolar egasining telefon raqami (default: birinchi superuser)")
+        parser.add_argument('--output', help="CSV fayl (default: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--expire-batch', help="Shu kampaniyaning barcha kodlarini muddati o'tgan qilish")
+
+    def handle(self, *args, **options):
+        if options['expire_batch']:
+            expired = expire_promos(Promo.objects.filter(batch=options['expire_batch']))
+            self.stderr.write(self.style.SUCCESS(f"{expired} ta promo muddati o'tgan deb belgilandi"))
+            return
+
+        count, discount = options['count'], options['discount']
+        if not count or count <= 0 or not discount or not 0 < discount <= 100:
+            raise CommandError("count va 1 dan 100 gacha bo'lgan --discount berilishi kerak")
+        batch = options['batch'] or timezone.now().strftime('%Y%m%d%H%M%S')
+        if Promo.objects.filter(batch=batch).exists():
+            raise CommandError(f"{batch} kampaniyasi allaqachon mavjud")
+        if options['user']:
+            user = User.objects.filter(phone=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError("Promolar egasi topilmadi")
+
+        chunks = generate_promos(count, batch, chunk_size=options['chunk_size'], user=user, discount=discount,
+                                 min_price=options['min_price'], expire_date=options['expire_date'])
+        rows = stream_promos_csv(self.report(chunks, count))
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(rows)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending='')
+        self.stderr.write(self.style.SUCCESS(f'Tayyor: {count} ta promo, kampaniya {batch}'))
+
+    def report(self, chunks, count):
+        created = 0
+        for chunk in chunks:
+            created += len(chunk)
+            self.stderr.write(f'{created}/{count} ta promo yaratildi')
+            yield chunk
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from apps.order.reports import ROLLUP_CHUNK_DAYS, rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = ("Kunlik savdo yig'indilarini (mahsulot, kategoriya, kuryer, promo) buyurtmalardan to'liq qayta hisoblaydi. "
+            "Oraliq berilmasa birinchi buyurtmadan oxirgisigacha")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date.fromisoformat)
+        parser.add_argument('--date-to', type=date.fromisoformat)
+        parser.add_argument('--chunk-days', type=int, default=ROLLUP_CHUNK_DAYS)
+
+    def handle(self, *args, **options):
+        total = 0
+        for first, last, rows in rebuild_sales_rollups(options['date_from'], options['date_to'], options['chunk_days']):
+            total += rows
+            self.stdout.write(f'{first} - {last}: {rows} ta qator')
+        self.stdout.write(self.style.SUCCESS(f"Tayyor: {total} ta qator"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Mavjud buyurtmalarda yangi ustunlar 0 bo'lib qoladi va oddiy save ularni qayta hisoblamaydi
+# (summalar faqat items_data yoki promo o'zgarganda hisoblanadi). Migratsiyadan keyin bir marta
+# `python manage.py backfill_order_totals` ishga tushirilishi shart.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0014_carta'),
+        ('order', '0014_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='promo_discount',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total'], name='order_total_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0015_order_totals'),
+        ('product', '0019_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_item_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('product_name', models.CharField(max_length=100)),
+                ('product_image', models.CharField(blank=True, max_length=255)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount', models.PositiveSmallIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField()),
+                ('line_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_date', models.DateTimeField(db_index=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='order.order')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_lines', to='product.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_date'], name='orderline_product_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations
+
+CHUNK_SIZE = 1000
+CENTS = Decimal('0.01')
+
+
+def to_decimal(value):
+    try:
+        return Decimal(str(value or 0)).quantize(CENTS)
+    except InvalidOperation:
+        return Decimal(0)
+
+
+def backfill_order_lines(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    OrderLine = apps.get_model('order', 'OrderLine')
+    Product = apps.get_model('product', 'Product')
+
+    last_id = 0
+    while True:
+        orders = list(Order.objects.filter(id__gt=last_id, lines__isnull=True).order_by('id')
+                      .prefetch_related('items__product')[:CHUNK_SIZE])
+        if not orders:
+            break
+        product_ids = {item.get('product_id') for order in orders for item in (order.items_data or [])
+                       if isinstance(item, dict)}
+        existing = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+
+        lines = []
+        for order in orders:
+            if isinstance(order.items_data, list) and order.items_data:
+                for item in order.items_data:
+                    quantity = int(item.get('quantity') or 0)
+                    line_total = to_decimal(item.get('price'))
+                    # items_data da faqat chegirmadan keyingi umumiy narx bor, birlik narxi shundan olinadi
+                    lines.append(OrderLine(
+                        order=order, product_id=item.get('product_id') if item.get('product_id') in existing else None,
+                        cart_item_id=item.get('id'), product_name=(item.get('product_name') or '')[:100],
+                        product_image=(item.get('product_image') or '')[:255],
+                        unit_price=(line_total / quantity).quantize(CENTS) if quantity else line_total,
+                        discount=0, quantity=quantity, line_total=line_total, created_date=order.created_date,
+                    ))
+            else:
+                for item in order.items.all():
+                    if item.product is None:
+                        continue
+                    unit_price = to_decimal(item.product.price)
+                    discount = item.product.discount or 0
+                    lines.append(OrderLine(
+                        order=order, product=item.product, cart_item_id=item.id, product_name=item.product.name,
+                        unit_price=unit_price, discount=discount, quantity=item.quantity,
+                        line_total=(unit_price * (100 - discount) / 100 * item.quantity).quantize(CENTS),
+                        created_date=order.created_date,
+                    ))
+        OrderLine.objects.bulk_create(lines)
+        last_id = orders[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0016_order_line'),
+        ('product', '0019_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_lines, migrations.RunPython.noop),
+    ]
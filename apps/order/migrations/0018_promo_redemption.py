@@ -0,0 +1,67 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+BATCH_SIZE = 1000
+
+
+def merge_promos(apps, schema_editor):
+    """
+    Promo.members dagi yozuvlar PromoRedemption ga ko'chiriladi. Bir xil nomli promolardan eng oxirgisi qoldiriladi
+    (buyurtma summasi ham shundan hisoblangan), qolganlarining ishlatilishlari unga o'tkazilib, o'zlari o'chiriladi.
+    """
+    Promo = apps.get_model('order', 'Promo')
+    PromoRedemption = apps.get_model('order', 'PromoRedemption')
+    Members = Promo.members.through
+
+    keepers = dict(Promo.objects.values('name').annotate(last_id=Max('id')).values_list('name', 'last_id'))
+    keeper_of = {promo_id: keepers[name] for promo_id, name in Promo.objects.values_list('id', 'name')}
+
+    batch = []
+    for promo_id, user_id in Members.objects.values_list('promo_id', 'user_id').iterator(chunk_size=BATCH_SIZE):
+        batch.append(PromoRedemption(promo_id=keeper_of[promo_id], user_id=user_id))
+        if len(batch) >= BATCH_SIZE:
+            PromoRedemption.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    PromoRedemption.objects.bulk_create(batch, ignore_conflicts=True)
+
+    Promo.objects.exclude(id__in=keepers.values()).delete()
+
+
+def restore_members(apps, schema_editor):
+    Promo = apps.get_model('order', 'Promo')
+    PromoRedemption = apps.get_model('order', 'PromoRedemption')
+    Members = Promo.members.through
+    Members.objects.bulk_create(
+        [Members(promo_id=promo_id, user_id=user_id)
+         for promo_id, user_id in PromoRedemption.objects.values_list('promo_id', 'user_id').iterator()],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0017_backfill_order_lines'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='promo_redemptions', to='order.order')),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='order.promo')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_redemptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('promo', 'user'), name='unique_promo_redemption')],
+            },
+        ),
+        migrations.RunPython(merge_promos, restore_members),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0018_promo_redemption'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='promo',
+            name='members',
+        ),
+        migrations.AlterField(
+            model_name='promo',
+            name='name',
+            field=models.CharField(max_length=8, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0019_promo_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promo',
+            name='batch',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+    ]
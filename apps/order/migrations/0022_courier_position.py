@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0021_promo_expiry_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courier',
+            name='capacity',
+            field=models.PositiveSmallIntegerField(default=10),
+        ),
+        migrations.AddField(
+            model_name='courier',
+            name='is_available',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='courier',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='courier',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='courier',
+            name='modified_date',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='courier',
+            name='position_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0022_courier_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='route_position',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
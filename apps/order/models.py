@@ -1,31 +1,90 @@
+from decimal import Decimal, ROUND_HALF_UP
 from email.policy import default
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models.signals import pre_save
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q, Sum
+from django.db.models.signals import pre_save, post_delete, post_save
 from apps.account.models import User, UserLocation
-from apps.product.models import Product
+from apps.product.models import Category, Product
+from apps.product.reservations import reserve
 from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
 from django.contrib.auth.models import Group
 from django.utils import timezone
-from django.http import HttpResponse
-from apps.order.utils import generate_receipt_pdf  # PDF yaratish funksiyasi
+from apps.order.receipts import schedule_receipt
+
+
+PROMO_CACHE_TIMEOUT = getattr(settings, 'PROMO_CACHE_TIMEOUT', 60)
+
+
+class PromoQuerySet(models.QuerySet):
+    # Muddat o'qish paytida expire_date dan hisoblanadi, is_expired ni kutish shart emas
+    def active(self, today=None):
+        today = today or timezone.localdate()
+        return self.filter(Q(expire_date__isnull=True) | Q(expire_date__gte=today), is_expired=False)
+
+    def expired(self, today=None):
+        today = today or timezone.localdate()
+        return self.filter(Q(is_expired=True) | Q(expire_date__lt=today))
 
 
 class Promo(models.Model):
-    name = models.CharField(max_length=8)
+    name = models.CharField(max_length=8, unique=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='promos')
     description = models.TextField(null=True, blank=True)
     discount = models.PositiveIntegerField(validators=[MaxValueValidator(100)])
     min_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(100.00)])
-    members = models.ManyToManyField(User, blank=True)
     expire_date = models.DateField(null=True, blank=True)
     is_expired = models.BooleanField(default=False)
+    # Bir martada ommaviy yaratilgan kodlar kampaniyasi
+    batch = models.CharField(max_length=32, blank=True, default='', db_index=True)
     created_date = models.DateTimeField(auto_now_add=True)
 
+    objects = PromoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Faqat hali belgilanmagan promolar: faol promolarni va yangi muddati o'tganlarni topish uchun
+            models.Index(fields=['expire_date'], name='promo_active_expire_idx', condition=Q(is_expired=False)),
+        ]
+
     def __str__(self):
         return self.name
 
+    @property
+    def is_active(self):
+        # PromoQuerySet.active() bilan bir xil shart
+        return not self.is_expired and (self.expire_date is None or self.expire_date >= timezone.localdate())
+
+    @staticmethod
+    def cache_key(name):
+        return f'promo:{name}'
+
+    @classmethod
+    def get_cached(cls, name):
+        """Nomi bo'yicha promo yoki None. Natija (topilmagani ham) PROMO_CACHE_TIMEOUT soniya keshlanadi."""
+        if not name or len(name) > cls._meta.get_field('name').max_length:
+            return None
+        promo = cache.get(cls.cache_key(name))
+        if promo is None:
+            promo = cls.objects.filter(name=name).first() or False
+            cache.set(cls.cache_key(name), promo, PROMO_CACHE_TIMEOUT)
+        return promo or None
+
+    def redeem(self, user, order=None):
+        """
+        Promoni foydalanuvchi uchun ishlatilgan deb yozadi. "Allaqachon ishlatilgan" holatini (promo, user)
+        unikalligi orqali baza bitta INSERT da tekshiradi. Ishlatib bo'lingan bo'lsa False qaytaradi.
+        """
+        try:
+            with transaction.atomic():
+                PromoRedemption.objects.create(promo=self, user=user, order=order)
+        except IntegrityError:
+            return False
+        return True
+
 
 class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='cart_items')
@@ -33,6 +92,11 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     created_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='cartitem_user_id_idx'),
+        ]
+
     def __str__(self):
         return self.product.name if self.product else "order_items"
 
@@ -40,6 +104,24 @@ class CartItem(models.Model):
     def get_amount(self):
         return (float(self.product.price) * ((100 - (self.product.discount or 0)) / 100)) * self.quantity
 
+    @staticmethod
+    def cart_quantity(user_id, product_id, exclude_id=None):
+        # Buyurtmaga kiritilmagan savatcha qatorlari bo'yicha mahsulotning umumiy miqdori
+        items = CartItem.objects.filter(user_id=user_id, product_id=product_id, order__isnull=True)
+        if exclude_id is not None:
+            items = items.exclude(pk=exclude_id)
+        return items.aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def cartitem_post_delete(sender, instance, **kwargs):
+    # Savatchadan o'chirilgan miqdor bo'yicha bron kamaytiriladi
+    if instance.user_id and instance.product_id:
+        user_id, product_id = instance.user_id, instance.product_id
+        transaction.on_commit(lambda: reserve(user_id, product_id, CartItem.cart_quantity(user_id, product_id)))
+
+
+post_delete.connect(cartitem_post_delete, sender=CartItem)
+
 
 from django.core.exceptions import ValidationError
 import mimetypes
@@ -74,6 +156,13 @@ class Courier(models.Model):
 
     # Group tanlanadigan qilib ManyToOne (ya'ni ForeignKey)
     group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True)
+    # Kuryerning joriy joylashuvi (ilovadan yuboriladi) va avtomatik biriktirish uchun holati
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    position_date = models.DateTimeField(null=True, blank=True)
+    is_available = models.BooleanField(default=True)
+    capacity = models.PositiveSmallIntegerField(default=10)  # Bir vaqtda yetkazadigan buyurtmalari soni
+    modified_date = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.user}  --->  {self.phone}"
@@ -94,6 +183,24 @@ class Courier(models.Model):
                 self.user.groups.add(self.group)
 
 
+CENTS = Decimal('0.01')
+TOTAL_FIELDS = ('subtotal', 'discount', 'promo_discount', 'total')
+
+
+def calculate_totals(items_data, promo_discount=0):
+    """items_data narxlari va promo foizidan (subtotal, discount, total) ni Decimal ko'rinishida hisoblaydi."""
+    subtotal = Decimal(0)
+    if items_data and isinstance(items_data, list):
+        subtotal = sum((Decimal(str(item.get('price') or 0)) for item in items_data), Decimal(0))
+    subtotal = subtotal.quantize(CENTS, ROUND_HALF_UP)
+    discount = (subtotal * Decimal(promo_discount or 0) / 100).quantize(CENTS, ROUND_HALF_UP)
+    return subtotal, discount, subtotal - discount
+
+
+def promo_discounts(names):
+    return dict(Promo.objects.filter(name__in=set(filter(None, names))).values_list('name', 'discount'))
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('preparing', 'Tayyorlanmoqda'),
@@ -111,51 +218,45 @@ class Order(models.Model):
     promo = models.CharField(max_length=8, null=True, blank=True)
     courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='preparing')
+    route_position = models.PositiveSmallIntegerField(null=True, blank=True)  # Kuryer marshrutidagi tartib raqami
     payment_confirmed = models.BooleanField(default=None, null=True, blank=True,)  # Yangi maydon
     assigned_date = models.DateTimeField(null=True, blank=True)
     delivered_date = models.DateTimeField(null=True, blank=True)
-    modified_date = models.DateTimeField(auto_now_add=True)
+    modified_date = models.DateTimeField(auto_now=True)
     created_date = models.DateTimeField(auto_now_add=True)
+    # Buyurtma yaratilgan/o'zgartirilgan paytdagi summalar (items_data va promo dan hisoblanadi)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    discount = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    promo_discount = models.PositiveSmallIntegerField(default=0, editable=False)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_date', 'id'], name='order_created_date_id_idx'),
+            models.Index(fields=['user', '-created_date', 'id'], name='order_user_created_date_idx'),
+            # Faqat total bo'yicha filtrlanadi; subtotal va discount faqat hisobotlarda yig'iladi
+            models.Index(fields=['total'], name='order_total_idx'),
+            # Hisobot yig'indilari faqat oxirgi yangilanishdan keyin o'zgargan buyurtmalardan qayta hisoblanadi
+            models.Index(fields=['modified_date'], name='order_modified_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'items_data' in instance.__dict__ and 'promo' in instance.__dict__:
+            instance._stored_pricing = (instance.items_data, instance.promo)
+        return instance
 
     @property
     def get_amount(self):
-        total = 0.0
-        if self.items_data and isinstance(self.items_data, list):
-            total = sum(float(item.get('price', 0)) for item in self.items_data)
-        elif self.items.exists():
-            total = sum(item.get_amount for item in self.items.all())
-
-        if self.promo:
-            try:
-                promo_object = Promo.objects.get(name=self.promo)
-                return float(total * ((100 - promo_object.discount or 0) / 100))
-            except Promo.DoesNotExist:
-                return round(total, 2)
-        return round(total, 2)
-
-    def generate_pdf_receipt(self):
-        if self.status == 'delivered':
-            order_data = {
-                'user': self.user.name,
-                'order_date': self.created_date.strftime("%Y-%m-%d %H:%M"),
-                'amount': str(self.get_amount),
-                'items': self.items_data or [  # items_data dan foydalanamiz, agar bo'sh bo'lsa items dan olish mumkin
-                    {
-                        'product_id': item.product.id,
-                        'name': item.product.name,
-                        'product_image': item.product.images.first().image.url if item.product.images.exists() else None,
-                        # Birinchi rasm
-                        'quantity': item.quantity,
-                        'price': str(item.get_amount)
-                    } for item in self.items.all()
-                ]
-            }
-            pdf_content = generate_receipt_pdf(order_data)
-            response = HttpResponse(pdf_content, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="order_{self.id}_receipt.pdf"'
-            return response
-        else:
-            return None
+        return float(self.total)
+
+    def set_totals(self, promo_discount=None):
+        if promo_discount is None:
+            promo = Promo.get_cached(self.promo)
+            promo_discount = promo.discount if promo else 0
+        self.promo_discount = promo_discount
+        self.subtotal, self.discount, self.total = calculate_totals(self.items_data, promo_discount)
 
     def save(self, *args, **kwargs):
         if self.location and not self.location_data:
@@ -164,6 +265,8 @@ class Order(models.Model):
                 "location": self.location.location,
                 "latitude": self.location.latitude,
                 "longitude": self.location.longitude,
+                "lat": self.location.lat,
+                "lng": self.location.lng,
                 "floor": self.location.floor,
                 "apartment": self.location.apartment,
                 "modified_date": self.location.modified_date,
@@ -175,4 +278,200 @@ class Order(models.Model):
                 self.status = 'out_for_delivery'
         if self.status == 'delivered' and not self.delivered_date:
             self.delivered_date = timezone.now()
+        # Summalar faqat mahsulotlar yoki promo o'zgarganda qayta hisoblanadi, keyin o'zgarmaydi
+        if getattr(self, '_stored_pricing', None) != (self.items_data, self.promo):
+            self.set_totals()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], *TOTAL_FIELDS}
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'modified_date'}
+        super().save(*args, **kwargs)
+        self._stored_pricing = (self.items_data, self.promo)
+
+
+def order_post_save(sender, instance, **kwargs):
+    # Yetkazilgan buyurtma cheki oldindan tayyorlab qo'yiladi
+    if instance.status == 'delivered':
+        transaction.on_commit(lambda: schedule_receipt(instance))
+
+
+post_save.connect(order_post_save, sender=Order)
+
+
+class OrderLine(models.Model):
+    """
+    Buyurtma qatori: rasmiylashtirish paytidagi mahsulot nomi, narxi va chegirmasi saqlanadi va keyin o'zgarmaydi.
+    Order.items_data shu qatorlardan yig'iladi.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_lines')
+    cart_item_id = models.PositiveIntegerField(null=True, blank=True)
+    product_name = models.CharField(max_length=100)
+    product_image = models.CharField(max_length=255, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount = models.PositiveSmallIntegerField(default=0)
+    quantity = models.PositiveIntegerField()
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+    # Order.created_date nusxasi: mahsulot va sana bo'yicha hisobotlar Order jadvalisiz olinadi
+    created_date = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_date'], name='orderline_product_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_name} x {self.quantity}'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Buyurtma qatorini o'zgartirib bo'lmaydi.")
         super().save(*args, **kwargs)
+
+    @classmethod
+    def from_cart_item(cls, item, image_url=None):
+        # order va created_date buyurtma saqlangandan keyin qo'yiladi
+        product = item.product
+        unit_price = Decimal(product.price).quantize(CENTS)
+        discount = product.discount or 0
+        return cls(
+            product=product, cart_item_id=item.id, product_name=product.name, product_image=image_url or '',
+            unit_price=unit_price, discount=discount, quantity=item.quantity,
+            line_total=(unit_price * (100 - discount) / 100 * item.quantity).quantize(CENTS, ROUND_HALF_UP),
+        )
+
+    def as_item_data(self):
+        # Eski items_data formati bilan mos: narx avvalgidek float satri ('1800.0')
+        return {
+            'id': self.cart_item_id,
+            'product_id': self.product_id,
+            'product_name': self.product_name,
+            'product_image': self.product_image or None,
+            'quantity': self.quantity,
+            'price': str(float(self.line_total)),
+        }
+
+
+class PromoRedemption(models.Model):
+    """Promo kodning ishlatilishi. Bitta foydalanuvchi bitta promoni bir marta ishlatadi."""
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='redemptions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='promo_redemptions')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='promo_redemptions')
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'user'], name='unique_promo_redemption'),
+        ]
+
+    def __str__(self):
+        return f'{self.promo} - {self.user}'
+
+
+def promo_changed(sender, instance, **kwargs):
+    cache.delete(Promo.cache_key(instance.name))
+
+
+post_save.connect(promo_changed, sender=Promo)
+post_delete.connect(promo_changed, sender=Promo)
+
+
+class Watermark(models.Model):
+    """Davriy vazifa qayergacha ishlaganini saqlaydi, keyingi safar faqat shundan keyingi yozuvlar ko'riladi."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+    modified_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def get_value(cls, name):
+        return cls.objects.filter(name=name).values_list('value', flat=True).first()
+
+    @classmethod
+    def set_value(cls, name, value):
+        cls.objects.update_or_create(name=name, defaults={'value': value})
+
+
+class IdempotencyKey(models.Model):
+    """
+    Idempotency-Key sarlavhasi bilan kelgan so'rovning saqlangan javobi.
+    response_status bo'sh bo'lsa, so'rov hali bajarilmoqda.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.BinaryField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    expire_date = models.DateTimeField()
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expire_date'], name='idempotency_key_expire_idx'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class DailySales(models.Model):
+    """
+    Kunlik savdo yig'indisi. Qatorlar reports.rebuild_days() da kun bo'yicha o'chirilib qayta yoziladi,
+    qo'lda o'zgartirilmaydi. day - buyurtma yaratilgan mahalliy sana.
+    """
+    day = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductSales(DailySales):
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_daily_product_sales'),
+        ]
+
+
+class DailyCategorySales(DailySales):
+    # Kategoriya mahsulotning hozirgi kategoriyasidan olinadi
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_daily_category_sales'),
+        ]
+
+
+class DailyCourierSales(DailySales):
+    # courier bo'sh qatori - hali biriktirilmagan buyurtmalar, shuning uchun kunlik jami shu jadvaldan olinadi
+    courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    delivered = models.PositiveIntegerField(default=0)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'courier'], name='unique_daily_courier_sales'),
+        ]
+
+
+class DailyPromoSales(DailySales):
+    promo = models.CharField(max_length=8)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'promo'], name='unique_daily_promo_sales'),
+        ]
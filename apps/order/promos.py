@@ -0,0 +1,89 @@
+import csv
+import secrets
+
+from django.core.cache import cache
+
+from config.exports import Echo
+from .models import Promo
+
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'  # 0/O va 1/I adashtirilmasligi uchun olib tashlangan
+CODE_LENGTH = 8
+CHUNK_SIZE = 1000
+# Ketma-ket shuncha bo'lakda birorta ham yangi kod yozilmasa, generatsiya to'xtatiladi
+MAX_EMPTY_CHUNKS = 5
+CSV_FIELDS = ('name', 'discount', 'min_price', 'expire_date', 'batch')
+
+
+def random_codes(count):
+    codes = set()
+    while len(codes) < count:
+        codes.add(''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH)))
+    return codes
+
+
+def generate_promos(count, batch, chunk_size=CHUNK_SIZE, **fields):
+    """
+    count ta tasodifiy bir martalik promo kod yaratadi va ularni bo'lak-bo'lak qaytaradi (generator).
+    Band nomlar unikal indeks orqali jimgina tashlab ketiladi (ignore_conflicts), yozilganlari esa bo'lak bo'yicha
+    bitta so'rov bilan batch orqali ajratib olinadi, shuning uchun batch yangi bo'lishi kerak.
+    fields - barcha kodlar uchun umumiy maydonlar (user, discount, min_price, expire_date).
+    """
+    left = count
+    empty_chunks = 0
+    while left > 0:
+        codes = random_codes(min(chunk_size, left))
+        Promo.objects.bulk_create([Promo(name=code, batch=batch, **fields) for code in codes], ignore_conflicts=True)
+        created = list(Promo.objects.filter(batch=batch, name__in=codes))
+        # Shu nomlar ilgari so'ralgan bo'lsa, keshda "topilmadi" bo'lib turgan bo'lishi mumkin
+        cache.delete_many([Promo.cache_key(promo.name) for promo in created])
+        if not created:
+            empty_chunks += 1
+            if empty_chunks >= MAX_EMPTY_CHUNKS:
+                raise RuntimeError("Bo'sh promo kodlar topilmadi")
+            continue
+        empty_chunks = 0
+        left -= len(created)
+        yield created
+
+
+def fill_batch(count, batch, chunk_size=CHUNK_SIZE, **fields):
+    """
+    batch dagi kodlar sonini count gacha to'ldiradi va yangi yaratilganlar sonini qaytaradi.
+    Yarim qolgan generatsiyani (masalan, yuklab olish uzilgan bo'lsa) shu bilan davom ettirish mumkin.
+    """
+    created = 0
+    while (left := count - Promo.objects.filter(batch=batch).count()) > 0:
+        for chunk in generate_promos(left, batch, chunk_size, **fields):
+            created += len(chunk)
+    return created
+
+
+def iter_promo_chunks(promos, chunk_size=CHUNK_SIZE):
+    last_id = 0
+    while True:
+        chunk = list(promos.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def expire_promos(promos, chunk_size=CHUNK_SIZE):
+    """promos ichidan hali belgilanmaganlarini bo'laklab is_expired=True qiladi. Belgilanganlar sonini qaytaradi."""
+    promos = promos.filter(is_expired=False)
+    total = 0
+    while True:
+        chunk = list(promos.order_by('id').values_list('id', 'name')[:chunk_size])
+        if not chunk:
+            return total
+        total += Promo.objects.filter(id__in=[promo_id for promo_id, _ in chunk]).update(is_expired=True)
+        cache.delete_many([Promo.cache_key(name) for _, name in chunk])
+
+
+def stream_promos_csv(chunks):
+    """Promo bo'laklarini CSV qatorlari qilib uzatadi, xotirada bir bo'lakdan ko'p kod turmaydi."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for chunk in chunks:
+        yield ''.join(writer.writerow(['' if getattr(promo, field) is None else getattr(promo, field)
+                                        for field in CSV_FIELDS]) for promo in chunk)
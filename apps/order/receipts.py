@@ -0,0 +1,133 @@
+import hashlib
+import json
+import posixpath
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, StreamingHttpResponse
+
+from config.exports import ZipStream
+from config.workers import imap, submit
+from .utils import generate_receipt_pdf, generate_receipts_pdf
+
+RECEIPT_ROOT = 'receipts'
+# Chek ko'rinishi o'zgarsa oshiriladi, shunda barcha cheklar qayta yaratiladi
+RECEIPT_VERSION = 1
+RENDER_LOCK_TIMEOUT = 60
+# Ommaviy eksportda bazadan bir martada o'qiladigan buyurtmalar soni
+EXPORT_CHUNK_SIZE = 200
+# Bitta PDF butunligicha xotirada yig'iladi, shuning uchun undan ko'p buyurtmalar ZIP qilib olinadi
+EXPORT_PDF_MAX_ORDERS = getattr(settings, 'RECEIPT_EXPORT_PDF_MAX_ORDERS', 500)
+
+
+def receipt_data(order):
+    """Chekka chiqadigan ma'lumotlar. Ulardan biri o'zgarsa, hash ham o'zgaradi va chek qayta yaratiladi."""
+    return {
+        'version': RECEIPT_VERSION,
+        'order_id': order.id,
+        'user': order.user.name,
+        'order_date': order.created_date.strftime("%Y-%m-%d %H:%M"),
+        'promo': order.promo or '',
+        'subtotal': str(order.subtotal),
+        'discount': str(order.discount),
+        'amount': str(order.total),
+        'items': [
+            {
+                'name': line.product_name,
+                'quantity': line.quantity,
+                'unit_price': str(line.unit_price),
+                'discount': line.discount,
+                'price': str(line.line_total),
+            } for line in order.lines.all()
+        ],
+    }
+
+
+def receipt_digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def receipt_path(order_id, digest):
+    return posixpath.join(RECEIPT_ROOT, str(order_id), f'{digest}.pdf')
+
+
+def render_receipt_file(data, path):
+    """PDF ni yaratib saqlaydi va shu buyurtmaning eski cheklarini o'chiradi. Bazaga murojaat qilmaydi."""
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(generate_receipt_pdf(data)))
+    directory = posixpath.dirname(path)
+    for name in default_storage.listdir(directory)[1]:
+        if posixpath.join(directory, name) != path:
+            default_storage.delete(posixpath.join(directory, name))
+    return path
+
+
+def schedule_receipt(order):
+    """
+    Chekni fonda yaratadi: broker sozlangan bo'lsa Celery orqali, aks holda jarayonlar pulida.
+    (digest, path, tayyor) qaytaradi.
+    """
+    data = receipt_data(order)
+    digest = receipt_digest(data)
+    path = receipt_path(order.id, digest)
+    if default_storage.exists(path):
+        return digest, path, True
+    # Bir xil chek bir vaqtda bir necha marta yaratilmasligi uchun
+    if cache.add(f'receipt:render:{digest}', 1, RENDER_LOCK_TIMEOUT):
+        if getattr(settings, 'CELERY_BROKER_URL', None):
+            from .tasks import render_order_receipt
+
+            render_order_receipt.delay(order.id)
+        else:
+            submit(f'{order.id}-buyurtma cheki', render_receipt_file, data, path)
+    return digest, path, default_storage.exists(path)
+
+
+def iter_receipt_data(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    """Buyurtmalarni id bo'yicha bo'laklab o'qiydi, xotirada bir bo'lakdan ko'p buyurtma turmaydi."""
+    orders = orders.select_related('user').prefetch_related('lines').order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(orders.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        for order in chunk:
+            yield receipt_data(order)
+        last_id = chunk[-1].id
+
+
+def receipt_pdf(data):
+    """(order_id, pdf) qaytaradi. Chek avval yaratilgan bo'lsa fayldan o'qiladi. Bazaga murojaat qilmaydi."""
+    path = receipt_path(data['order_id'], receipt_digest(data))
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as file:
+            return data['order_id'], file.read()
+    return data['order_id'], generate_receipt_pdf(data)
+
+
+def stream_receipts_zip(orders):
+    """Har bir buyurtma cheki alohida PDF bo'lgan ZIP. Cheklar jarayonlar pulida yaratilib, tayyor bo'lishi bilan uzatiladi."""
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for order_id, pdf in imap(receipt_pdf, iter_receipt_data(orders)):
+            archive.writestr(f'order_{order_id}_receipt.pdf', pdf)
+            yield stream.pop()
+    yield stream.pop()
+
+
+def receipts_zip_response(orders, filename='receipts.zip'):
+    response = StreamingHttpResponse(stream_receipts_zip(orders), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def receipts_pdf_response(orders, filename='receipts.pdf'):
+    """Barcha cheklar bitta ko'p sahifali PDF da. Fayl vaqtinchalik faylga yoziladi va undan uzatiladi."""
+    file = tempfile.TemporaryFile()
+    generate_receipts_pdf(iter_receipt_data(orders), file)
+    file.seek(0)
+    return FileResponse(file, content_type='application/pdf', as_attachment=True, filename=filename)
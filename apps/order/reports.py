@@ -0,0 +1,271 @@
+import atexit
+import logging
+import threading
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import (DailyCategorySales, DailyCourierSales, DailyProductSales, DailyPromoSales, Order, OrderLine,
+                     Watermark)
+
+logger = logging.getLogger(__name__)
+
+SALES_ROLLUP_WATERMARK = 'sales_rollup'
+# Kunlik qulflar uchun pg_advisory_xact_lock(ROLLUP_LOCK_KEY, kun.toordinal()) ning birinchi kaliti
+ROLLUP_LOCK_KEY = 4162
+# Saqlangan buyurtmalar kunlari fon oqimida shuncha soniyada bir marta qayta hisoblanadi
+ROLLUP_FLUSH_INTERVAL = getattr(settings, 'SALES_ROLLUP_FLUSH_INTERVAL', 5)
+# Uzoq davom etgan tranzaksiyada saqlangan buyurtmalar o'tkazib yuborilmasligi uchun watermark shuncha orqadan o'qiladi.
+# Kun qayta hisoblanishi idempotent, shuning uchun ustma-ust tushish zarar qilmaydi.
+ROLLUP_OVERLAP = timedelta(minutes=5)
+# Bir tranzaksiyada qayta hisoblanadigan kunlar soni
+ROLLUP_CHUNK_DAYS = 31
+ROLLUP_LOCK_TIMEOUT = 60 * 10
+ROLLUP_MODELS = (DailyProductSales, DailyCategorySales, DailyCourierSales, DailyPromoSales)
+REPORT_DEFAULT_DAYS = getattr(settings, 'SALES_REPORT_DEFAULT_DAYS', 30)
+REPORT_GROUPS = ('day', 'product', 'category', 'courier', 'promo')
+# Yig'indilarga ta'sir qiladigan buyurtma maydonlari, faqat boshqa maydonlar saqlanganda kun qayta hisoblanmaydi
+ROLLUP_FIELDS = {'created_date', 'courier', 'status', 'total', 'discount', 'promo'}
+
+
+def sums(**aggregates):
+    # Annotatsiya nomi modeldagi maydon bilan bir xil bo'lishi mumkin emas, shuning uchun vaqtincha qo'shimcha olinadi
+    return {f'{name}_sum': aggregate for name, aggregate in aggregates.items()}
+
+
+def unpack(row, *foreign_keys):
+    # foreign_keys ustunlari id sifatida keladi, model konstruktoriga <nom>_id bilan beriladi
+    return {f'{key}_id' if key in foreign_keys else key.removesuffix('_sum'): value for key, value in row.items()}
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_ranges(days, chunk_days=ROLLUP_CHUNK_DAYS):
+    """Kunlarni ketma-ket (first, last) oraliqlarga bo'ladi, har biri chunk_days dan oshmaydi."""
+    ranges = []
+    for day in sorted(set(days)):
+        if ranges and day - ranges[-1][1] == timedelta(days=1) and (day - ranges[-1][0]).days < chunk_days:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(bounds) for bounds in ranges]
+
+
+def lock_days(first, last):
+    """
+    [first, last] kunlarini tranzaksiya oxirigacha qulflaydi. Bir kunni bir vaqtda faqat bitta tranzaksiya
+    qayta hisoblaydi, boshqa kunlar bir-birini kutmaydi. Qulflar o'sish tartibida olinadi, shuning uchun
+    ustma-ust tushgan oraliqlar deadlock bermaydi. SQLite da yozuvchi tranzaksiya butun bazani qulflaydi.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, day) FROM generate_series(%s, %s) AS day',
+                           [ROLLUP_LOCK_KEY, first.toordinal(), last.toordinal()])
+
+
+def rebuild_range(first, last):
+    """
+    [first, last] kunlari yig'indilarini buyurtmalar va ularning qatorlaridan qayta hisoblaydi.
+    Yozilgan qatorlar sonini qaytaradi.
+    """
+    with transaction.atomic():
+        # Yig'indilar qulfdan keyin o'qiladi: aks holda bir kun ikki marta yoziladi yoki eski natija yangisini bosib ketadi
+        lock_days(first, last)
+        rows = rollup_rows(first, last)
+        for model in ROLLUP_MODELS:
+            model.objects.filter(day__gte=first, day__lte=last).delete()
+            model.objects.bulk_create([row for row in rows if isinstance(row, model)], batch_size=1000)
+    return len(rows)
+
+
+def rollup_rows(first, last):
+    """[first, last] kunlari uchun yig'indi jadvallari qatorlari (saqlanmagan), har jadval uchun bitta GROUP BY."""
+    start, end = day_start(first), day_start(last + timedelta(days=1))
+    day = TruncDate('created_date')
+    orders = Order.objects.filter(created_date__gte=start, created_date__lt=end).annotate(day=day).order_by()
+    lines = OrderLine.objects.filter(created_date__gte=start, created_date__lt=end).annotate(day=day).order_by()
+
+    line_sums = sums(orders=Count('order', distinct=True), quantity=Sum('quantity'), revenue=Sum('line_total'))
+    rows = [DailyProductSales(**unpack(row, 'product'))
+            for row in lines.values('day', 'product').annotate(**line_sums)]
+    rows += [DailyCategorySales(**unpack(row, 'category'))
+             for row in lines.values('day', category=F('product__category')).annotate(**line_sums)]
+    rows += [DailyCourierSales(**unpack(row, 'courier')) for row in orders.values('day', 'courier').annotate(**sums(
+        orders=Count('id'), delivered=Count('id', filter=Q(status='delivered')), revenue=Sum('total'),
+        discount=Sum('discount')))]
+    rows += [DailyPromoSales(**unpack(row)) for row in orders.exclude(promo__isnull=True).exclude(promo='').values(
+        'day', 'promo').annotate(**sums(orders=Count('id'), revenue=Sum('total'), discount=Sum('discount')))]
+    return rows
+
+
+def rebuild_days(days):
+    return sum(rebuild_range(first, last) for first, last in day_ranges(days))
+
+
+def order_days(orders):
+    return orders.annotate(day=TruncDate('created_date')).order_by().values_list('day', flat=True).distinct()
+
+
+def refresh_sales_rollups():
+    """
+    Oxirgi ishga tushgandan beri yaratilgan yoki o'zgargan buyurtmalar kunlarini qayta hisoblaydi.
+    Watermark hali bo'lmasa butun davr hisoblanadi. Qayta hisoblangan kunlar sonini qaytaradi
+    (boshqa jarayon ishlayotgan bo'lsa None).
+    """
+    if not cache.add(f'{SALES_ROLLUP_WATERMARK}:lock', 1, ROLLUP_LOCK_TIMEOUT):
+        return None
+    try:
+        started = timezone.now()
+        watermark = Watermark.get_value(SALES_ROLLUP_WATERMARK)
+        orders = Order.objects.all()
+        if watermark is not None:
+            orders = orders.filter(modified_date__gt=watermark - ROLLUP_OVERLAP)
+        days = list(order_days(orders))
+        rebuild_days(days)
+        Watermark.set_value(SALES_ROLLUP_WATERMARK, started)
+        return len(days)
+    finally:
+        cache.delete(f'{SALES_ROLLUP_WATERMARK}:lock')
+
+
+def rebuild_sales_rollups(date_from=None, date_to=None, chunk_days=ROLLUP_CHUNK_DAYS):
+    """
+    Berilgan oraliqni (bo'lmasa birinchi buyurtmadan oxirgisigacha) to'liq qayta hisoblaydi.
+    Har bo'lakdan keyin (first, last, qatorlar soni) qaytaradi. Bo'laklar orasidagi bo'sh kunlar ham tozalanadi.
+    """
+    started = timezone.now()
+    bounds = Order.objects.aggregate(first=Min('created_date'), last=Max('created_date'))
+    if bounds['first'] is not None:
+        date_from = date_from or timezone.localdate(bounds['first'])
+        date_to = date_to or timezone.localdate(bounds['last'])
+    if date_from is None or date_to is None or date_from > date_to:
+        return
+    first = date_from
+    while first <= date_to:
+        last = min(first + timedelta(days=chunk_days - 1), date_to)
+        yield first, last, rebuild_range(first, last)
+        first = last + timedelta(days=1)
+    if Watermark.get_value(SALES_ROLLUP_WATERMARK) is None:
+        Watermark.set_value(SALES_ROLLUP_WATERMARK, started)
+
+
+class RollupDays:
+    """
+    Saqlangan yoki o'chirilgan buyurtmalar kunlari shu yerda yig'iladi va fon oqimi har ROLLUP_FLUSH_INTERVAL
+    soniyada har bir kunni bir marta qayta hisoblaydi. Checkout so'rovi kunni qayta hisoblashni kutmaydi,
+    bir kundagi ko'p buyurtmalar esa bitta qayta hisoblashga birlashadi. interval <= 0 bo'lsa oqim ishga
+    tushmaydi, flush() qo'lda chaqiriladi. Jarayon to'xtaganda qolgan kunlar ham hisoblanadi.
+    """
+
+    def __init__(self, interval=ROLLUP_FLUSH_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.days = set()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def add(self, day):
+        with self.lock:
+            self.days.add(day)
+        self.start()
+
+    def start(self):
+        if self.thread is not None or self.interval <= 0:
+            return
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='sales-rollup-days', daemon=True)
+                self.thread.start()
+                atexit.register(self.shutdown)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Savdo yig'indilarini qayta hisoblab bo'lmadi")
+
+    def flush(self):
+        """Yig'ilgan kunlarni qayta hisoblaydi va ularning sonini qaytaradi. Xato bo'lsa kunlar navbatga qaytadi."""
+        with self.lock:
+            days, self.days = self.days, set()
+        if not days:
+            return 0
+        try:
+            rebuild_days(days)
+        except Exception:
+            with self.lock:
+                self.days |= days
+            raise
+        return len(days)
+
+    def shutdown(self):
+        self.stop_event.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Jarayon to'xtashida savdo yig'indilarini qayta hisoblab bo'lmadi")
+
+
+rollup_days = RollupDays()
+
+
+def schedule_order_day(instance):
+    # Kun tranzaksiya tugagach navbatga qo'yiladi: buyurtma qatorlari ham yozilgan bo'ladi, bekor qilingani esa tushmaydi
+    day = timezone.localdate(instance.created_date)
+    transaction.on_commit(lambda: rollup_days.add(day))
+
+
+def order_post_save(sender, instance, update_fields=None, **kwargs):
+    # Hisobot davriy refresh ni kutmasdan yangilanadi. bulk_update (dispatch) signal bermaydi, u refresh da olinadi
+    if update_fields is None or ROLLUP_FIELDS.intersection(update_fields):
+        schedule_order_day(instance)
+
+
+def order_post_delete(sender, instance, **kwargs):
+    # O'chirish modified_date ni o'zgartirmaydi, shuning uchun refresh uni ko'rmaydi
+    schedule_order_day(instance)
+
+
+post_save.connect(order_post_save, sender=Order)
+post_delete.connect(order_post_delete, sender=Order)
+
+
+def sales_report(group='day', date_from=None, date_to=None, limit=100):
+    """
+    Dashboard yig'indilari faqat kunlik jadvallardan o'qiladi. group='day' sana tartibida,
+    qolganlari tushum bo'yicha kamayish tartibida limit tagacha.
+    """
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or date_to - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    period = {'day__gte': date_from, 'day__lte': date_to}
+    if group == 'day':
+        rows = DailyCourierSales.objects.filter(**period).values('day').annotate(**sums(
+            orders=Sum('orders'), delivered=Sum('delivered'), revenue=Sum('revenue'), discount=Sum('discount')))
+        return [unpack(row) for row in rows.order_by('day')]
+    if group == 'product':
+        rows = DailyProductSales.objects.filter(**period).values('product', name=F('product__name')).annotate(**sums(
+            orders=Sum('orders'), quantity=Sum('quantity'), revenue=Sum('revenue')))
+    elif group == 'category':
+        rows = DailyCategorySales.objects.filter(**period).values('category', name=F('category__name')).annotate(
+            **sums(orders=Sum('orders'), quantity=Sum('quantity'), revenue=Sum('revenue')))
+    elif group == 'courier':
+        rows = DailyCourierSales.objects.filter(courier__isnull=False, **period).values(
+            'courier', name=F('courier__user__name')).annotate(**sums(
+                orders=Sum('orders'), delivered=Sum('delivered'), revenue=Sum('revenue')))
+    elif group == 'promo':
+        rows = DailyPromoSales.objects.filter(**period).values('promo').annotate(**sums(
+            orders=Sum('orders'), revenue=Sum('revenue'), discount=Sum('discount')))
+    else:
+        raise ValueError(group)
+    return [unpack(row) for row in rows.order_by('-revenue_sum')[:limit]]
@@ -0,0 +1,187 @@
+import math
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .dispatch import (DISPATCH_CHUNK_SIZE, KM_PER_DEGREE, REFERENCE_LATITUDE, CourierGrid, active_loads,
+                       courier_index, location_coordinates)
+from .models import Order
+
+# 2-opt yaxshilanishlari shu sondan ortiq aylanmaydi (kichik marshrutlarda odatda 2-3 aylanishda to'xtaydi)
+TWO_OPT_MAX_PASSES = 50
+EPSILON = 1e-9
+
+
+def project(coordinates):
+    """[(lat, lng), ...] ni km dagi tekis koordinatalarga o'giradi (CourierGrid bilan bir xil proyeksiya)."""
+    points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    kx = KM_PER_DEGREE * math.cos(math.radians(REFERENCE_LATITUDE))
+    return np.column_stack((points[:, 1] * kx, points[:, 0] * KM_PER_DEGREE))
+
+
+def distance_matrix(points):
+    diff = points[:, None, :] - points[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=-1))
+
+
+def nearest_neighbour(dist, start=0):
+    size = len(dist)
+    visited = np.zeros(size, dtype=bool)
+    route = [start]
+    visited[start] = True
+    for _ in range(size - 1):
+        row = np.where(visited, np.inf, dist[route[-1]])
+        nxt = int(row.argmin())
+        route.append(nxt)
+        visited[nxt] = True
+    return route
+
+
+def two_opt(route, dist):
+    """
+    Ochiq marshrutni (boshi qo'zg'almaydi, oxiri ixtiyoriy) 2-opt bilan yaxshilaydi.
+    Oxiriga hamma nuqtagacha masofasi 0 bo'lgan soxta nuqta qo'shiladi, shunda ochiq yo'l yopiq holatga keladi.
+    Har bir i uchun barcha j almashtirishlari foydasi numpy da birdaniga hisoblanadi.
+    """
+    size = len(route)
+    if size < 4:
+        return list(route)
+    padded = np.zeros((len(dist) + 1, len(dist) + 1))
+    padded[:-1, :-1] = dist
+    tour = np.array(list(route) + [len(dist)])
+    for _ in range(TWO_OPT_MAX_PASSES):
+        improved = False
+        for i in range(1, size - 1):
+            a, b = tour[i - 1], tour[i]
+            c, d = tour[i + 1:size], tour[i + 2:size + 1]
+            gain = padded[a, b] + padded[c, d] - padded[a, c] - padded[b, d]
+            j = int(gain.argmax())
+            if gain[j] > EPSILON:
+                tour[i:i + j + 2] = tour[i:i + j + 2][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return tour[:-1].tolist()
+
+
+def order_route(coordinates, start=None):
+    """
+    Buyurtmalar manzillarini yetkazish tartibiga qo'yadi: nearest-neighbour, keyin 2-opt.
+    start - kuryer joylashuvi (bo'lmasa birinchi manzildan boshlanadi). coordinates indekslarini qaytaradi.
+    """
+    if not coordinates:
+        return []
+    points = list(coordinates) if start is None else [start, *coordinates]
+    dist = distance_matrix(project(points))
+    route = two_opt(nearest_neighbour(dist), dist)
+    if start is None:
+        return route
+    return [index - 1 for index in route[1:]]
+
+
+def build_waves(coordinates, couriers):
+    """
+    Bazaga murojaat qilmaydi. coordinates - buyurtmalar [(lat, lng)], couriers - {courier_id: (lat, lng, bo'sh_joy)}.
+    Har qadamda markazdan eng uzoqdagi buyurtma olinadi, unga eng yaqin bo'sh kuryer topiladi va unga bo'sh joyi
+    sig'adigancha shu buyurtmaga eng yaqin buyurtmalar beriladi. {courier_id: [buyurtma indekslari marshrut
+    tartibida]} qaytaradi.
+    """
+    if not coordinates or not couriers:
+        return {}
+    points = project(coordinates)
+    left = np.arange(len(points))
+    center = points.mean(axis=0)
+    grid = CourierGrid()
+    for courier_id, (lat, lng, free) in couriers.items():
+        if free > 0:
+            grid.update(courier_id, lat, lng)
+
+    waves = {}
+    while len(left) and len(grid):
+        remaining = points[left]
+        seed = int(((remaining - center) ** 2).sum(axis=1).argmax())
+        lat, lng = coordinates[left[seed]]
+        courier_id = grid.nearest(lat, lng, 1)[0][0]
+        grid.remove(courier_id)
+        free = couriers[courier_id][2]
+        distances = ((remaining - remaining[seed]) ** 2).sum(axis=1)
+        if free < len(left):
+            taken = np.argpartition(distances, free - 1)[:free]
+        else:
+            taken = np.arange(len(left))
+        members = left[taken]
+        route = order_route([coordinates[index] for index in members], start=couriers[courier_id][:2])
+        waves[courier_id] = [int(members[index]) for index in route]
+        left = np.delete(left, taken)
+    return waves
+
+
+def dispatch_waves(orders=None, chunk_size=DISPATCH_CHUNK_SIZE):
+    """
+    Kuryeri yo'q buyurtmalarni yaqinligi bo'yicha guruhlab bo'sh kuryerlarga biriktiradi va har bir kuryer uchun
+    yetkazish tartibini (route_position) yozadi. auto_dispatch kabi buyurtmalar chunk_size tadan qulflanadi
+    (skip_locked), bo'sh kuryer qolmaguncha. {courier_id: [order_id, ...]} qaytaradi.
+    """
+    grid, capacities = courier_index.snapshot()
+    loads = active_loads()
+    couriers = {}
+    for courier_id, (_, x, y) in grid.points.items():
+        free = capacities[courier_id] - loads.get(courier_id, 0)
+        if free > 0:
+            couriers[courier_id] = (y / grid.ky, x / grid.kx, free)
+
+    pending = Order.objects.filter(status='preparing', courier__isnull=True)
+    if orders is not None:
+        pending = pending.filter(pk__in=orders.values('pk'))
+    routes = {}
+    last_id = 0
+    while couriers:
+        with transaction.atomic():
+            chunk = list(pending.filter(id__gt=last_id).order_by('id').select_for_update(skip_locked=True)
+                         .only('id', 'location_data')[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            chunk = [order for order in chunk if location_coordinates(order.location_data) is not None]
+            waves = build_waves([location_coordinates(order.location_data) for order in chunk], couriers)
+            now = timezone.now()
+            changed = []
+            for courier_id, indexes in waves.items():
+                for position, index in enumerate(indexes, start=loads.get(courier_id, 0) + 1):
+                    order = chunk[index]
+                    order.courier_id, order.assigned_date, order.status = courier_id, now, 'out_for_delivery'
+                    order.route_position, order.modified_date = position, now
+                    changed.append(order)
+                routes.setdefault(courier_id, []).extend(chunk[index].id for index in indexes)
+                loads[courier_id] = loads.get(courier_id, 0) + len(indexes)
+                lat, lng, free = couriers[courier_id]
+                if free > len(indexes):
+                    couriers[courier_id] = (lat, lng, free - len(indexes))
+                else:
+                    del couriers[courier_id]
+            Order.objects.bulk_update(changed, ['courier', 'assigned_date', 'status', 'route_position',
+                                                'modified_date'])
+    return routes
+
+
+def courier_route(courier, save=False):
+    """
+    Kuryerning yetkazilayotgan buyurtmalarini joriy joylashuvidan boshlab tartiblaydi. route_position faqat
+    obyektlarda yangilanadi, save=True bo'lsa (marshrutni aniq qayta rejalashtirish) bazaga ham yoziladi.
+    """
+    orders = list(Order.objects.filter(courier=courier, status='out_for_delivery').select_related('user')
+                  .order_by('route_position', 'assigned_date', 'id'))
+    located = [order for order in orders if location_coordinates(order.location_data) is not None]
+    unlocated = [order for order in orders if location_coordinates(order.location_data) is None]
+    start = (courier.latitude, courier.longitude) if courier.latitude is not None else None
+    route = order_route([location_coordinates(order.location_data) for order in located], start=start)
+    ordered = [located[index] for index in route] + unlocated
+    changed = []
+    for position, order in enumerate(ordered, start=1):
+        if order.route_position != position:
+            order.route_position = position
+            changed.append(order)
+    if save:
+        Order.objects.bulk_update(changed, ['route_position'])
+    return ordered
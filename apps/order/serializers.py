@@ -1,3 +1,6 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
@@ -5,9 +8,14 @@ from apps.account.models import User, UserLocation
 from apps.account.serializers import UserLocationSerializer
 from apps.order.models import (
     Order,
+    OrderLine,
     CartItem,
     Promo,
+    PromoRedemption,
 )
+from apps.order.reports import REPORT_GROUPS
+from apps.product.models import Product, ProductImage
+from apps.product.reservations import reserve
 from apps.product.serializers import ProductSerializer
 from drf_spectacular.utils import extend_schema_field
 
@@ -20,13 +28,13 @@ class PromoSerializer(serializers.Serializer):
         name = attrs.get('name')
         if name is None:
             raise ValidationError({'detail': "Name is required"})
-        promo = Promo.objects.filter(name=name)
-        if not promo.exists():
+        promo = Promo.get_cached(name)
+        if promo is None:
             raise ValidationError({'detail': "Promo does not exist"})
-        if promo.last().is_expired:
+        if not promo.is_active:
             raise ValidationError({'detail': "Promo is expired"})
-        if user in promo.last().members.all():
-            return ValidationError({'detail': "Promo is already used"})
+        if PromoRedemption.objects.filter(promo=promo, user=user).exists():
+            raise ValidationError({'detail': "Promo is already used"})
         return attrs
 
 
@@ -77,11 +85,31 @@ class CartItemPostSerializer(serializers.ModelSerializer):
             'quantity': {'required': True},
         }
 
+    def reserve_stock(self, user, product, quantity):
+        if not reserve(user.id, product.id, quantity):
+            product = Product.objects.with_reserved().get(pk=product.pk)
+            raise ValidationError({'quantity': f"{product.name} mahsulotidan yetarli miqdorda mavjud emas. "
+                                               f"Qoldiq: {product.available_quantity} ta."})
+
     def create(self, validated_data):
         user = self.context['request'].user
         validated_data['user_id'] = user.id
+        product = validated_data['product']
+        self.reserve_stock(user, product, CartItem.cart_quantity(user.id, product.id) + validated_data['quantity'])
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        user = self.context['request'].user
+        product = validated_data.get('product', instance.product)
+        quantity = validated_data.get('quantity', instance.quantity)
+        if product is not None:
+            self.reserve_stock(user, product, CartItem.cart_quantity(user.id, product.id, exclude_id=instance.pk) + quantity)
+        old_product_id = instance.product_id
+        instance = super().update(instance, validated_data)
+        if old_product_id and old_product_id != instance.product_id:
+            reserve(user.id, old_product_id, CartItem.cart_quantity(user.id, old_product_id))
+        return instance
+
 
 class UserSerializersOrder(serializers.ModelSerializer):
     class Meta:
@@ -89,16 +117,46 @@ class UserSerializersOrder(serializers.ModelSerializer):
         fields = ['id', 'name', 'phone']
 
 
+def build_order_lines(items):
+    """
+    Savatcha qatorlari, mahsulotlar va har bir mahsulotning birinchi rasmi bitta so'rovda yuklanadi.
+    (cart_items, saqlanmagan OrderLine lar) qaytaradi.
+    """
+    first_image = ProductImage.objects.filter(product=OuterRef('product')).order_by('id').values('image')[:1]
+    cart_items = list(CartItem.objects.filter(id__in=items).select_related('product')
+                      .annotate(first_image=Subquery(first_image)))
+    if len(cart_items) != len(set(items)) or any(item.product is None for item in cart_items):
+        raise ValidationError("Ba'zi itemlar mavjud emas yoki noto‘g‘ri ID berilgan.")
+
+    lines = [OrderLine.from_cart_item(item, default_storage.url(item.first_image) if item.first_image else None)
+             for item in cart_items]
+    return cart_items, lines
+
+
+def save_order_lines(order, lines):
+    for line in lines:
+        line.order = order
+        line.created_date = order.created_date
+    OrderLine.objects.bulk_create(lines)
+
+
+class OrderLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderLine
+        fields = ['id', 'product', 'product_name', 'product_image', 'unit_price', 'discount', 'quantity', 'line_total']
+
+
 class OrderSerializer(serializers.ModelSerializer):
     user = UserSerializersOrder(read_only=True)
-    items_data = serializers.JSONField(read_only=True)  # Yangi qo'shilgan maydon
+    items_data = serializers.JSONField(read_only=True)  # Eski mijozlar uchun, lines bilan bir xil ma'lumot
+    lines = OrderLineSerializer(many=True, read_only=True)
     promo = serializers.CharField(required=False, allow_blank=True)
     status = serializers.CharField(source='get_status_display')
 
     class Meta:
         model = Order
-        fields = ['id', 'user', 'location_data', 'file', 'items_data', 'promo', 'get_amount', 'status', 'payment_confirmed', 'modified_date',
-                  'created_date']
+        fields = ['id', 'user', 'location_data', 'file', 'items_data', 'lines', 'promo', 'subtotal', 'discount', 'promo_discount',
+                  'total', 'get_amount', 'status', 'payment_confirmed', 'modified_date', 'created_date']
 
 
 class OrderPostSerializer(serializers.ModelSerializer):
@@ -129,76 +187,81 @@ class OrderPostSerializer(serializers.ModelSerializer):
 
         attrs['location'] = location
         promo_code = attrs.get('promo', None)
+        self.promo = None
         if promo_code:
-            try:
-                promo = Promo.objects.get(name=promo_code)
-                if promo.is_expired:
-                    raise ValidationError("Promo kodning muddati o'tgan.")
-                total_amount = sum(item.get_amount for item in attrs['items'])
-                if total_amount < promo.min_price:
-                    raise ValidationError(
-                        f"Promo kodni ishlatish uchun buyurtma miqdori {promo.min_price} dan kam bo'lmasligi kerak.")
-                if promo.members.filter(id=user.id).exists():
-                    raise ValidationError("Siz bu promo kodni allaqachon ishlatgansiz.")
-                promo.members.add(user)
-                promo.save()
-            except Promo.DoesNotExist:
+            # Promo keshdan olinadi, "allaqachon ishlatilgan"ligi esa buyurtma yozilayotganda baza orqali tekshiriladi
+            self.promo = Promo.get_cached(promo_code)
+            if self.promo is None:
                 raise ValidationError("Promo kod mavjud emas.")
+            if not self.promo.is_active:
+                raise ValidationError("Promo kodning muddati o'tgan.")
 
         return attrs
 
+    def check_min_price(self, lines):
+        subtotal = sum(line.line_total for line in lines)
+        if subtotal < self.promo.min_price:
+            raise ValidationError(
+                f"Promo kodni ishlatish uchun buyurtma miqdori {self.promo.min_price} dan kam bo'lmasligi kerak.")
+
+    def redeem_promo(self, order):
+        if not self.promo.redeem(order.user, order):
+            raise ValidationError("Siz bu promo kodni allaqachon ishlatgansiz.")
+
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
-        items = validated_data.pop('items', [])
-        order = super().create(validated_data)
-
-        # items_data ni to'ldirish
-        cart_items = CartItem.objects.filter(id__in=items)
-        if cart_items.count() != len(items):
-            order.delete()
-            raise ValidationError("Ba'zi itemlar mavjud emas yoki noto‘g‘ri ID berilgan.")
-
-        order.items_data = [
-            {
-                'id': item.id,
-                'product_id': item.product.id,
-                'product_name': item.product.name,
-                'product_image': item.product.images.first().image.url if item.product.images.exists() else None,  # Birinchi rasm
-                'quantity': item.quantity,
-                'price': str(item.get_amount),
-            } for item in cart_items
-        ]
-        order.save()
-
-        # items ni ManyToManyField ga qo'shish
-        for item in cart_items:
-            order.items.add(item)
-
+        cart_items, lines = build_order_lines(validated_data.pop('items', []))
+        if self.promo:
+            self.check_min_price(lines)
+        validated_data['items_data'] = [line.as_item_data() for line in lines]
+        with transaction.atomic():
+            order = super().create(validated_data)
+            save_order_lines(order, lines)
+
+            # items ni ManyToManyField ga bitta INSERT bilan qo'shish
+            order.items.add(*cart_items)
+            if self.promo:
+                self.redeem_promo(order)
         return order
 
     def update(self, instance, validated_data):
         items = validated_data.pop('items', None)
+        if items:
+            cart_items, lines = build_order_lines(items)
+            validated_data['items_data'] = [line.as_item_data() for line in lines]
+        if self.promo and self.promo.name != instance.promo:
+            self.check_min_price(lines if items else instance.lines.all())
+            self.redeem_promo(instance)
         instance = super().update(instance, validated_data)
 
         if items:
-            cart_items = CartItem.objects.filter(id__in=items)
-            if cart_items.count() != len(items):
-                raise ValidationError("Ba'zi itemlar mavjud emas yoki noto‘g‘ri ID berilgan.")
-
-            instance.items_data = [
-                {
-                    'id': item.id,
-                    'product_id': item.product.id,
-                    'product_name': item.product.name,
-                    'product_image': item.product.images.first().image.url if item.product.images.exists() else None,
-                    # Birinchi rasm
-                    'quantity': item.quantity,
-                    'price': str(item.get_amount),
-                } for item in cart_items
-            ]
-            instance.items.clear()  # Eski items ni o'chirish
-            for item in cart_items:
-                instance.items.add(item)  # Yangi items ni qo'shish
-            instance.save()
+            instance.lines.all().delete()
+            save_order_lines(instance, lines)
+            instance.items.set(cart_items)  # Eski items o'rniga yangilari
 
         return instance
+
+
+class CourierPositionSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+
+
+class RouteOrderSerializer(serializers.ModelSerializer):
+    user = UserSerializersOrder(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'route_position', 'user', 'location_data', 'total', 'payment_confirmed', 'assigned_date']
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    group = serializers.ChoiceField(choices=REPORT_GROUPS, default='day')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise ValidationError({'date_from': "date_from date_to dan keyin bo'lishi mumkin emas."})
+        return attrs
@@ -1,9 +1,48 @@
 from celery import shared_task
 from django.utils import timezone
 
-from .models import Promo
+from .dispatch import auto_dispatch
+from .models import IdempotencyKey, Order, Promo, Watermark
+from .promos import expire_promos
+from .receipts import receipt_data, receipt_digest, receipt_path, render_receipt_file
+from .reports import refresh_sales_rollups
+
+PROMO_EXPIRE_WATERMARK = 'promo_expire'
 
 
 @shared_task
 def set_expire():
-    Promo.objects.filter(expire_date__lt=timezone.now()).update(is_expired=True)
\ No newline at end of file
+    """
+    Oxirgi ishga tushgandan beri muddati o'tgan promolarni belgilaydi. Tekshiruvlar Promo.is_active/active() orqali
+    expire_date dan hisoblanadi, is_expired faqat qo'shimcha belgi, shuning uchun butun jadval qayta ko'rilmaydi.
+    """
+    today = timezone.localdate()
+    promos = Promo.objects.filter(expire_date__lt=today)
+    watermark = Watermark.get_value(PROMO_EXPIRE_WATERMARK)
+    if watermark is not None:
+        promos = promos.filter(expire_date__gte=timezone.localdate(watermark))
+    expired = expire_promos(promos)
+    Watermark.set_value(PROMO_EXPIRE_WATERMARK, timezone.now())
+    return expired
+
+
+@shared_task
+def delete_expired_idempotency_keys():
+    return IdempotencyKey.objects.filter(expire_date__lt=timezone.now()).delete()[0]
+
+
+@shared_task
+def render_order_receipt(order_id):
+    order = Order.objects.select_related('user').prefetch_related('lines').get(pk=order_id)
+    data = receipt_data(order)
+    return render_receipt_file(data, receipt_path(order.id, receipt_digest(data)))
+
+
+@shared_task
+def auto_dispatch_orders():
+    return auto_dispatch()
+
+
+@shared_task
+def refresh_sales_reports():
+    return refresh_sales_rollups()
@@ -1,3 +1,766 @@
-from django.test import TestCase
+import csv
+import io
+import math
+import random
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from apps.account.models import User, UserLocation
+from apps.product.models import Category, Product, ProductImage, StockReservation
+from config import exports
+from config.pagination import EstimatedCountPaginator
+from .dispatch import CourierGrid, auto_dispatch, courier_index
+from .models import CartItem, Courier, Order, OrderLine, Promo, PromoRedemption, Watermark, calculate_totals
+from .reports import ROLLUP_LOCK_KEY, RollupDays, lock_days, rebuild_range, refresh_sales_rollups, sales_report
+from .routing import build_waves, dispatch_waves, distance_matrix, nearest_neighbour, order_route, project
+from .serializers import OrderPostSerializer
+from .tasks import PROMO_EXPIRE_WATERMARK, set_expire
+
+
+class CheckoutTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        UserLocation.objects.create(user=self.user, location='Toshkent')
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, *cart_items):
+        return self.client.post('/order/', {'items': ','.join(str(item.id) for item in cart_items)})
+
+    def test_stock_and_sold_count_are_updated(self):
+        product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=10)
+        first = CartItem.objects.create(product=product, user=self.user, quantity=3)
+        second = CartItem.objects.create(product=product, user=self.user, quantity=2)
+
+        response = self.checkout(first, second)
+
+        self.assertEqual(response.status_code, 201)
+        product.refresh_from_db()
+        self.assertEqual((product.quantity, product.sold_count), (5, 5))
+
+    def test_failed_checkout_rolls_back(self):
+        apple = Product.objects.create(name='Olma', price=1000, discount=0, quantity=10)
+        pear = Product.objects.create(name='Nok', price=1000, discount=0, quantity=1)
+        items = [CartItem.objects.create(product=apple, user=self.user, quantity=4),
+                 CartItem.objects.create(product=pear, user=self.user, quantity=2)]
+
+        response = self.checkout(*items)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        apple.refresh_from_db()
+        self.assertEqual((apple.quantity, apple.sold_count), (10, 0))
+
+    def test_items_left_in_cart_keep_their_reservation(self):
+        product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=10)
+        self.client.post('/order/cart-items/', {'product': product.id, 'quantity': 3})
+        self.client.post('/order/cart-items/', {'product': product.id, 'quantity': 4})
+        first = CartItem.objects.filter(user=self.user).order_by('id').first()
+
+        response = self.checkout(first)
+
+        self.assertEqual(response.status_code, 201)
+        reservation = StockReservation.objects.get(user=self.user, product=product)
+        self.assertEqual(reservation.quantity, 4)
+
+
+class IdempotencyTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        self.product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=10)
+        self.client.force_authenticate(self.user)
+
+    def add_to_cart(self, key, quantity=1):
+        return self.client.post('/order/cart-items/', {'product': self.product.id, 'quantity': quantity},
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeated_request_is_replayed(self):
+        first = self.add_to_cart('abc')
+        second = self.add_to_cart('abc')
+
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.add_to_cart('abc', quantity=2).status_code, 422)
+
+
+class PromoCheckoutTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        UserLocation.objects.create(user=self.user, location='Toshkent')
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=100)
+        self.promo = Promo.objects.create(name='YOZ10', user=self.user, discount=10, min_price=1500)
+
+    def checkout(self, quantity, promo='YOZ10'):
+        cart_item = CartItem.objects.create(product=self.product, user=self.user, quantity=quantity)
+        return self.client.post('/order/', {'items': str(cart_item.id), 'promo': promo})
+
+    def test_promo_is_redeemed_once(self):
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.get().total, 1800)
+        self.assertTrue(PromoRedemption.objects.filter(promo=self.promo, user=self.user).exists())
+
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 98)
+
+    def test_min_price_and_unknown_promo(self):
+        self.assertEqual(self.checkout(1).status_code, 400)
+        self.assertEqual(self.checkout(2, promo='YOQ').status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(PromoRedemption.objects.exists())
+
+
+class OrderTotalsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        self.promo = Promo.objects.create(name='YOZ15', user=self.user, discount=15, min_price=1500)
+        self.items_data = [{'price': '1800.0'}, {'price': '333.335'}]
+
+    def test_calculate_totals(self):
+        self.assertEqual(calculate_totals(self.items_data), (Decimal('2133.34'), Decimal('0.00'), Decimal('2133.34')))
+        self.assertEqual(calculate_totals(self.items_data, 15),
+                         (Decimal('2133.34'), Decimal('320.00'), Decimal('1813.34')))
+        self.assertEqual(calculate_totals(None, 15), (Decimal('0.00'), Decimal('0.00'), Decimal('0.00')))
+        self.assertEqual(calculate_totals([{'price': None}, {}]), (Decimal('0.00'), Decimal('0.00'), Decimal('0.00')))
+
+    def test_totals_are_fixed_until_items_or_promo_change(self):
+        order = Order.objects.create(user=self.user, items_data=self.items_data, promo='YOZ15')
+        order.refresh_from_db()
+        self.assertEqual((order.subtotal, order.discount, order.promo_discount, order.total),
+                         (Decimal('2133.34'), Decimal('320.00'), 15, Decimal('1813.34')))
+
+        # Promo foizi keyin o'zgarsa ham buyurtma summasi o'zgarmaydi
+        Promo.objects.filter(pk=self.promo.pk).update(discount=50)
+        order.status = 'delivered'
+        order.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).total, Decimal('1813.34'))
+
+        order.promo = None
+        order.save(update_fields=['promo'])
+        order.refresh_from_db()
+        self.assertEqual((order.discount, order.promo_discount, order.total), (Decimal('0.00'), 0, Decimal('2133.34')))
+
+    def test_backfill_command(self):
+        with_items_data = Order.objects.create(user=self.user, items_data=self.items_data, promo='YOZ15')
+        product = Product.objects.create(name='Olma', price=1000, discount=10, quantity=100)
+        legacy = Order.objects.create(user=self.user)
+        legacy.items.add(CartItem.objects.create(product=product, user=self.user, quantity=3))
+        # Migratsiyadan oldingi buyurtmalar: ustunlar 0, oddiy save ularni tuzatmaydi
+        Order.objects.update(subtotal=0, discount=0, promo_discount=0, total=0)
+        Order.objects.get(pk=with_items_data.pk).save()
+        self.assertEqual(Order.objects.get(pk=with_items_data.pk).total, 0)
+
+        call_command('backfill_order_totals', chunk_size=1, stdout=io.StringIO())
+
+        with_items_data.refresh_from_db()
+        self.assertEqual((with_items_data.subtotal, with_items_data.discount, with_items_data.total),
+                         (Decimal('2133.34'), Decimal('320.00'), Decimal('1813.34')))
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.subtotal, legacy.discount, legacy.total),
+                         (Decimal('2700.00'), Decimal('0.00'), Decimal('2700.00')))
+
+
+class PromoExpiryTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        self.client.force_authenticate(self.user)
+        self.today = timezone.localdate()
+
+    def create_promo(self, name, days):
+        return Promo.objects.create(name=name, user=self.user, discount=10, min_price=1500,
+                                    expire_date=self.today + timedelta(days=days))
+
+    def test_expiry_is_checked_at_read_time(self):
+        # set_expire hali ishlamagan: is_expired=False, lekin muddat kechagi kun bilan tugagan
+        expired = self.create_promo('KECHA', -1)
+        active = self.create_promo('BUGUN', 0)
+
+        self.assertFalse(expired.is_active)
+        self.assertTrue(active.is_active)
+        self.assertEqual(list(Promo.objects.active()), [active])
+        self.assertEqual(list(Promo.objects.expired()), [expired])
+
+        response = self.client.post('/order/check_promo/', {'name': 'KECHA'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['detail'], ['Promo is expired'])
+        self.assertEqual(self.client.post('/order/check_promo/', {'name': 'BUGUN'}).status_code, 200)
+
+    def test_watermark_limits_scan_to_newly_expired(self):
+        old = self.create_promo('ESKI', -10)
+        recent = self.create_promo('YANGI', -2)
+        future = self.create_promo('KELGUSI', 5)
+        Watermark.set_value(PROMO_EXPIRE_WATERMARK, timezone.now() - timedelta(days=3))
+
+        self.assertEqual(set_expire(), 1)
+        # Oldingi oynadagi promo qayta ko'rilmaydi, u baribir active() da muddati o'tgan hisoblanadi
+        self.assertEqual(set(Promo.objects.filter(is_expired=True)), {recent})
+        self.assertEqual(set(Promo.objects.expired()), {old, recent})
+        self.assertFalse(Promo.objects.get(pk=future.pk).is_expired)
+        self.assertGreater(Watermark.get_value(PROMO_EXPIRE_WATERMARK), timezone.now() - timedelta(minutes=1))
+        self.assertEqual(set_expire(), 0)
+
+    def test_first_run_marks_everything_expired(self):
+        self.create_promo('ESKI', -10)
+        self.create_promo('YANGI', -2)
+        self.assertEqual(set_expire(), 2)
+
+    def test_cached_promo_is_invalidated_on_expiry(self):
+        promo = self.create_promo('KECHA', -1)
+        self.assertFalse(Promo.get_cached('KECHA').is_expired)
+        self.assertIsNotNone(cache.get(Promo.cache_key('KECHA')))
+
+        set_expire()
+        self.assertIsNone(cache.get(Promo.cache_key('KECHA')))
+        cached = Promo.get_cached('KECHA')
+        self.assertEqual(cached.pk, promo.pk)
+        self.assertTrue(cached.is_expired)
+
+
+class MarkOrderAsDeliveredTest(APITestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(phone='998900000001', name='Xaridor')
+        self.order = Order.objects.create(user=self.customer)
+
+    def mark(self, user):
+        self.client.force_authenticate(user)
+        with mock.patch('apps.order.views.schedule_receipt', return_value=('digest', 'path', False)) as schedule:
+            return self.client.patch(f'/order/orders/mark_as_delivered/{self.order.id}/'), schedule
+
+    def test_receipt_is_scheduled_not_rendered(self):
+        response, schedule = self.mark(self.customer)
+        self.assertEqual(response.status_code, 202)
+        schedule.assert_called_once()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'delivered')
+
+    def test_other_users_order_is_not_found(self):
+        other = User.objects.create_user(phone='998900000002', name='Boshqa')
+        response, schedule = self.mark(other)
+        self.assertEqual(response.status_code, 404)
+        schedule.assert_not_called()
+
+
+class PromoGenerateCodesTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone='998900000000', name='Admin', password='parol')
+        self.sample = Promo.objects.create(name='YOZ10', user=self.admin, discount=10, min_price=1500)
+        self.client.force_login(self.admin)
+
+    def generate(self, count, batch='YOZ'):
+        return self.client.post('/admin/order/promo/', {
+            'action': 'generate_codes', '_selected_action': [self.sample.id], 'count': count, 'batch': batch})
+
+    def test_codes_are_created_before_streaming_and_batch_is_topped_up(self):
+        response = self.generate(3)
+        # Javob hali o'qilmagan bo'lsa ham kodlar yozilgan
+        self.assertEqual(Promo.objects.filter(batch='YOZ').count(), 3)
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 4)
+
+        response = self.generate(5)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(Promo.objects.filter(batch='YOZ').count(), 5)
+        self.assertEqual({row['name'] for row in rows}, set(Promo.objects.filter(batch='YOZ').values_list(
+            'name', flat=True)))
+
+
+class OrderItemsDataQueryCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone='998900000001', name='Ulgurji xaridor')
+        UserLocation.objects.create(user=cls.user, location='Toshkent')
+
+    def create_cart(self, lines):
+        products = Product.objects.bulk_create(
+            [Product(name=f'Mahsulot {i}', price=1000, discount=10, quantity=100) for i in range(lines)])
+        ProductImage.objects.bulk_create(
+            [ProductImage(product=product, image=f'products/{product.id}-{n}.png') for product in products for n in (1, 2)])
+        return CartItem.objects.bulk_create(
+            [CartItem(product=product, user=self.user, quantity=2) for product in products])
+
+    def count_create_queries(self, lines):
+        cart_items = self.create_cart(lines)
+        request = SimpleNamespace(user=self.user, data={})
+        serializer = OrderPostSerializer(data={'items': [item.id for item in cart_items]}, context={'request': request})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as ctx:
+            order = serializer.save()
+        self.assertEqual(order.items.count(), lines)
+        self.assertEqual(len(order.items_data), lines)
+        self.assertEqual(order.lines.count(), lines)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_line_count(self):
+        self.assertEqual(self.count_create_queries(200), self.count_create_queries(2))
+
+    def test_items_data_uses_first_image(self):
+        cart_item = self.create_cart(1)[0]
+        request = SimpleNamespace(user=self.user, data={})
+        serializer = OrderPostSerializer(data={'items': [cart_item.id]}, context={'request': request})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        line = serializer.save().items_data[0]
+        self.assertEqual(line['product_image'], f'/media/products/{cart_item.product_id}-1.png')
+        self.assertEqual(line['price'], '1800.0')
+
+
+class OrderAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(phone='998900000000', name='Admin', password='parol')
+        couriers = []
+        for n in range(5):
+            user = User.objects.create_user(phone=f'99890000001{n}', name=f'Kuryer {n}', password='parol')
+            couriers.append(Courier.objects.create(user=user, phone=user.phone))
+        cls.couriers = couriers
+        cls.courier_user = couriers[0].user
+        cls.courier_user.is_staff = True
+        cls.courier_user.save()
+        cls.courier_user.groups.add(Group.objects.create(name='Courier'))
+        customers = User.objects.bulk_create(
+            [User(phone=f'9989001{n:05d}', name=f'Xaridor {n}') for n in range(120)])
+        Order.objects.bulk_create([Order(user=user, courier=couriers[n % 5]) for n, user in enumerate(customers)])
+
+    def test_changelist_query_count_does_not_depend_on_rows(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/admin/order/order/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+        self.assertLess(len(ctx.captured_queries), 10)
+
+    def test_courier_sees_only_own_orders(self):
+        self.client.force_login(self.courier_user)
+        Permission = self.courier_user.user_permissions.model
+        self.courier_user.user_permissions.add(Permission.objects.get(codename='view_order'))
+        response = self.client.get('/admin/order/order/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({order.courier_id for order in response.context['cl'].result_list}, {self.couriers[0].id})
+        other = Order.objects.exclude(courier=self.couriers[0]).first()
+        own = Order.objects.filter(courier=self.couriers[0]).first()
+        self.assertEqual(self.client.get(f'/admin/order/order/{other.id}/change/').status_code, 302)
+        self.assertEqual(self.client.get(f'/admin/order/order/{own.id}/change/').status_code, 200)
+
+    @skipUnless(connection.vendor == 'postgresql', 'reltuples PostgreSQL da mavjud')
+    def test_paginator_uses_table_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Order._meta.db_table}')
+        paginator = EstimatedCountPaginator(Order.objects.order_by('id'), 100)
+        paginator.exact_threshold = 0
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(paginator.count, 120)
+        self.assertIn('reltuples', ctx.captured_queries[0]['sql'])
+
+        filtered = EstimatedCountPaginator(Order.objects.filter(status='delivered').order_by('id'), 100)
+        filtered.exact_threshold = 0
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(filtered.count, Order.objects.filter(status='delivered').count())
+        self.assertIn('COUNT(', ctx.captured_queries[0]['sql'])
+
+
+class SalesRollupTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        self.category = Category.objects.create(name='Mevalar')
+        self.product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=100, category=self.category)
+        courier_user = User.objects.create_user(phone='998900000010', name='Kuryer')
+        self.courier = Courier.objects.create(user=courier_user, phone=courier_user.phone)
+        self.rollup_days = RollupDays(interval=0)
+        patcher = mock.patch('apps.order.reports.rollup_days', self.rollup_days)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_order(self, quantity, promo=None):
+        price = f'{quantity * 1000}.00'
+        order = Order.objects.create(user=self.user, promo=promo, items_data=[{'price': price}])
+        OrderLine.objects.create(order=order, product=self.product, product_name='Olma', unit_price=1000,
+                                 quantity=quantity, line_total=price, created_date=order.created_date)
+        return order
+
+    def test_refresh_only_recomputes_changed_days(self):
+        first = self.create_order(2)
+        self.create_order(3)
+        refresh_sales_rollups()
+        day = sales_report('day')
+        self.assertEqual(len(day), 1)
+        self.assertEqual((day[0]['orders'], day[0]['delivered'], day[0]['revenue']), (2, 0, 5000))
+        self.assertEqual([(row['name'], row['quantity'], row['revenue']) for row in sales_report('category')],
+                         [('Mevalar', 5, 5000)])
+
+        first.courier = self.courier
+        first.save()
+        first.status = 'delivered'
+        first.save(update_fields=['status'])
+        refresh_sales_rollups()
+        self.assertEqual([(row['courier'], row['orders'], row['delivered']) for row in sales_report('courier')],
+                         [(self.courier.id, 1, 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.rollup_days.flush()
+        self.assertEqual(sales_report('day')[0]['orders'], 1)
+        self.assertEqual(sales_report('courier'), [])
+
+    def test_saved_orders_reach_the_report_after_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.create_order(2)
+        # So'rov oqimida hech narsa hisoblanmaydi, faqat kun navbatga qo'yiladi
+        self.assertEqual(sales_report('day'), [])
+        self.assertEqual(self.rollup_days.days, {timezone.localdate(order.created_date)})
+        self.assertEqual(self.rollup_days.flush(), 1)
+        self.assertEqual([(row['orders'], row['revenue']) for row in sales_report('day')], [(1, 2000)])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            order.save(update_fields=['payment_confirmed'])
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            order.courier = self.courier
+            order.save(update_fields=['courier'])
+        self.rollup_days.flush()
+        self.assertEqual([row['courier'] for row in sales_report('courier')], [self.courier.id])
+
+    def test_orders_of_one_day_are_rebuilt_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = [self.create_order(quantity) for quantity in (1, 2, 3)]
+        day = timezone.localdate(orders[0].created_date)
+        with mock.patch('apps.order.reports.rebuild_days', side_effect=RuntimeError) as rebuild_days:
+            with self.assertRaises(RuntimeError):
+                self.rollup_days.flush()
+        rebuild_days.assert_called_once_with({day})
+        # Xatodan keyin kun navbatda qoladi va keyingi flush da hisoblanadi
+        self.assertEqual(self.rollup_days.days, {day})
+        self.assertEqual(self.rollup_days.flush(), 1)
+        self.assertEqual(self.rollup_days.flush(), 0)
+        self.assertEqual(sales_report('day')[0]['orders'], 3)
+
+    def test_report_api(self):
+        self.create_order(2)
+        refresh_sales_rollups()
+        admin = User.objects.create_superuser(phone='998900000000', name='Admin', password='parol')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/order/reports/sales/', {'group': 'product'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['product'], row['orders'], row['quantity']) for row in response.data],
+                         [(self.product.id, 1, 2)])
+        self.assertEqual(self.client.get('/order/reports/sales/', {'group': 'user'}).status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/order/reports/sales/').status_code, 403)
+
+
+class OrderReceiptExportTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone='998900000000', name='Admin', password='parol')
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        self.orders = [Order.objects.create(user=self.user, items_data=[{'product_name': 'Olma', 'price': '1000.0'}])
+                       for _ in range(3)]
+        self.client.force_authenticate(self.admin)
+
+    def test_zip_has_a_pdf_per_order(self):
+        response = self.client.get('/order/receipts/export/')
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(sorted(archive.namelist()),
+                         sorted(f'order_{order.id}_receipt.pdf' for order in self.orders))
+        for name in archive.namelist():
+            pdf = archive.read(name)
+            self.assertTrue(pdf.startswith(b'%PDF'))
+            self.assertIn(b'%%EOF', pdf[-32:])
+
+    def test_single_pdf_is_limited(self):
+        with mock.patch('apps.order.views.EXPORT_PDF_MAX_ORDERS', 2):
+            self.assertEqual(self.client.get('/order/receipts/export/', {'output': 'pdf'}).status_code, 400)
+        with mock.patch('apps.order.views.EXPORT_PDF_MAX_ORDERS', 3):
+            response = self.client.get('/order/receipts/export/', {'output': 'pdf'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_non_staff_is_forbidden(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/order/receipts/export/').status_code, 403)
+
+
+class OrderExportTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone='998900000000', name='Admin', password='parol')
+        user = User.objects.create_user(phone='998900000001', name='Xaridor & "Ko"')
+        product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=100)
+        self.order = Order.objects.create(user=user, items_data=[{'price': '3000.00'}])
+        for quantity in (1, 2):
+            OrderLine.objects.create(order=self.order, product=product, product_name='Olma', unit_price=1000,
+                                     quantity=quantity, line_total=quantity * 1000,
+                                     created_date=self.order.created_date)
+        Order.objects.create(user=user)
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_has_a_row_per_line(self):
+        response = self.client.get('/order/orders/export/')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:3], ['order_id', 'created_date', 'customer'])
+        self.assertEqual([(row[0], row[2], row[12]) for row in rows[1:]],
+                         [(str(self.order.id), 'Xaridor & "Ko"', '1'), (str(self.order.id), 'Xaridor & "Ko"', '2'),
+                          (str(self.order.id + 1), 'Xaridor & "Ko"', '')])
+
+    def test_csv_cells_are_not_formulas(self):
+        User.objects.filter(orders=self.order).update(name='=HYPERLINK("http://x")')
+        response = self.client.get('/order/orders/export/')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows[1][2], '\'=HYPERLINK("http://x")')
+        self.assertEqual(exports.csv_cell(-5), -5)
+        self.assertEqual([exports.csv_cell(value) for value in ('+998', '@a', '\tb', 'a=b')],
+                         ["'+998", "'@a", "'\tb", 'a=b'])
+
+    def test_xlsx_is_split_into_sheets(self):
+        with mock.patch.object(exports, 'XLSX_MAX_ROWS', 3):
+            response = self.client.get('/order/orders/export/', {'output': 'xlsx'})
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        self.assertIn('name="Orders 2"', archive.read('xl/workbook.xml').decode())
+        first, second = archive.read('xl/worksheets/sheet1.xml'), archive.read('xl/worksheets/sheet2.xml')
+        self.assertEqual((first.count(b'<row>'), second.count(b'<row>')), (3, 2))
+        self.assertIn(b'Xaridor &amp; "Ko"', first)
+        self.assertEqual(self.client.get('/order/orders/export/', {'output': 'pdf'}).status_code, 400)
+
+
+class CourierGridTest(SimpleTestCase):
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(0)
+        grid = CourierGrid(cell_size=0.5)
+        points = {}
+        for key in range(2000):
+            points[key] = (41.3 + rng.uniform(-0.1, 0.1), 69.28 + rng.uniform(-0.1, 0.1))
+            grid.update(key, *points[key])
+        for key in range(0, 2000, 3):
+            grid.remove(key)
+            del points[key]
+
+        for _ in range(50):
+            lat, lng = 41.3 + rng.uniform(-0.15, 0.15), 69.28 + rng.uniform(-0.15, 0.15)
+            x, y = lng * grid.kx, lat * grid.ky
+            expected = sorted(points, key=lambda k: math.hypot(points[k][1] * grid.kx - x, points[k][0] * grid.ky - y))
+            self.assertEqual([key for key, _ in grid.nearest(lat, lng, 5)], expected[:5])
+
+
+class RoutingTest(SimpleTestCase):
+    def route_length(self, dist, route):
+        return sum(dist[a, b] for a, b in zip(route, route[1:]))
+
+    def test_points_on_a_line_are_visited_in_order(self):
+        coordinates = [(41.30, 69.20 + step / 100) for step in (5, 1, 4, 0, 3, 2)]
+        self.assertEqual(order_route(coordinates, start=(41.30, 69.19)), [3, 1, 5, 4, 2, 0])
+
+    def test_two_opt_is_not_worse_than_nearest_neighbour(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            coordinates = [(41.3 + rng.uniform(-0.05, 0.05), 69.28 + rng.uniform(-0.05, 0.05)) for _ in range(12)]
+            dist = distance_matrix(project(coordinates))
+            route = order_route(coordinates)
+            self.assertEqual(sorted(route), list(range(12)))
+            self.assertLessEqual(self.route_length(dist, route),
+                                 self.route_length(dist, nearest_neighbour(dist)) + 1e-9)
+
+    def test_waves_respect_capacity(self):
+        rng = random.Random(2)
+        coordinates = [(41.3 + rng.uniform(-0.1, 0.1), 69.28 + rng.uniform(-0.1, 0.1)) for _ in range(95)]
+        couriers = {courier_id: (41.3 + rng.uniform(-0.1, 0.1), 69.28, 10) for courier_id in range(1, 11)}
+        waves = build_waves(coordinates, couriers)
+        self.assertTrue(all(len(indexes) <= 10 for indexes in waves.values()))
+        assigned = [index for indexes in waves.values() for index in indexes]
+        self.assertEqual(sorted(assigned), list(range(95)))
+
+
+class AutoDispatchTest(TestCase):
+    def setUp(self):
+        courier_index.sync(force=True)
+
+    def create_courier(self, phone, lat, lng, capacity=1):
+        user = User.objects.create_user(phone=phone, name=f'Kuryer {phone}')
+        with self.captureOnCommitCallbacks(execute=True):
+            return Courier.objects.create(user=user, phone=phone, latitude=lat, longitude=lng, capacity=capacity)
+
+    def test_orders_go_to_nearest_courier_with_capacity(self):
+        near = self.create_courier('998900000010', 41.30, 69.28)
+        far = self.create_courier('998900000011', 41.40, 69.40)
+        user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        orders = [Order.objects.create(user=user, location_data={'latitude': '41.301', 'longitude': '69.281'})
+                  for _ in range(3)]
+
+        self.assertEqual(auto_dispatch(), 2)
+
+        couriers = [order.courier_id for order in Order.objects.filter(id__in=[o.id for o in orders]).order_by('id')]
+        self.assertEqual(couriers, [near.id, far.id, None])
+        self.assertEqual(Order.objects.filter(status='out_for_delivery').count(), 2)
+
+    def test_waves_are_dispatched_in_chunks(self):
+        courier = self.create_courier('998900000010', 41.30, 69.28, capacity=5)
+        user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        orders = [Order.objects.create(user=user, location_data={'lat': 41.30 + step / 1000, 'lng': 69.28})
+                  for step in range(7)]
+
+        with CaptureQueriesContext(connection) as queries:
+            routes = dispatch_waves(chunk_size=2)
+
+        self.assertEqual(len(routes[courier.id]), 5)
+        self.assertEqual(sum('FOR UPDATE' in query['sql'] and 'LIMIT 2' in query['sql']
+                             for query in queries.captured_queries), 3)
+        positions = Order.objects.filter(courier=courier).order_by('route_position').values_list(
+            'route_position', flat=True)
+        self.assertEqual(list(positions), [1, 2, 3, 4, 5])
+        self.assertEqual(Order.objects.filter(id__in=[o.id for o in orders], courier__isnull=True).count(), 2)
+
+    def test_route_get_does_not_write(self):
+        courier = self.create_courier('998900000010', 41.30, 69.28, capacity=5)
+        user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        for position, step in enumerate((3, 1, 2), start=1):
+            Order.objects.create(user=user, courier=courier, route_position=position,
+                                 location_data={'lat': 41.30 + step / 100, 'lng': 69.28})
+        client = APIClient()
+        client.force_authenticate(courier.user)
+
+        response = client.get('/order/courier/route/')
+
+        self.assertEqual([order['route_position'] for order in response.data], [1, 2, 3])
+        self.assertEqual(list(Order.objects.order_by('id').values_list('route_position', flat=True)), [1, 2, 3])
+        client.post('/order/courier/route/')
+        self.assertEqual(list(Order.objects.order_by('id').values_list('route_position', flat=True)), [3, 1, 2])
+
+    def test_index_changes_wait_for_commit(self):
+        courier = self.create_courier('998900000010', 41.30, 69.28)
+        with self.captureOnCommitCallbacks() as callbacks:
+            courier.is_available = False
+            courier.save()
+            self.assertIn(courier.id, courier_index.grid)
+        for callback in callbacks:
+            callback()
+        self.assertNotIn(courier.id, courier_index.grid)
+
+    def test_sync_drops_couriers_deleted_elsewhere(self):
+        courier = self.create_courier('998900000010', 41.30, 69.28)
+        # Boshqa jarayondagi o'chirish: bu jarayonda signal ishlamaydi
+        with mock.patch('apps.order.dispatch.transaction.on_commit'):
+            Courier.objects.filter(pk=courier.pk).delete()
+        self.assertIn(courier.id, courier_index.grid)
+        courier_index.checked_at = 0  # INDEX_SYNC_INTERVAL o'tgandek
+        courier_index.sync()
+        self.assertNotIn(courier.id, courier_index.grid)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Qatorlarni qulflash PostgreSQL da tekshiriladi')
+class ConcurrentCheckoutTest(TransactionTestCase):
+    checkouts = 200
+    workers = 20
+    stock = 50
+
+    def setUp(self):
+        self.rollup_days = RollupDays(interval=0)
+        patcher = mock.patch('apps.order.reports.rollup_days', self.rollup_days)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        UserLocation.objects.create(user=user, location='Toshkent')
+        product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=self.stock)
+        cart_items = CartItem.objects.bulk_create(
+            [CartItem(product=product, user=user, quantity=1) for _ in range(self.checkouts)])
+
+        def checkout(cart_item):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                return client.post('/order/', {'items': str(cart_item.id)}).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            statuses = list(executor.map(checkout, cart_items))
+
+        product.refresh_from_db()
+        self.assertEqual(statuses.count(201), self.stock)
+        self.assertEqual(statuses.count(400), self.checkouts - self.stock)
+        self.assertEqual((product.quantity, product.sold_count), (0, self.stock))
+        self.assertEqual(Order.objects.count(), self.stock)
+        # Barcha checkoutlar bitta kunni navbatga qo'yadi, u bir marta qayta hisoblanadi
+        self.assertEqual(self.rollup_days.flush(), 1)
+        self.assertEqual(sales_report('day')[0]['orders'], self.stock)
+
+    def test_parallel_rebuilds_of_one_day(self):
+        user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        for _ in range(5):
+            Order.objects.create(user=user, items_data=[{'price': '1000.00'}])
+        today = timezone.localdate()
+
+        def rebuild(_):
+            try:
+                return rebuild_range(today, today)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.assertEqual(set(executor.map(rebuild, range(self.workers))), {1})
+        self.assertEqual(sales_report('day')[0]['orders'], 5)
+
+    def test_rebuild_does_not_wait_for_other_days(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+
+        def rebuild_today():
+            try:
+                return rebuild_range(today, today)
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            lock_days(yesterday, yesterday)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                self.assertEqual(executor.submit(rebuild_today).result(timeout=10), 0)
+
+                def try_lock(day):
+                    try:
+                        with connection.cursor() as cursor:
+                            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [ROLLUP_LOCK_KEY, day.toordinal()])
+                            return cursor.fetchone()[0]
+                    finally:
+                        connection.close()
+
+                self.assertFalse(executor.submit(try_lock, yesterday).result(timeout=10))
+
+    def test_parallel_idempotent_cart_adds_do_not_overbook(self):
+        product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=self.stock)
+        users = [User.objects.create_user(phone=f'99890{number:07d}', name='Xaridor')
+                 for number in range(self.checkouts)]
+
+        def add_to_cart(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                return client.post('/order/cart-items/', {'product': product.id, 'quantity': 1},
+                                   HTTP_IDEMPOTENCY_KEY=f'cart-{user.id}').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            statuses = list(executor.map(add_to_cart, users))
+
+        # reserve() qulfsiz: parallel so'rovlar ba'zan ikkalasi ham chekinadi, lekin qoldiqdan ortiq bron bo'lmaydi
+        self.assertLessEqual(statuses.count(201), self.stock)
+        self.assertEqual(StockReservation.objects.filter(product=product).count(), statuses.count(201))
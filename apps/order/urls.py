@@ -5,7 +5,9 @@ from apps.order.views import (
     CheckPromo,
     PromoCreateView,
     CartItemViewSet,
-    OrderViewSet, OrderPDFView, MarkOrderAsDelivered,
+    OrderViewSet, OrderPDFView, MarkOrderAsDelivered, OrderReceiptExportView,
+    CourierPositionView, NearestCouriersView, DispatchWavesView, CourierRouteView,
+    SalesReportView, OrderExportView,
 )
 
 router = DefaultRouter()
@@ -17,6 +19,13 @@ urlpatterns = [
     path('check_promo/', CheckPromo.as_view()),
     path('promo/create/', PromoCreateView.as_view(), name='promo-create'),
     path('order/<int:order_id>/receipt/', OrderPDFView.as_view(), name='order-pdf'),
+    path('order/<int:order_id>/nearest_couriers/', NearestCouriersView.as_view(), name='order-nearest-couriers'),
+    path('courier/position/', CourierPositionView.as_view(), name='courier-position'),
+    path('courier/route/', CourierRouteView.as_view(), name='courier-route'),
+    path('dispatch/waves/', DispatchWavesView.as_view(), name='dispatch-waves'),
+    path('reports/sales/', SalesReportView.as_view(), name='sales-report'),
+    path('orders/export/', OrderExportView.as_view(), name='orders-export'),
+    path('receipts/export/', OrderReceiptExportView.as_view(), name='order-receipts-export'),
     path('orders/mark_as_delivered/<int:pk>/', MarkOrderAsDelivered.as_view(), name='mark_as_delivered'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -9,6 +9,23 @@ from reportlab.lib.styles import getSampleStyleSheet
 def generate_receipt_pdf(order_data):
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
+    draw_receipt(c, order_data)
+    c.save()
+
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def generate_receipts_pdf(orders_data, file):
+    """Bir nechta chekni bitta ko'p sahifali PDF qilib file ga yozadi (har bir buyurtma alohida sahifada)."""
+    c = canvas.Canvas(file, pagesize=A4)
+    for order_data in orders_data:
+        draw_receipt(c, order_data)
+    c.save()
+
+
+def draw_receipt(c, order_data):
     width, height = A4
     styles = getSampleStyleSheet()
 
@@ -22,6 +39,8 @@ def generate_receipt_pdf(order_data):
     c.drawString(1 * inch, height - 1.8 * inch, f"User: {order_data['user']}")
     c.drawString(1 * inch, height - 2.1 * inch, f"Order Date: {order_data['order_date']}")
     c.drawString(1 * inch, height - 2.4 * inch, f"Total Amount: ${order_data['amount']}")
+    if order_data.get('promo'):
+        c.drawString(1 * inch, height - 2.7 * inch, f"Promo: {order_data['promo']} (-${order_data['discount']})")
 
     # Mahsulotlar jadvali ma'lumotlarini tayyorlash
     data = [["Product Name", "Description", "Quantity", "Unit Price", "Total Price"]]
@@ -30,6 +49,7 @@ def generate_receipt_pdf(order_data):
             item['name'],
             item.get('description', 'No description'),  # Tavsif yoki `No description`
             str(item['quantity']),
+            f"${item.get('unit_price', '')}",
             f"${item['price']}"
         ])
 
@@ -50,10 +70,5 @@ def generate_receipt_pdf(order_data):
     table.wrapOn(c, width, height)
     table.drawOn(c, 1 * inch, height - 5 * inch)
 
-    # PDF-ni yakunlash
+    # Sahifani yakunlash
     c.showPage()
-    c.save()
-
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
\ No newline at end of file
@@ -1,5 +1,12 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from rest_framework import viewsets, generics, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
@@ -8,15 +15,32 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from apps.order.models import (
     Order,
     CartItem,
-    Promo
+    Promo,
+    Courier,
 )
+from apps.order.dispatch import nearest_couriers, update_courier_position
+from apps.order.idempotency import idempotent
+from apps.order.exports import orders_export_response
+from apps.order.filters import OrderExportFilter
+from apps.order.reports import sales_report
+from apps.order.routing import courier_route, dispatch_waves
+from apps.order.receipts import (EXPORT_PDF_MAX_ORDERS, receipts_pdf_response, receipts_zip_response,
+                                 schedule_receipt)
 from apps.order.serializers import (PromoSerializer,
                                     PromoPostSerializer,
                                     CartItemSerializer, CartItemPostSerializer,
                                     OrderSerializer,
-                                    OrderPostSerializer
+                                    OrderPostSerializer,
+                                    CourierPositionSerializer,
+                                    RouteOrderSerializer,
+                                    SalesReportQuerySerializer,
                                     )
+from apps.product.leaderboards import record_sales
+from apps.product.reservations import release, reserve_at_least
+from apps.product.models import Product
 from apps.product.utils import CreateViewSetMixin
+from config.exports import EXPORT_FORMATS
+from config.pagination import KeysetPagination
 
 
 class PromoCreateView(generics.CreateAPIView):
@@ -30,10 +54,12 @@ class PromoCreateView(generics.CreateAPIView):
 
 
 class CheckPromo(generics.ListCreateAPIView):
-    queryset = Promo.objects.all()
     serializer_class = PromoSerializer
     permission_classes = (IsAuthenticated,)
 
+    def get_queryset(self):
+        return Promo.objects.active()
+
     def post(self, request):
         user = request.user
 
@@ -49,9 +75,16 @@ class CartItemViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
     serializer_post_class = CartItemPostSerializer
     queryset = CartItem.objects.all()
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return CartItem.objects.filter(user=self.request.user)
+        return CartItem.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('product', queryset=Product.objects.for_listing())
+        )
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -59,6 +92,7 @@ class CartItemViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
         return Response({'deleted': True}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['delete'], url_path='clear-cart')
+    @idempotent
     def clear_cart(self, request):
         user_cart_items = self.get_queryset()
         deleted_count = user_cart_items.count()
@@ -73,10 +107,14 @@ class OrderViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     model = Order
     serializer_post_class = OrderPostSerializer
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related('user').prefetch_related('lines')
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('-created_date', 'id')
+    filterset_fields = {'total': ['gte', 'lte']}
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         items_raw = request.data.get("items", [])
         if isinstance(items_raw, list):
@@ -91,30 +129,44 @@ class OrderViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
         data.setlist("items", [str(i) for i in items_list])
         data["user"] = request.user.id
 
+        quantities = defaultdict(int)
+        for product_id, quantity in CartItem.objects.filter(id__in=items_list).values_list('product_id', 'quantity'):
+            if product_id is None:
+                raise ValidationError("Savatchadagi mahsulot mavjud emas.")
+            quantities[product_id] += quantity
+
+        # Rasmiylashtirish boshlanishida bron buyurtma miqdorini qoplashi tekshiriladi, qoldiq yetmasa darhol xabar
+        # beriladi. Savatchada qoladigan qatorlar broni kamaytirilmaydi
+        for product_id in sorted(quantities):
+            if not reserve_at_least(request.user.id, product_id, quantities[product_id]):
+                product = Product.objects.with_reserved().get(pk=product_id)
+                raise ValidationError(
+                    f"{product.name} mahsulotidan yetarli miqdorda mavjud emas. "
+                    f"Qoldiq: {product.available_quantity} ta."
+                )
+
         serializer = self.get_serializer(data=data, context={'request': request})
-        if serializer.is_valid():
-            order = serializer.save()
-
-            # Mahsulot miqdorini kamaytirish
-            cart_items = CartItem.objects.filter(id__in=items_list)
-            if cart_items.count() != len(items_list):
-                order.delete()
-                raise ValidationError("Ba'zi itemlar mavjud emas yoki noto‘g‘ri ID berilgan.")
-
-            for item in cart_items:
-                product = item.product
-                if item.quantity > product.quantity:
-                    order.delete()
-                    raise ValidationError(
-                        f"{product.name} mahsulotidan yetarli miqdorda mavjud emas. "
-                        f"Qoldiq: {product.quantity} ta."
-                    )
-                product.quantity -= item.quantity
-                product.save()
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Buyurtma, promo va qoldiqlar bitta tranzaksiyada: xato bo'lsa hammasi bekor qilinadi
+        with transaction.atomic():
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+            try:
+                shortages = Product.objects.take_stock(quantities)
+            except Product.DoesNotExist:
+                raise ValidationError("Savatchadagi mahsulot mavjud emas.")
+            if shortages:
+                product = shortages[0]
+                raise ValidationError(
+                    f"{product.name} mahsulotidan yetarli miqdorda mavjud emas. "
+                    f"Qoldiq: {product.quantity} ta."
+                )
+            record_sales(quantities)
+            # Buyurtmaga kirgan qatorlar savatchadan chiqdi, bron savatchada qolgan miqdorgacha tushiriladi
+            release(request.user.id, {product_id: CartItem.cart_quantity(request.user.id, product_id)
+                                      for product_id in quantities})
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def get_queryset(self):
         # Agar foydalanuvchi superuser bo'lsa, barcha orderlarni qaytaramiz
@@ -141,23 +193,86 @@ class OrderViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
         instance.delete()
 
 
-class OrderPDFView(APIView):
-    def get(self, request, order_id):
-        try:
-            # Orderni topish
-            order = Order.objects.get(id=order_id)
+def receipt_response(request, order):
+    """
+    Tayyor chek fayldan o'qib beriladi (ETag bilan), tayyor bo'lmasa fonda yaratishga qo'yiladi va 202 qaytariladi.
+    """
+    digest, path, ready = schedule_receipt(order)
+    etag = f'"{digest}"'
+    if not ready:
+        response = Response({'detail': "Chek tayyorlanmoqda, birozdan keyin qayta so'rang."},
+                            status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = '2'
+        return response
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(default_storage.open(path, 'rb'), content_type='application/pdf', as_attachment=True,
+                                filename=f'order_{order.id}_receipt.pdf')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
-            # Agar order yetkazilgan bo'lsa, PDFni generate qilamiz
-            if order.is_delivered:
-                pdf_response = order.generate_pdf_receipt  # Bu yerda modelning metodini chaqiramiz
-                return pdf_response  # PDFni qaytaramiz
 
-            # Agar order hali yetkazilmagan bo'lsa, 404 yoki mos javob qaytarish
-            return Response({"detail": "Order not delivered yet."}, status=status.HTTP_400_BAD_REQUEST)
+class OrderPDFView(APIView):
+    permission_classes = [IsAuthenticated]
 
+    def get(self, request, order_id):
+        orders = Order.objects.select_related('user').prefetch_related('lines')
+        if not request.user.is_staff:
+            orders = orders.filter(user=request.user)
+        try:
+            order = orders.get(id=order_id)
         except Order.DoesNotExist:
             return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
 
+        # Agar order hali yetkazilmagan bo'lsa, chek berilmaydi
+        if order.status != 'delivered':
+            return Response({"detail": "Order not delivered yet."}, status=status.HTTP_400_BAD_REQUEST)
+        return receipt_response(request, order)
+
+
+class OrderReceiptExportView(APIView):
+    """
+    Filtrlangan buyurtmalar cheklari: ?output=zip (har bir chek alohida PDF, default) yoki ?output=pdf (bitta PDF).
+    Filtrlar: date_from, date_to, status, courier.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filterset = OrderExportFilter(request.query_params, queryset=Order.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        orders = filterset.qs
+        output = request.query_params.get('output', 'zip')
+        if output == 'zip':
+            return receipts_zip_response(orders)
+        if output == 'pdf':
+            if orders.count() > EXPORT_PDF_MAX_ORDERS:
+                return Response({'detail': f"Bitta PDF ga ko'pi bilan {EXPORT_PDF_MAX_ORDERS} ta buyurtma sig'adi, "
+                                           f"ko'proq buyurtma uchun output=zip dan foydalaning."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return receipts_pdf_response(orders)
+        return Response({'detail': "output faqat zip yoki pdf bo'lishi mumkin."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class OrderExportView(APIView):
+    """
+    Filtrlangan buyurtmalar qatorlari bilan: ?output=csv (default) yoki ?output=xlsx.
+    Filtrlar: date_from, date_to, status, courier.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filterset = OrderExportFilter(request.query_params, queryset=Order.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'detail': "output faqat csv yoki xlsx bo'lishi mumkin."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return orders_export_response(filterset.qs, output)
+
 
 class MarkOrderAsDelivered(APIView):
     permission_classes = [IsAuthenticated]  # Foydalanuvchi autentifikatsiyalangan bo'lishi kerak
@@ -165,13 +280,90 @@ class MarkOrderAsDelivered(APIView):
     def patch(self, request, pk=None):
         try:
             # Orderni topish (faqat o'z foydalanuvchisining ordersini topish)
-            order = Order.objects.get(pk=pk, user=request.user)
-            order.is_delivered = True
-            order.save()
-            # Endi PDFni generate qilamiz
-            pdf_response = order.generate_pdf_receipt  # Bu yerda modelning metodini chaqiramiz
-
-            # PDFni qaytarish
-            return pdf_response
+            order = Order.objects.select_related('user').prefetch_related('lines').get(pk=pk, user=request.user)
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        order.status = 'delivered'
+        order.save()
+        # Chek fonda yaratiladi
+        return receipt_response(request, order)
+
+
+class CourierPositionView(APIView):
+    """Kuryer ilovasi joriy joylashuvni yuboradi."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        courier = Courier.objects.filter(user=request.user).first()
+        if courier is None:
+            return Response({'detail': "Siz kuryer emassiz."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = CourierPositionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        update_courier_position(courier, serializer.validated_data['latitude'], serializer.validated_data['longitude'])
+        return Response({'latitude': courier.latitude, 'longitude': courier.longitude,
+                         'position_date': courier.position_date})
+
+
+class NearestCouriersView(APIView):
+    """Buyurtma manziliga eng yaqin bo'sh kuryerlar (?n=5)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, order_id):
+        order = Order.objects.filter(id=order_id).only('id', 'location_data').first()
+        if order is None:
+            return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            n = min(max(int(request.query_params.get('n', 5)), 1), 50)
+        except ValueError:
+            n = 5
+        found = nearest_couriers(order, n)
+        couriers = Courier.objects.select_related('user').in_bulk([courier_id for courier_id, _ in found])
+        return Response([
+            {'id': courier_id, 'name': couriers[courier_id].user.name, 'phone': couriers[courier_id].phone,
+             'distance_km': round(distance, 3)}
+            for courier_id, distance in found if courier_id in couriers
+        ])
+
+
+class DispatchWavesView(APIView):
+    """Kuryeri yo'q buyurtmalarni yaqinligi bo'yicha guruhlab bo'sh kuryerlarga marshrut tartibida biriktiradi."""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        waves = dispatch_waves()
+        return Response({'assigned': sum(len(ids) for ids in waves.values()),
+                         'routes': [{'courier': courier_id, 'orders': ids} for courier_id, ids in waves.items()]})
+
+
+class SalesReportView(APIView):
+    """
+    Savdo hisoboti kunlik yig'indilardan: ?group=day|product|category|courier|promo, date_from, date_to
+    (standart - oxirgi 30 kun) va limit.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        serializer = SalesReportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        return Response(sales_report(params['group'], params.get('date_from'), params.get('date_to'), params['limit']))
+
+
+class CourierRouteView(APIView):
+    """
+    GET - kuryerning yetkazilayotgan buyurtmalari joriy joylashuvidan boshlab yetkazish tartibida (bazaga yozmaydi).
+    POST - shu tartibni marshrut sifatida saqlaydi.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def route(self, request, save):
+        courier = Courier.objects.filter(user=request.user).first()
+        if courier is None:
+            return Response({'detail': "Siz kuryer emassiz."}, status=status.HTTP_403_FORBIDDEN)
+        return Response(RouteOrderSerializer(courier_route(courier, save=save), many=True).data)
+
+    def get(self, request):
+        return self.route(request, save=False)
+
+    def post(self, request):
+        return self.route(request, save=True)
@@ -13,6 +13,7 @@ from apps.product.models import (
     Comment,
     CommentImage,
 )
+from apps.product.exports import price_list_response
 from django.utils.safestring import mark_safe
 from decimal import Decimal
 
@@ -59,6 +60,15 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('name', 'category__name')
     list_filter = ('category',)
     autocomplete_fields = ('category',)
+    actions = ('export_price_list_csv', 'export_price_list_xlsx')
+
+    @admin.action(description="Narxlar ro'yxatini yuklab olish (CSV)")
+    def export_price_list_csv(self, request, queryset):
+        return price_list_response(queryset, 'csv')
+
+    @admin.action(description="Narxlar ro'yxatini yuklab olish (XLSX)")
+    def export_price_list_xlsx(self, request, queryset):
+        return price_list_response(queryset, 'xlsx')
 
     def discounted_price(self, obj):
         if obj.discount:  # Agar chegirma mavjud bo‘lsa
@@ -0,0 +1,20 @@
+from config.exports import EXPORT_CHUNK_SIZE, export_response
+
+PRODUCT_EXPORT_FIELDS = (
+    ('product_id', 'id'),
+    ('name', 'name'),
+    ('category', 'category__name'),
+    ('price', 'price'),
+    ('discount', 'discount'),
+    ('quantity', 'quantity'),
+)
+
+
+def product_rows(products, chunk_size=EXPORT_CHUNK_SIZE):
+    return products.order_by('id').values_list(
+        *(field for _, field in PRODUCT_EXPORT_FIELDS)).iterator(chunk_size=chunk_size)
+
+
+def price_list_response(products, output='csv', filename='price_list'):
+    return export_response(output, [name for name, _ in PRODUCT_EXPORT_FIELDS], product_rows(products), filename,
+                           sheet_name='Price list')
@@ -0,0 +1,45 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from rest_framework.filters import SearchFilter
+
+SEARCH_CONFIG = 'simple'
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Product.search_vector (GIN) bo'yicha to'liq matnli qidiruv va nom bo'yicha trigram (pg_trgm)
+    o'xshashlik. Natijalar moslik darajasi bo'yicha tartiblanadi.
+    PostgreSQL bo'lmagan bazalarda oddiy SearchFilter kabi ishlaydi.
+    """
+
+    def get_search_words(self, request):
+        words = []
+        for term in self.get_search_terms(request):
+            words.extend(re.findall(r'\w+', term))
+        return words
+
+    def filter_queryset(self, request, queryset, view):
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        words = self.get_search_words(request)
+        if not words:
+            return queryset
+        return search_products(queryset, words)
+
+
+def search_products(queryset, words):
+    # Har bir so'z prefiks sifatida qidiriladi: "sut olm" -> 'sut':* & 'olm':*
+    query = SearchQuery(' & '.join(f"'{word}':*" for word in words), config=SEARCH_CONFIG, search_type='raw')
+    text = ' '.join(words)
+    return queryset.filter(
+        Q(search_vector=query) | Q(name__trigram_similar=text)
+    ).annotate(
+        # real (float4) matn orqali Python float ga aniq qaytmaydi, keyset kursori esa qiymatni aynan solishtiradi,
+        # shuning uchun double precision ga o'tkaziladi
+        search_rank=Cast(SearchRank(F('search_vector'), query) + TrigramSimilarity('name', text), FloatField()),
+    ).order_by('-search_rank', 'id')
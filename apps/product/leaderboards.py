@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Category, Leaderboard, Product, ProductSalesDay
+
+LEADERBOARD_SIZE = getattr(settings, 'LEADERBOARD_SIZE', 100)
+# Beat ishlamay qolsa ham reyting shundan eskirmaydi: eski qator o'qilganda shu yerning o'zida qayta quriladi
+LEADERBOARD_MAX_AGE = timedelta(seconds=getattr(settings, 'LEADERBOARD_MAX_AGE', 30 * 60))
+# Oyna uzunligi kunlarda, None - butun davr
+WINDOW_DAYS = {'day': 1, 'week': 7, 'all': None}
+
+
+def record_sales(quantities):
+    """
+    Buyurtma berilganda kunlik ProductSalesDay hisoblagichlarini oshiradi
+    (Product.sold_count esa Product.objects.take_stock() da qoldiq bilan birga yangilanadi).
+    quantities - {product_id: miqdor}. Qulflar bir xil tartibda olinishi uchun id bo'yicha saralanadi.
+    """
+    day = timezone.localdate()
+    for product_id, quantity in sorted(quantities.items()):
+        if quantity <= 0:
+            continue
+        updated = ProductSalesDay.objects.filter(product_id=product_id, day=day).update(
+            quantity=F('quantity') + quantity)
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                ProductSalesDay.objects.create(product_id=product_id, day=day, quantity=quantity)
+        except IntegrityError:
+            # Parallel so'rov qatorni birinchi yaratib qo'ygan
+            ProductSalesDay.objects.filter(product_id=product_id, day=day).update(
+                quantity=F('quantity') + quantity)
+
+
+def build_product_ids(kind, window, category=None, size=LEADERBOARD_SIZE):
+    queryset = Product.objects.all()
+    if category is not None:
+        # Kategoriya va uning barcha ichki kategoriyalari
+        queryset = queryset.filter(category__path__startswith=category.path)
+
+    days = WINDOW_DAYS[window]
+    since = timezone.localdate() - timedelta(days=days - 1) if days else None
+
+    if kind == Leaderboard.NEWLY_ADDED:
+        if since is not None:
+            queryset = queryset.filter(created_date__gte=since)
+        return list(queryset.order_by('-created_date', 'id').values_list('id', flat=True)[:size])
+
+    if since is None:
+        return list(queryset.order_by('-sold_count', 'id').values_list('id', flat=True)[:size])
+
+    rows = ProductSalesDay.objects.filter(day__gte=since, product__in=queryset).values('product').annotate(
+        total=Sum('quantity')).filter(total__gt=0).order_by('-total', 'product')
+    return [row['product'] for row in rows[:size]]
+
+
+def refresh_leaderboards(size=LEADERBOARD_SIZE):
+    categories = [None, *Category.objects.only('id', 'path')]
+    count = 0
+    for category in categories:
+        for kind, _ in Leaderboard.KIND_CHOICES:
+            for window in WINDOW_DAYS:
+                Leaderboard.objects.update_or_create(
+                    kind=kind, window=window, category=category,
+                    defaults={'product_ids': build_product_ids(kind, window, category, size)},
+                )
+                count += 1
+    return count
+
+
+def get_leaderboard_ids(kind, window, category=None):
+    board = Leaderboard.objects.filter(kind=kind, window=window, category=category).values_list(
+        'product_ids', 'computed_date').first()
+    if board is None:
+        # Jadval hali to'ldirilmagan (yangi kategoriya yoki birinchi ishga tushirish)
+        return build_product_ids(kind, window, category)
+    product_ids, computed_date = board
+    if computed_date < timezone.now() - LEADERBOARD_MAX_AGE:
+        product_ids = build_product_ids(kind, window, category)
+        Leaderboard.objects.filter(kind=kind, window=window, category=category).update(
+            product_ids=product_ids, computed_date=timezone.now())
+    return product_ids
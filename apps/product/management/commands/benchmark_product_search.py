@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apps.product.filters import search_products
+from apps.product.models import Category, Product
+
+WORDS = [
+    'sut', 'qatiq', 'pishloq', 'non', 'guruch', 'un', 'shakar', 'tuz', 'choy', 'qahva', 'yog', 'olma',
+    'anor', 'uzum', 'kartoshka', 'piyoz', 'sabzi', 'pomidor', 'bodring', 'tuxum', 'kolbasa', 'tovuq',
+    'makaron', 'sharbat', 'suv', 'shokolad', 'pechenye', 'konfet', 'sovun', 'shampun',
+]
+
+
+class Command(BaseCommand):
+    help = "Mahsulot qidiruvini eski ILIKE filtri va yangi tsvector/trigram filtri bilan solishtiradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', action='store_true', help="Yetishmagan mahsulotlarni sun'iy ma'lumot bilan yaratish")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['products'])
+
+        rng = random.Random(0)
+        terms = [' '.join(rng.sample(WORDS, rng.choice((1, 2)))) for _ in range(options['queries'])]
+
+        def ilike(term):
+            queryset = Product.objects.all()
+            for word in term.split():
+                queryset = queryset.filter(Q(name__icontains=word))
+            return queryset
+
+        def fulltext(term):
+            return search_products(Product.objects.all(), term.split())
+
+        self.stdout.write(f'{Product.objects.count()} ta mahsulot, {len(terms)} ta so\'rov')
+        for label, build in (('ILIKE (SearchFilter)', ilike), ('tsvector + trigram', fulltext)):
+            timings = []
+            for term in terms:
+                started = time.perf_counter()
+                queryset = build(term)
+                queryset.count()
+                list(queryset[:options['limit']])
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f'{label:<22} p50={statistics.median(timings):.1f}ms p95={p95:.1f}ms max={timings[-1]:.1f}ms')
+
+    def seed(self, total):
+        missing = total - Product.objects.count()
+        if missing <= 0:
+            return
+        rng = random.Random(1)
+        categories = [Category.objects.get_or_create(name=f'Benchmark {word}')[0] for word in WORDS[:10]]
+        chunk = 10_000
+        created = 0
+        while created < missing:
+            size = min(chunk, missing - created)
+            Product.objects.bulk_create([
+                Product(
+                    name=' '.join(rng.sample(WORDS, 3)) + f' {created + i}',
+                    description=' '.join(rng.choices(WORDS, k=12)),
+                    category=rng.choice(categories),
+                    price=rng.randint(1000, 100000),
+                    discount=0,
+                ) for i in range(size)
+            ])
+            created += size
+            self.stdout.write(f'{created}/{missing} ta mahsulot yaratildi')
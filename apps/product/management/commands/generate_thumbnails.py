@@ -0,0 +1,44 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from apps.account.models import Banner, User
+from apps.product.models import Category, ProductImage
+from config.thumbnails import generate_thumbnails
+from config.workers import BACKGROUND_WORKERS, init_worker
+
+SOURCES = (
+    (ProductImage, 'image'),
+    (Category, 'image'),
+    (Banner, 'image'),
+    (User, 'avatar'),
+)
+
+
+class Command(BaseCommand):
+    help = "Mavjud rasmlar uchun thumbnaillarni (WebP va JPEG) parallel ravishda yaratadi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=max(BACKGROUND_WORKERS, 1))
+        parser.add_argument('--force', action='store_true', help="Mavjud thumbnaillarni ham qayta yaratish")
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, field_name in SOURCES:
+            names.update(model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                         .values_list(field_name, flat=True))
+
+        created = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+            futures = {executor.submit(generate_thumbnails, name, options['force']): name for name in sorted(names)}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    created += future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {exc}')
+                if done % 100 == 0:
+                    self.stdout.write(f'{done}/{len(futures)} ta rasm tekshirildi')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Tayyor: {len(names)} ta rasm, {created} ta thumbnail yaratildi, {failed} ta xato'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Product.rank_sum, rank_count va baholar gistogrammasini Rank jadvalidan qayta hisoblaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                Product.objects.filter(id__in=ids).select_for_update().rebuild_rank_stats()
+            last_id = ids[-1]
+            total += len(ids)
+            self.stdout.write(f'{total} ta mahsulot qayta hisoblandi')
+        self.stdout.write(self.style.SUCCESS(f'Tayyor: {total} ta mahsulot'))
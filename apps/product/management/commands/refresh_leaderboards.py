@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.leaderboards import LEADERBOARD_SIZE, refresh_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Eng ko'p sotilgan va yangi qo'shilgan mahsulotlar reytinglarini qayta hisoblaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=LEADERBOARD_SIZE)
+
+    def handle(self, *args, **options):
+        count = refresh_leaderboards(options['size'])
+        self.stdout.write(self.style.SUCCESS(f'Tayyor: {count} ta reyting yangilandi'))
@@ -0,0 +1,115 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_ranks(apps, schema_editor):
+    Rank = apps.get_model('product', 'Rank')
+    duplicates = (Rank.objects.filter(user__isnull=False, product__isnull=False).order_by()
+                  .values('user_id', 'product_id').annotate(total=Count('id'), last_id=Max('id'))
+                  .filter(total__gt=1))
+    for row in duplicates.iterator():
+        # Eng oxirgi qo'yilgan baho qoladi
+        (Rank.objects.filter(user_id=row['user_id'], product_id=row['product_id'])
+         .exclude(id=row['last_id']).delete())
+
+
+def fill_rank_stats(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    Rank = apps.get_model('product', 'Rank')
+    fields = ['rank_sum', 'rank_count'] + [f'rank_count_{value}' for value in range(1, 11)]
+    last_id = 0
+    while True:
+        products = {product.id: product for product in
+                    Product.objects.filter(id__gt=last_id).order_by('id').only('id', *fields)[:1000]}
+        if not products:
+            break
+        rows = (Rank.objects.filter(product_id__in=products).order_by()
+                .values('product_id', 'rank').annotate(total=Count('id')))
+        for row in rows:
+            product = products[row['product_id']]
+            product.rank_sum += row['rank'] * row['total']
+            product.rank_count += row['total']
+            if 1 <= row['rank'] <= 10:
+                setattr(product, f"rank_count_{row['rank']}", row['total'])
+        Product.objects.bulk_update(products.values(), fields)
+        last_id = max(products)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0013_remove_product_unit_product_worth'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rank_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_10',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_6',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_7',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_8',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_count_9',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rank_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(remove_duplicate_ranks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rank',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_user_product_rank'),
+        ),
+        migrations.RunPython(fill_rank_stats, migrations.RunPython.noop),
+    ]
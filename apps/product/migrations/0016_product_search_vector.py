@@ -0,0 +1,78 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:13
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Mahsulot nomi (A), tavsifi (B) va kategoriya nomi (C) bitta tsvector ga yig'iladi.
+# Kategoriya nomi o'zgarsa, uning mahsulotlari ham qayta hisoblanadi.
+SEARCH_VECTOR_SQL = '''
+CREATE OR REPLACE FUNCTION product_search_vector(p_name text, p_description text, p_category_id bigint)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(p_name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(p_description, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(
+               (SELECT name FROM product_category WHERE id = p_category_id), '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION product_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := product_search_vector(NEW.name, NEW.description, NEW.category_id);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER product_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, description, category_id ON product_product
+    FOR EACH ROW EXECUTE FUNCTION product_search_vector_trigger();
+
+CREATE OR REPLACE FUNCTION category_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE product_product
+       SET search_vector = product_search_vector(name, description, category_id)
+     WHERE category_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER category_search_vector_update
+    AFTER UPDATE OF name ON product_category
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION category_search_vector_trigger();
+
+UPDATE product_product SET search_vector = product_search_vector(name, description, category_id);
+'''
+
+DROP_SEARCH_VECTOR_SQL = '''
+DROP TRIGGER IF EXISTS category_search_vector_update ON product_category;
+DROP TRIGGER IF EXISTS product_search_vector_update ON product_product;
+DROP FUNCTION IF EXISTS category_search_vector_trigger();
+DROP FUNCTION IF EXISTS product_search_vector_trigger();
+DROP FUNCTION IF EXISTS product_search_vector(text, text, bigint);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0015_category_path'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_SQL, DROP_SEARCH_VECTOR_SQL),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0017_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('best_selling', 'Best selling'), ('newly_added', 'Newly added')], max_length=20)),
+                ('window', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('all', 'All time')], default='all', max_length=10)),
+                ('product_ids', models.JSONField(default=list)),
+                ('computed_date', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='product.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'window', 'category'), name='unique_leaderboard'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('kind', 'window'), name='unique_leaderboard_all_categories')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='product.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'product'], name='product_sales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='unique_product_sales_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0019_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_views_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-views', 'id'], name='product_views_desc_id_idx'),
+        ),
+    ]
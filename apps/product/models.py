@@ -1,23 +1,110 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Concat, Now, StrIndex, Substr
+from django.db.models.signals import post_save, post_delete
 from django.utils.translation import gettext_lazy as _
 from apps.account.models import User
+from config.cache import invalidate_on_change
+from config.thumbnails import thumbnails_on_save
+
+
+def category_path_segment(pk):
+    return f'{pk:010d}/'
+
+
+class CategoryQuerySet(models.QuerySet):
+    def attach_tree(self, roots):
+        # Berilgan kategoriyalarning barcha avlodlarini bitta so'rov bilan olib, daraxtni xotirada quramiz
+        roots = list(roots)
+        if not roots:
+            return roots
+        nodes = {}
+        lookup = Q()
+        for root in roots:
+            root.tree_children = []
+            nodes[root.id] = root
+            lookup |= Q(path__startswith=root.path)
+        for node in self.filter(lookup).exclude(id__in=nodes).order_by('path'):
+            node.tree_children = []
+            nodes[node.id] = node
+            if node.parent_id in nodes:
+                nodes[node.parent_id].tree_children.append(node)
+        return roots
+
+    def rebuild_paths(self):
+        parents = dict(self.model.objects.values_list('id', 'parent_id'))
+        paths = {}
+
+        def build(pk, seen=()):
+            if pk not in paths:
+                parent_id = parents.get(pk)
+                if parent_id is None or parent_id in seen:
+                    paths[pk] = category_path_segment(pk)
+                else:
+                    paths[pk] = build(parent_id, seen + (pk,)) + category_path_segment(pk)
+            return paths[pk]
+
+        categories = list(self.only('id', 'path'))
+        for category in categories:
+            category.path = build(category.id)
+        return self.model.objects.bulk_update(categories, ['path'], batch_size=1000)
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.SET_NULL)
     image = models.ImageField(upload_to='categories/', null=True, blank=True)
+    # Ildizdan shu kategoriyagacha bo'lgan id lar: "0000000001/0000000007/"
+    path = models.CharField(max_length=255, default='', editable=False)
     created_date = models.DateField(auto_now_add=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ('id',)
+        indexes = [
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def can_move_to(self, parent_id, parent_path):
+        if not self.pk or parent_id is None:
+            return True
+        return parent_id != self.pk and not (self.path and parent_path.startswith(self.path))
+
+    def clean(self):
+        super().clean()
+        if self.parent_id and not self.can_move_to(self.parent_id, self.parent.path):
+            raise ValidationError({'parent': _("Kategoriyani o'zining ichki kategoriyasiga ko'chirib bo'lmaydi.")})
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            parent_path = ''
+            if self.parent_id:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+                if not self.can_move_to(self.parent_id, parent_path):
+                    raise ValidationError(_("Kategoriyani o'zining ichki kategoriyasiga ko'chirib bo'lmaydi."))
+            super().save(*args, **kwargs)
+
+            old_path = self.path
+            self.path = parent_path + category_path_segment(self.pk)
+            if self.path != old_path:
+                Category.objects.filter(pk=self.pk).update(path=self.path)
+                if old_path:
+                    # Ko'chirilgan kategoriyaning barcha avlodlari yangi yo'lga o'tkaziladi
+                    Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                        path=Concat(Value(self.path), Substr('path', len(old_path) + 1))
+                    )
+
+    def get_descendants(self):
+        return Category.objects.filter(path__startswith=self.path).exclude(pk=self.pk)
 
 
 class Tag(models.Model):
@@ -27,6 +114,66 @@ class Tag(models.Model):
         return self.name
 
 
+RANK_VALUES = range(1, 11)
+
+
+class ProductQuerySet(models.QuerySet):
+    def for_listing(self):
+        # Layklar subquery orqali olinadi, shunda har bir qator uchun alohida so'rov bo'lmaydi
+        likes = Like.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        return self.select_related('category').prefetch_related('images').annotate(
+            likes_total=Coalesce(Subquery(likes.annotate(value=Count('pk')).values('value')), 0),
+        ).with_reserved()
+
+    def with_reserved(self):
+        # Faol (muddati o'tmagan) bronlar yig'indisi (product, expire_date) indeksi orqali olinadi
+        reservations = StockReservation.objects.active().filter(product=OuterRef('pk')).order_by().values('product')
+        return self.annotate(
+            reserved_total=Coalesce(Subquery(reservations.annotate(value=Sum('quantity')).values('value')), 0),
+        )
+
+    def rebuild_rank_stats(self):
+        products = {product.id: product for product in self.only('id')}
+        for product in products.values():
+            product.rank_sum = product.rank_count = 0
+            for value in RANK_VALUES:
+                setattr(product, f'rank_count_{value}', 0)
+
+        rows = (Rank.objects.filter(product_id__in=products).order_by()
+                .values('product_id', 'rank').annotate(total=Count('id')))
+        for row in rows:
+            product = products[row['product_id']]
+            product.rank_sum += row['rank'] * row['total']
+            product.rank_count += row['total']
+            if row['rank'] in RANK_VALUES:
+                setattr(product, f"rank_count_{row['rank']}", row['total'])
+
+        fields = ['rank_sum', 'rank_count'] + [f'rank_count_{value}' for value in RANK_VALUES]
+        return Product.objects.bulk_update(products.values(), fields)
+
+    def take_stock(self, quantities):
+        """
+        quantities - {product_id: miqdor}. Tranzaksiya ichida chaqirilishi kerak.
+        Qatorlar id tartibida qulflanadi (parallel buyurtmalar deadlockka tushmasligi uchun), keyin bitta
+        UPDATE ... SET quantity = quantity - n, sold_count = sold_count + n WHERE quantity >= n bajariladi.
+        Qoldig'i yetmagan mahsulotlar ro'yxati qaytariladi, bu holda hech narsa o'zgartirilmaydi.
+        Mahsulotlardan biri o'chirilgan bo'lsa Product.DoesNotExist ko'tariladi.
+        """
+        ids = sorted(quantities)
+        locked = list(self.filter(pk__in=ids).order_by('pk').select_for_update().only('id', 'name', 'quantity'))
+        if len(locked) != len(ids):
+            raise Product.DoesNotExist
+        shortages = [product for product in locked if product.quantity < quantities[product.pk]]
+        if shortages:
+            return shortages
+        amount = Case(*[When(pk=pk, then=Value(quantities[pk])) for pk in ids], output_field=models.IntegerField())
+        self.filter(pk__in=ids, quantity__gte=amount).update(
+            quantity=F('quantity') - amount,
+            sold_count=F('sold_count') + amount,
+        )
+        return []
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
@@ -38,18 +185,62 @@ class Product(models.Model):
     # tags = models.ManyToManyField(Tag, blank=True)
     quantity = models.PositiveIntegerField(default=0)
     worth = models.CharField(max_length=123, blank=True, null=True)
+    # Rank jadvalidan hisoblangan qiymatlar, Rank o'zgarganda F() orqali yangilanadi
+    rank_sum = models.PositiveIntegerField(default=0, editable=False)
+    rank_count = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_1 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_2 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_3 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_4 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_5 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_6 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_7 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_8 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_9 = models.PositiveIntegerField(default=0, editable=False)
+    rank_count_10 = models.PositiveIntegerField(default=0, editable=False)
+    # name, description va kategoriya nomidan bazadagi trigger orqali to'ldiriladi
+    search_vector = SearchVectorField(null=True, editable=False)
     modified_date = models.DateField(auto_now=True)
     created_date = models.DateField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    # Bazada F() bilan o'zgartiriladigan hisoblagichlar (ko'rishlar bufer flush ida, sotuvlar take_stock da,
+    # baholar Rank signallarida). Obyekt yuklangandan keyin ular o'zgargan bo'lishi mumkin,
+    # shuning uchun to'liq save() ularni eski qiymat bilan bosib ketmasligi uchun yozmaydi
+    COUNTER_FIELDS = ('views', 'sold_count', 'rank_sum', 'rank_count',
+                      *(f'rank_count_{value}' for value in RANK_VALUES))
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            # KeysetPagination tartiblari uchun
+            models.Index(fields=['-sold_count', 'id'], name='product_sold_count_id_idx'),
+            models.Index(fields=['-created_date', 'id'], name='product_created_date_id_idx'),
+            # Indeks yo'nalishi tartib bilan bir xil bo'lishi kerak: (views, id) indeksi (-views, id) ni bermaydi
+            models.Index(fields=['-views', 'id'], name='product_views_desc_id_idx'),
+        ]
+
     def __str__(self):
         return f'{self.name} ({self.id})'
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
     @property
     def average_rank(self) -> float:
-        try:
-            return sum(self.ranks.values_list('rank', flat=True)) / self.ranks.count()
-        except ZeroDivisionError:
+        if not self.rank_count:
             return 0
+        return self.rank_sum / self.rank_count
+
+    @property
+    def rank_histogram(self) -> dict:
+        return {value: getattr(self, f'rank_count_{value}') for value in RANK_VALUES}
 
     # @property
     # def get_quantity(self) -> int:
@@ -59,11 +250,23 @@ class Product(models.Model):
 
     @property
     def get_likes_count(self) -> int:
+        if hasattr(self, 'likes_total'):
+            return self.likes_total
         return self.likes.count()
 
+    @property
+    def reserved_quantity(self) -> int:
+        if hasattr(self, 'reserved_total'):
+            return self.reserved_total
+        return StockReservation.objects.active().filter(product=self).aggregate(total=Sum('quantity'))['total'] or 0
+
+    @property
+    def available_quantity(self) -> int:
+        return max(self.quantity - self.reserved_quantity, 0)
+
     @property
     def is_available(self) -> bool:
-        return self.get_quantity > 0
+        return self.available_quantity > 0
 
     @property
     def has_wishlist(self) -> bool:
@@ -102,6 +305,11 @@ class Wishlist(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='wishlists')
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='wishlist_user_id_idx'),
+        ]
+
     def __str__(self):
         return self.product.name
 
@@ -110,19 +318,41 @@ class Like(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='likes')
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='like_user_id_idx'),
+        ]
+
     def __str__(self):
         return self.product.name
 
 
 class Rank(models.Model):
-    RANK_CHOICE = ((r, r) for r in range(1, 11))
+    RANK_CHOICE = ((r, r) for r in RANK_VALUES)
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='ranks')
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     rank = models.PositiveSmallIntegerField(default=0, choices=RANK_CHOICE, db_index=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_user_product_rank'),
+        ]
+
     def __str__(self):
         return self.product.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'product_id' in instance.__dict__ and 'rank' in instance.__dict__:
+            instance._stored = (instance.product_id, instance.rank)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Product dagi yig'indilar Rank bilan bitta tranzaksiyada yangilanadi
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.SET_NULL)
@@ -145,6 +375,87 @@ class CommentImage(models.Model):
         return self.image.url
 
 
+class StockReservationQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expire_date__gt=Now())
+
+    def expired(self):
+        return self.filter(expire_date__lte=Now())
+
+
+class StockReservation(models.Model):
+    """
+    Savatchadagi mahsulot uchun vaqtinchalik bron. Har bir foydalanuvchida mahsulot bo'yicha bitta qator,
+    quantity - savatdagi umumiy miqdor. Sotuvga ochiq qoldiq = Product.quantity - faol bronlar.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    expire_date = models.DateTimeField()
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    objects = StockReservationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'user'], name='unique_product_user_reservation'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expire_date'], name='reservation_product_expire_idx'),
+            models.Index(fields=['expire_date'], name='reservation_expire_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.quantity} ({self.user_id})'
+
+
+class ProductSalesDay(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_days')
+    day = models.DateField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='unique_product_sales_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'product'], name='product_sales_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} {self.day}: {self.quantity}'
+
+
+class Leaderboard(models.Model):
+    BEST_SELLING = 'best_selling'
+    NEWLY_ADDED = 'newly_added'
+    KIND_CHOICES = (
+        (BEST_SELLING, 'Best selling'),
+        (NEWLY_ADDED, 'Newly added'),
+    )
+    WINDOW_CHOICES = (
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('all', 'All time'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    window = models.CharField(max_length=10, choices=WINDOW_CHOICES, default='all')
+    # null - barcha kategoriyalar bo'yicha
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    product_ids = models.JSONField(default=list)
+    computed_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'window', 'category'], name='unique_leaderboard'),
+            models.UniqueConstraint(fields=['kind', 'window'], condition=Q(category__isnull=True),
+                                    name='unique_leaderboard_all_categories'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} ({self.window}, {self.category_id or "all"})'
+
+
 def comment_post_save(sender, instance, created, **kwargs):
     if created:
         if instance.parent:
@@ -156,3 +467,57 @@ def comment_post_save(sender, instance, created, **kwargs):
 
 
 post_save.connect(comment_post_save, sender=Comment)
+
+
+def apply_rank_change(old, new):
+    # old va new - (product_id, rank) juftliklari yoki None
+    deltas = {}
+    for stored, sign in ((old, -1), (new, 1)):
+        if stored is None or stored[0] is None:
+            continue
+        product_id, value = stored
+        delta = deltas.setdefault(product_id, {'rank_sum': 0, 'rank_count': 0})
+        delta['rank_sum'] += sign * value
+        delta['rank_count'] += sign
+        if value in RANK_VALUES:
+            field = f'rank_count_{value}'
+            delta[field] = delta.get(field, 0) + sign
+
+    for product_id, delta in deltas.items():
+        updates = {field: F(field) + change for field, change in delta.items() if change}
+        if updates:
+            Product.objects.filter(pk=product_id).update(**updates)
+
+
+def rank_post_save(sender, instance, created, **kwargs):
+    new = (instance.product_id, instance.rank)
+    if created or hasattr(instance, '_stored'):
+        apply_rank_change(getattr(instance, '_stored', None), new)
+    elif instance.product_id:
+        # Eski qiymat noma'lum (masalan, defer qilingan), shuning uchun qayta hisoblaymiz
+        Product.objects.filter(pk=instance.product_id).rebuild_rank_stats()
+    instance._stored = new
+
+
+def rank_post_delete(sender, instance, **kwargs):
+    apply_rank_change(getattr(instance, '_stored', (instance.product_id, instance.rank)), None)
+
+
+post_save.connect(rank_post_save, sender=Rank)
+post_delete.connect(rank_post_delete, sender=Rank)
+
+
+def category_post_delete(sender, instance, **kwargs):
+    # Bolalar SET_NULL bilan ildizga aylanadi, shuning uchun avlodlar yo'lidan o'chirilgan qism olib tashlanadi
+    segment = category_path_segment(instance.pk)
+    Category.objects.filter(path__contains=segment).update(
+        path=Substr('path', StrIndex('path', Value(segment)) + len(segment))
+    )
+
+
+post_delete.connect(category_post_delete, sender=Category)
+
+invalidate_on_change(Category)
+
+thumbnails_on_save(Category, 'image')
+thumbnails_on_save(ProductImage, 'image')
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60)
+SWEEP_BATCH_SIZE = 1000
+
+
+def _write(user_id, product_id, quantity, expire_date):
+    if quantity <= 0:
+        StockReservation.objects.filter(user_id=user_id, product_id=product_id).delete()
+        return
+    updated = StockReservation.objects.filter(user_id=user_id, product_id=product_id).update(
+        quantity=quantity, expire_date=expire_date)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            StockReservation.objects.create(user_id=user_id, product_id=product_id, quantity=quantity,
+                                            expire_date=expire_date)
+    except IntegrityError:
+        StockReservation.objects.filter(user_id=user_id, product_id=product_id).update(
+            quantity=quantity, expire_date=expire_date)
+
+
+def is_overbooked(product_id):
+    stock = Product.objects.filter(pk=product_id).values_list('quantity', flat=True).first() or 0
+    reserved = StockReservation.objects.active().filter(product_id=product_id).aggregate(
+        total=Sum('quantity'))['total'] or 0
+    return reserved > stock
+
+
+def reserve(user_id, product_id, quantity, ttl=RESERVATION_TTL):
+    """
+    Foydalanuvchining mahsulot bo'yicha bronini quantity ga tenglaydi va muddatini yangilaydi.
+    Mahsulot qatori qulflanmaydi: avval bron yoziladi, keyin barcha faol bronlar qoldiqqa sig'ishi tekshiriladi,
+    sig'masa eski qiymat qaytariladi. Ikki parallel so'rovdan keyingisi albatta ikkala bronni ham ko'radi,
+    shuning uchun qoldiqdan ortiq bron qilinmaydi. Kafolat uchun tranzaksiyadan tashqarida chaqirilishi kerak.
+    Bron qilingan bo'lsa True qaytaradi.
+    """
+    now = timezone.now()
+    previous = StockReservation.objects.filter(user_id=user_id, product_id=product_id, expire_date__gt=now).values_list(
+        'quantity', 'expire_date').first()
+    _write(user_id, product_id, quantity, now + timedelta(seconds=ttl))
+    if previous is not None and quantity <= previous[0]:
+        return True
+    if is_overbooked(product_id):
+        if previous is None:
+            _write(user_id, product_id, 0, now)
+        else:
+            _write(user_id, product_id, *previous)
+        return False
+    return True
+
+
+def reserve_at_least(user_id, product_id, quantity, ttl=RESERVATION_TTL):
+    """
+    Bron kamida quantity bo'lishini ta'minlaydi. Savatchaning boshqa qatorlari uchun olingan kattaroq bron
+    kamaytirilmaydi, faqat muddati yangilanadi. reserve() kabi tranzaksiyadan tashqarida chaqiriladi.
+    """
+    current = StockReservation.objects.active().filter(user_id=user_id, product_id=product_id).values_list(
+        'quantity', flat=True).first() or 0
+    return reserve(user_id, product_id, max(quantity, current), ttl)
+
+
+def release(user_id, remaining):
+    """
+    Buyurtma rasmiylashtirilgach, bronlar remaining ({product_id: savatchada qolgan miqdor}) gacha tushiriladi.
+    Bron faqat kamayadi: qolgan qatorlar uchun bron yo'q bo'lsa yangisi yaratilmaydi.
+    """
+    for reservation in StockReservation.objects.filter(user_id=user_id, product_id__in=remaining):
+        left = remaining[reservation.product_id]
+        if left <= 0:
+            StockReservation.objects.filter(pk=reservation.pk).delete()
+        elif left < reservation.quantity:
+            StockReservation.objects.filter(pk=reservation.pk).update(quantity=left)
+
+
+def sweep_expired(batch_size=SWEEP_BATCH_SIZE):
+    """Muddati o'tgan bronlarni bo'laklab o'chiradi. O'chirilganlar sonini qaytaradi."""
+    total = 0
+    while True:
+        ids = list(StockReservation.objects.expired().order_by('expire_date').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += StockReservation.objects.filter(id__in=ids).expired().delete()[0]
@@ -1,9 +1,11 @@
 from itertools import product
 from typing import List, Dict
 
+from django.db import transaction
 from django.template.context_processors import request
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
+from config.thumbnails import ThumbnailField, schedule_thumbnails
 from .models import (
     Category,
     Tag,
@@ -21,16 +23,26 @@ from ..account.serializers import UserProfileSerializer
 class CategorySerializer(serializers.ModelSerializer):
     parent = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
     children = serializers.SerializerMethodField()
+    thumbnails = ThumbnailField(source='image')
 
     @extend_schema_field(serializers.ListSerializer(child=serializers.CharField()))
     def get_children(self, obj):
-        if obj.children.exists():
-            return CategorySerializer(obj.children.all(), many=True).data
+        # Category.objects.attach_tree() oldindan yig'ib qo'ygan bo'lsa, bazaga qayta murojaat qilinmaydi
+        children = getattr(obj, 'tree_children', None)
+        if children is None:
+            children = obj.children.all()
+        if children:
+            return CategorySerializer(children, many=True).data
         return []
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'image', 'parent', 'children']
+        fields = ['id', 'name', 'image', 'thumbnails', 'parent', 'children']
+
+    def validate_parent(self, parent):
+        if parent and self.instance and not self.instance.can_move_to(parent.id, parent.path):
+            raise serializers.ValidationError("Kategoriyani o'zining ichki kategoriyasiga ko'chirib bo'lmaydi.")
+        return parent
 
     def create(self, validated_data):
         parent = validated_data.pop('parent', None)
@@ -51,9 +63,11 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailField(source='image')
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'thumbnails']
         extra_kwargs = {'image': {'required': False}}
 
     def create(self, validated_data):
@@ -70,7 +84,8 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'category', 'description', 'price', 'quantity','worth', 'discount', 'views', 'sold_count', 'images',
-                  'average_rank', 'get_likes_count', 'is_available', 'modified_date', 'created_date']
+                  'average_rank', 'rank_count', 'rank_histogram', 'get_likes_count', 'available_quantity', 'is_available',
+                  'modified_date', 'created_date']
         read_only_fields = ['views', 'is_available']
 
 
@@ -100,8 +115,9 @@ class ProductPostSerializer(serializers.ModelSerializer):
         # ProductImage obyektlarini yaratish
         product_images = [ProductImage(product=obj, image=image) for image in images]
 
-        # Barcha ProductImage obyektlarini saqlash
+        # Barcha ProductImage obyektlarini saqlash (bulk_create post_save signalini yubormaydi)
         ProductImage.objects.bulk_create(product_images)
+        transaction.on_commit(lambda: schedule_thumbnails([image.image.name for image in product_images]))
 
         return obj
 
@@ -114,6 +130,7 @@ class ProductPostSerializer(serializers.ModelSerializer):
             ProductImage.objects.filter(product=obj).delete()  # Optionally, delete old images
             product_images = [ProductImage(product=obj, image=image) for image in images]
             ProductImage.objects.bulk_create(product_images)
+            transaction.on_commit(lambda: schedule_thumbnails([image.image.name for image in product_images]))
 
         return obj
 
@@ -208,11 +225,12 @@ class RankSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'rank']
 
     def create(self, validated_data):
+        # Bitta foydalanuvchi mahsulotga faqat bitta baho qo'ya oladi, qayta baholash eskisini yangilaydi
         user = self.context['request'].user
         pid = self.context['pid']
-        validated_data['user_id'] = user.id
-        validated_data['product_id'] = pid
-        return super().create(validated_data)
+        rank, _ = Rank.objects.update_or_create(user_id=user.id, product_id=pid,
+                                                defaults={'rank': validated_data['rank']})
+        return rank
 
 
 class CommentImageSerializer(serializers.ModelSerializer):
@@ -0,0 +1,20 @@
+from celery import shared_task
+
+from .leaderboards import refresh_leaderboards as refresh
+from .reservations import sweep_expired
+from .view_counter import view_counter
+
+
+@shared_task
+def refresh_leaderboards():
+    return refresh()
+
+
+@shared_task
+def flush_product_views():
+    return view_counter.flush()
+
+
+@shared_task
+def sweep_expired_reservations():
+    return sweep_expired()
@@ -1,3 +1,464 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.account.models import User
+from config.cache import CACHE_TIMEOUT, LOCAL_CACHE_TIMEOUT, payload_timeout
+from config.thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_VARIANTS, generate_thumbnails, thumbnail_name
+from .leaderboards import get_leaderboard_ids
+from .view_counter import LocalViewBuffer, RedisViewBuffer, ViewCounter, apply_view_deltas
+from .models import Category, Leaderboard, Product, ProductImage, Like, Rank, category_path_segment
+from .serializers import ProductImageSerializer
+
+
+class ProductListQueryCountTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Ichimliklar')
+        users = [User.objects.create_user(phone=f'99890000{i:04}', name=f'user {i}') for i in range(3)]
+        for i in range(30):
+            product = Product.objects.create(name=f'Mahsulot {i}', category=category, price=1000, discount=0)
+            ProductImage.objects.create(product=product, image=f'products/{i}.png')
+            for user in users:
+                Like.objects.create(product=product, user=user)
+                Rank.objects.create(product=product, user=user, rank=(i % 10) + 1)
+
+    def count_list_queries(self, limit):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/product/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.assertEqual(self.count_list_queries(2), self.count_list_queries(30))
+
+    def test_annotations_are_serialized(self):
+        response = self.client.get('/product/', {'limit': 1, 'ordering': 'id'})
+        row = response.data['results'][0]
+        self.assertEqual(row['average_rank'], 1.0)
+        self.assertEqual(row['get_likes_count'], 3)
+        self.assertEqual(len(row['images']), 1)
+
+
+class PriceListExportTest(APITestCase):
+    def test_price_list_csv_and_admin_action(self):
+        category = Category.objects.create(name='Mevalar')
+        product = Product.objects.create(name='Olma', price='1500.00', discount=10, quantity=7, category=category)
+        admin = User.objects.create_superuser(phone='998900000000', name='Admin', password='parol')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/product/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8-sig').splitlines(),
+                         ['product_id,name,category,price,discount,quantity', f'{product.id},Olma,Mevalar,1500.00,10,7'])
+
+        self.client.force_login(admin)
+        response = self.client.post('/admin/product/product/', {'action': 'export_price_list_xlsx',
+                                                                 '_selected_action': [product.id]})
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+
+class VersionedCacheTimeoutTest(SimpleTestCase):
+    def test_process_local_cache_uses_short_timeout(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual(payload_timeout(), LOCAL_CACHE_TIMEOUT)
+        with override_settings(CACHES=redis):
+            self.assertEqual(payload_timeout(), CACHE_TIMEOUT)
+
+
+class LeaderboardStaleTest(TestCase):
+    def test_stale_board_is_rebuilt_on_read(self):
+        product = Product.objects.create(name='Olma', price=1000, discount=0, quantity=10, sold_count=5)
+        board = Leaderboard.objects.create(kind=Leaderboard.BEST_SELLING, window='all', product_ids=[])
+        self.assertEqual(get_leaderboard_ids(Leaderboard.BEST_SELLING, 'all'), [])
+
+        Leaderboard.objects.filter(pk=board.pk).update(computed_date=timezone.now() - timedelta(hours=1))
+        self.assertEqual(get_leaderboard_ids(Leaderboard.BEST_SELLING, 'all'), [product.id])
+        board.refresh_from_db()
+        self.assertEqual(board.product_ids, [product.id])
+
+
+class RankStatsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone='998900000001', name='Xaridor')
+        self.product = Product.objects.create(name='Olma', price=1000, discount=0)
+
+    def stats(self):
+        product = Product.objects.get(pk=self.product.pk)
+        return product.rank_sum, product.rank_count, {k: v for k, v in product.rank_histogram.items() if v}
+
+    def test_rating_again_updates_the_users_rank(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(f'/product/{self.product.id}/ranks/', {'rank': 4}).status_code, 201)
+        self.assertEqual(self.client.post(f'/product/{self.product.id}/ranks/', {'rank': 8}).status_code, 201)
+
+        self.assertEqual(Rank.objects.filter(user=self.user, product=self.product).count(), 1)
+        self.assertEqual(self.stats(), (8, 1, {8: 1}))
+
+    def test_create_change_and_delete_apply_deltas(self):
+        other = User.objects.create_user(phone='998900000002', name='Boshqa')
+        rank = Rank.objects.create(product=self.product, user=self.user, rank=5)
+        Rank.objects.create(product=self.product, user=other, rank=3)
+        self.assertEqual(self.stats(), (8, 2, {5: 1, 3: 1}))
+
+        rank.rank = 9
+        rank.save()
+        self.assertEqual(self.stats(), (12, 2, {9: 1, 3: 1}))
+
+        moved = Product.objects.create(name='Nok', price=1000, discount=0)
+        rank.product = moved
+        rank.save()
+        self.assertEqual(self.stats(), (3, 1, {3: 1}))
+        self.assertEqual(Product.objects.get(pk=moved.pk).rank_sum, 9)
+
+        Rank.objects.get(user=other).delete()
+        self.assertEqual(self.stats(), (0, 0, {}))
+
+    def test_saving_a_stale_product_keeps_counters(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Rank.objects.create(product=self.product, user=self.user, rank=7)
+
+        stale.name = 'Qizil olma'
+        stale.save()
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.name, product.rank_sum, product.rank_count, product.rank_count_7),
+                         ('Qizil olma', 7, 1, 1))
+
+
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def save_image(self, name, size=(1600, 800)):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 255)).save(buffer, 'PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_name_keeps_original_extension(self):
+        self.assertEqual(thumbnail_name('products/olma.png', 'card', 'webp'), 'thumbnails/card/products/olma.png.webp')
+        self.assertNotEqual(thumbnail_name('products/olma.png', 'card', 'webp'),
+                            thumbnail_name('products/olma.jpg', 'card', 'webp'))
+
+    def test_generates_every_variant_and_format_once(self):
+        from PIL import Image
+
+        name = self.save_image('products/olma.png')
+        self.assertEqual(generate_thumbnails(name), len(THUMBNAIL_VARIANTS) * len(THUMBNAIL_FORMATS))
+        for variant, (width, height) in THUMBNAIL_VARIANTS.items():
+            with default_storage.open(thumbnail_name(name, variant, 'jpg'), 'rb') as file:
+                image = Image.open(file)
+                self.assertEqual(image.format, 'JPEG')
+                # Nisbat saqlanadi: 1600x800 -> kengligi chegaraga teng
+                self.assertEqual(image.size, (width, width // 2))
+            self.assertTrue(default_storage.exists(thumbnail_name(name, variant, 'webp')))
+
+        self.assertEqual(generate_thumbnails(name), 0)
+        self.assertEqual(generate_thumbnails(name, force=True), len(THUMBNAIL_VARIANTS) * len(THUMBNAIL_FORMATS))
+
+    def test_missing_thumbnail_falls_back_to_original(self):
+        name = self.save_image('products/olma.png')
+        image = ProductImage.objects.create(image=name)
+
+        thumbnails = ProductImageSerializer(image).data['thumbnails']
+        self.assertEqual(thumbnails['card']['webp'], default_storage.url(name))
+
+        generate_thumbnails(name)
+        thumbnails = ProductImageSerializer(image).data['thumbnails']
+        self.assertEqual(thumbnails['card']['webp'], default_storage.url(thumbnail_name(name, 'card', 'webp')))
+
+    def test_backfill_command(self):
+        names = [self.save_image('products/olma.png'), self.save_image('categories/meva.jpg', (300, 300))]
+        ProductImage.objects.create(image=names[0])
+        Category.objects.create(name='Mevalar', image=names[1])
+        ProductImage.objects.create(image='products/yoq.png')
+
+        stdout, stderr = StringIO(), StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=stdout, stderr=stderr)
+
+        for name in names:
+            for variant in THUMBNAIL_VARIANTS:
+                for extension in THUMBNAIL_FORMATS:
+                    self.assertTrue(default_storage.exists(thumbnail_name(name, variant, extension)))
+        self.assertIn('products/yoq.png', stderr.getvalue())
+        self.assertIn(f'{2 * len(THUMBNAIL_VARIANTS) * len(THUMBNAIL_FORMATS)} ta thumbnail yaratildi, 1 ta xato',
+                      stdout.getvalue())
+
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name='Oziq-ovqat')
+        self.fruits = Category.objects.create(name='Mevalar', parent=self.root)
+        self.apples = Category.objects.create(name='Olmalar', parent=self.fruits)
+        self.other = Category.objects.create(name='Ichimliklar')
+
+    def path(self, *categories):
+        return ''.join(category_path_segment(category.pk) for category in categories)
+
+    def stored_path(self, category):
+        return Category.objects.values_list('path', flat=True).get(pk=category.pk)
+
+    def test_moving_a_subtree_rewrites_descendant_paths(self):
+        self.assertEqual(self.stored_path(self.apples), self.path(self.root, self.fruits, self.apples))
+
+        self.fruits.parent = self.other
+        self.fruits.save()
+
+        self.assertEqual(self.stored_path(self.fruits), self.path(self.other, self.fruits))
+        self.assertEqual(self.stored_path(self.apples), self.path(self.other, self.fruits, self.apples))
+        self.assertEqual(self.stored_path(self.root), self.path(self.root))
+
+    def test_deleting_a_parent_strips_its_segment(self):
+        self.fruits.delete()
+
+        self.apples.refresh_from_db()
+        self.assertIsNone(self.apples.parent_id)
+        self.assertEqual(self.apples.path, self.path(self.apples))
+        self.assertEqual(self.stored_path(self.root), self.path(self.root))
+
+    def test_cycles_are_rejected(self):
+        self.root.parent = self.apples
+        with self.assertRaises(ValidationError):
+            self.root.save()
+        self.root.parent = self.root
+        with self.assertRaises(ValidationError):
+            self.root.full_clean()
+        self.assertIsNone(Category.objects.get(pk=self.root.pk).parent_id)
+        self.assertEqual(self.stored_path(self.apples), self.path(self.root, self.fruits, self.apples))
+
+    def test_attach_tree_uses_one_query(self):
+        roots = list(Category.objects.filter(parent__isnull=True).order_by('id'))
+        with self.assertNumQueries(1):
+            Category.objects.attach_tree(roots)
+        self.assertEqual([[child.name for child in root.tree_children] for root in roots], [['Mevalar'], []])
+        self.assertEqual([child.name for child in roots[0].tree_children[0].tree_children], ['Olmalar'])
+
+
+def has_trigram():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+@skipUnless(connection.vendor == 'postgresql', "To'liq matnli qidiruv PostgreSQL da tekshiriladi")
+class ProductSearchTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Mevalar')
+        self.apple = Product.objects.create(name='Qizil olma', description='Shirin', price=1000, discount=0,
+                                            category=self.category)
+        self.juice = Product.objects.create(name='Sharbat', description='Olma sharbati', price=1000, discount=0)
+
+    def search(self, text):
+        response = self.client.get('/product/', {'search': text, 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_prefix_words_and_rank_ordering(self):
+        # Nomdagi moslik (A) tavsifdagidan (B) yuqori turadi
+        self.assertEqual(self.search('olm'), [self.apple.id, self.juice.id])
+        self.assertEqual(self.search('qiz olm'), [self.apple.id])
+
+    def test_punctuation_and_empty_queries(self):
+        self.assertEqual(self.search("qizil, olm!"), [self.apple.id])
+        self.assertEqual(self.search("o'lma & | :*"), [])
+        self.assertEqual(sorted(self.search('!!! ...')), [self.apple.id, self.juice.id])
+
+    def test_vector_follows_product_and_category_changes(self):
+        self.assertEqual(self.search('yashil'), [])
+        self.apple.name = 'Yashil olma'
+        self.apple.save()
+        self.assertEqual(self.search('yashil'), [self.apple.id])
+
+        self.assertEqual(self.search('mevalar'), [self.apple.id])
+        self.category.name = 'Fruktlar'
+        self.category.save()
+        self.assertEqual(self.search('frukt'), [self.apple.id])
+        self.assertEqual(self.search('mevalar'), [])
+
+        Product.objects.filter(pk=self.juice.pk).update(category=self.category)
+        self.assertEqual(sorted(self.search('frukt')), [self.apple.id, self.juice.id])
+
+    def test_typos_fall_back_to_trigram_similarity(self):
+        if not has_trigram():
+            self.skipTest("pg_trgm o'rnatilmagan")
+        self.assertEqual(self.search('Qizil olmq'), [self.apple.id])
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        Product.objects.bulk_create([Product(name=f'Olma {i}', price=1000, discount=0, views=i % 4, sold_count=i % 3,
+                                             description='olma' * (i % 5)) for i in range(25)])
+
+    def pages(self, url, params=None, direction='next'):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLess(len(pages), 50, 'kursor aylanib qoldi')
+            pages.append(response.data)
+            link = response.data[direction]
+            if link is None:
+                return pages
+            response = self.client.get(link)
+
+    def ids(self, pages):
+        return [row['id'] for page in pages for row in page['results']]
+
+    def test_next_and_previous_round_trip_with_ties(self):
+        for field in ('views', 'sold_count'):
+            expected = list(Product.objects.order_by(f'-{field}', 'id').values_list('id', flat=True))
+            forward = self.pages('/product/', {'ordering': f'-{field}', 'limit': 7})
+            self.assertEqual(self.ids(forward), expected)
+            self.assertEqual([len(page['results']) for page in forward], [7, 7, 7, 4])
+            self.assertIsNone(forward[0]['previous'])
+
+            backward = self.pages(forward[-1]['previous'], direction='previous')
+            self.assertEqual([page['results'] for page in backward], [page['results'] for page in forward[-2::-1]])
+            # Orqaga yurilgan sahifada keyingi sahifa havolasi bo'lishi kerak
+            self.assertTrue(all(page['next'] for page in backward))
+            self.assertIsNone(backward[-1]['previous'])
+
+    def test_cursor_is_rejected_when_ordering_changes(self):
+        page = self.client.get('/product/', {'ordering': '-views', 'limit': 5}).data
+        cursor = page['next'].split('cursor=')[1].split('&')[0]
+        response = self.client.get('/product/', {'ordering': '-sold_count', 'limit': 5, 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/product/', {'limit': 5, 'cursor': 'yaroqsiz'}).status_code, 404)
+
+    @skipUnless(connection.vendor == 'postgresql', "To'liq matnli qidiruv PostgreSQL da tekshiriladi")
+    def test_search_rank_keyset(self):
+        expected = [row['id'] for row in self.client.get('/product/', {'search': 'olma', 'limit': 100}).data['results']]
+        self.assertEqual(len(expected), 25)
+        self.assertEqual(self.ids(self.pages('/product/', {'search': 'olma', 'limit': 3})), expected)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Indeks rejasi PostgreSQL da tekshiriladi')
+    def test_popular_orderings_use_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for ordering, index in (('-views', 'product_views_desc_id_idx'), ('-sold_count', 'product_sold_count_id_idx')):
+            plan = Product.objects.order_by(ordering, 'id')[:20].explain()
+            self.assertIn(index, plan)
+            self.assertNotIn('Sort', plan)
+
+
+class ViewCounterTest(APITestCase):
+    def setUp(self):
+        self.products = [Product.objects.create(name=f'Olma {i}', price=1000, discount=0) for i in range(3)]
+        self.counter = ViewCounter(LocalViewBuffer(), interval=0)
+
+    def views(self):
+        return list(Product.objects.order_by('id').values_list('views', flat=True))
+
+    def test_views_are_buffered_and_flushed_in_one_update(self):
+        for product, count in zip(self.products, (1, 2, 3)):
+            for _ in range(count):
+                self.counter.increment(product.id)
+        self.assertEqual(self.views(), [0, 0, 0])
+        self.assertEqual(self.counter.stats()['pending_views'], 6)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.counter.flush(), 6)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(ctx.captured_queries[0]['sql'].startswith('UPDATE'))
+        self.assertEqual(self.views(), [1, 2, 3])
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_failed_flush_keeps_views(self):
+        self.counter.increment(self.products[0].id, 5)
+        with mock.patch('apps.product.view_counter.apply_view_deltas', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.counter.flush()
+        self.assertEqual(self.counter.stats()['failures'], 1)
+        self.counter.flush()
+        self.assertEqual(self.views(), [5, 0, 0])
+
+    def test_pending_views_are_flushed_at_exit(self):
+        counter = ViewCounter(LocalViewBuffer(), interval=3600)
+        with mock.patch('apps.product.view_counter.atexit.register') as register:
+            counter.increment(self.products[1].id)
+        register.assert_called_once_with(counter.shutdown)
+        counter.shutdown()
+        counter.thread.join(timeout=5)
+        self.assertFalse(counter.thread.is_alive())
+        self.assertEqual(self.views(), [0, 1, 0])
+
+    def test_stale_product_save_keeps_counters(self):
+        stale = Product.objects.get(pk=self.products[0].pk)
+        apply_view_deltas({stale.pk: 4})
+        Product.objects.filter(pk=stale.pk).update(sold_count=2)
+
+        stale.price = 1200
+        stale.save()
+
+        product = Product.objects.get(pk=stale.pk)
+        self.assertEqual((product.price, product.views, product.sold_count), (1200, 4, 2))
+
+    def test_view_stats_reports_lag(self):
+        buffer = LocalViewBuffer()
+        buffer.add(self.products[0].id, 3)
+        buffer.oldest = time.time() - 30
+        admin = User.objects.create_superuser(phone='998900000000', name='Admin', password='parol')
+        with mock.patch('apps.product.views.view_counter', ViewCounter(buffer, interval=0)):
+            self.client.force_authenticate(admin)
+            data = self.client.get('/product/view-stats/').data
+            self.client.force_authenticate(User.objects.create_user(phone='998900000001', name='Xaridor'))
+            self.assertEqual(self.client.get('/product/view-stats/').status_code, 403)
+        self.assertEqual((data['backend'], data['pending_products'], data['pending_views']), ('local', 1, 3))
+        self.assertGreaterEqual(data['lag_seconds'], 30)
+
+
+@skipUnless(os.getenv('REDIS_URL'), 'Redis buferi REDIS_URL berilganda tekshiriladi')
+class RedisViewBufferTest(TestCase):
+    def setUp(self):
+        self.buffer = RedisViewBuffer(os.getenv('REDIS_URL'))
+        prefix = f'test:{os.getpid()}:'
+        for name in ('key', 'processing_key', 'since_key', 'lock_key'):
+            setattr(self.buffer, name, prefix + getattr(RedisViewBuffer, name))
+        self.addCleanup(self.buffer.client.delete, self.buffer.key, self.buffer.processing_key,
+                        self.buffer.since_key, self.buffer.lock_key)
+        self.product = Product.objects.create(name='Olma', price=1000, discount=0)
+
+    def test_failed_flush_is_recovered_from_processing_key(self):
+        self.buffer.add(self.product.id, 2)
+        self.assertEqual(self.buffer.stats()[:2], (1, 2))
+
+        with self.assertRaises(RuntimeError):
+            self.buffer.flush(mock.Mock(side_effect=RuntimeError))
+        # Hash processing kalitiga ko'chgan va o'chirilmagan, yangi ko'rishlar alohida yig'iladi
+        self.assertTrue(self.buffer.client.exists(self.buffer.processing_key))
+        self.buffer.add(self.product.id, 3)
+
+        self.assertEqual(self.buffer.flush(apply_view_deltas), 2)
+        self.assertEqual(self.buffer.flush(apply_view_deltas), 3)
+        self.assertFalse(self.buffer.client.exists(self.buffer.processing_key))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).views, 5)
+
+    def test_concurrent_flush_is_skipped(self):
+        self.buffer.add(self.product.id)
+        self.buffer.client.set(self.buffer.lock_key, 1)
+        self.assertEqual(self.buffer.flush(apply_view_deltas), 0)
+        self.buffer.client.delete(self.buffer.lock_key)
+        self.assertEqual(self.buffer.flush(apply_view_deltas), 1)
@@ -0,0 +1,185 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = getattr(settings, 'PRODUCT_VIEWS_FLUSH_INTERVAL', 10)
+FLUSH_CHUNK_SIZE = 500
+
+
+def apply_view_deltas(deltas):
+    """Har bir bo'lak uchun bitta UPDATE: views = views + CASE id WHEN ... THEN delta END."""
+    from .models import Product
+
+    product_ids = sorted(deltas)
+    for start in range(0, len(product_ids), FLUSH_CHUNK_SIZE):
+        chunk = product_ids[start:start + FLUSH_CHUNK_SIZE]
+        delta = Case(*[When(pk=pk, then=Value(deltas[pk])) for pk in chunk], default=Value(0),
+                     output_field=IntegerField())
+        Product.objects.filter(pk__in=chunk).update(views=F('views') + delta)
+
+
+class LocalViewBuffer:
+    """Jarayon xotirasidagi bufer: {product_id: ko'rishlar soni}."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.oldest = None
+
+    def add(self, product_id, count=1):
+        with self.lock:
+            self.pending[product_id] = self.pending.get(product_id, 0) + count
+            if self.oldest is None:
+                self.oldest = time.time()
+
+    def flush(self, apply):
+        with self.lock:
+            deltas, oldest = self.pending, self.oldest
+            self.pending, self.oldest = {}, None
+        if not deltas:
+            return 0
+        try:
+            apply(deltas)
+        except Exception:
+            # Yozilmagan ko'rishlar buferga qaytariladi va keyingi safar qayta yoziladi
+            with self.lock:
+                for product_id, count in deltas.items():
+                    self.pending[product_id] = self.pending.get(product_id, 0) + count
+                self.oldest = min(filter(None, [self.oldest, oldest]))
+            raise
+        return sum(deltas.values())
+
+    def stats(self):
+        with self.lock:
+            return len(self.pending), sum(self.pending.values()), self.oldest
+
+
+class RedisViewBuffer:
+    """
+    Barcha jarayonlar uchun umumiy Redis hash bufer. Flush paytida hash 'processing' kalitiga ko'chiriladi
+    va faqat bazaga yozilgandan keyin o'chiriladi, shuning uchun jarayon yiqilsa ham ko'rishlar yo'qolmaydi.
+    """
+    key = 'product:views:pending'
+    processing_key = 'product:views:processing'
+    since_key = 'product:views:pending:since'
+    lock_key = 'product:views:flush-lock'
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def add(self, product_id, count=1):
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.key, product_id, count)
+        pipe.set(self.since_key, time.time(), nx=True)
+        pipe.execute()
+
+    def flush(self, apply):
+        if not self.client.set(self.lock_key, 1, nx=True, ex=60):
+            return 0
+        try:
+            # Oldingi muvaffaqiyatsiz flush qoldig'i bo'lmasa, yangi hashni olamiz
+            if not self.client.exists(self.processing_key) and self.client.exists(self.key):
+                pipe = self.client.pipeline()
+                pipe.rename(self.key, self.processing_key)
+                pipe.delete(self.since_key)
+                pipe.execute()
+            deltas = {int(pk): int(count) for pk, count in self.client.hgetall(self.processing_key).items()}
+            if deltas:
+                apply(deltas)
+            self.client.delete(self.processing_key)
+            return sum(deltas.values())
+        finally:
+            self.client.delete(self.lock_key)
+
+    def stats(self):
+        pending = {int(pk): int(count) for pk, count in self.client.hgetall(self.key).items()}
+        since = self.client.get(self.since_key)
+        return len(pending), sum(pending.values()), float(since) if since else None
+
+
+class ViewCounter:
+    """
+    Product.views ni har bir GET da yozmaslik uchun ko'rishlar buferda yig'iladi va fon oqimi
+    har FLUSH_INTERVAL soniyada ularni bazaga yozadi. Jarayon to'xtaganda qolganlari ham yoziladi.
+    """
+
+    def __init__(self, buffer, interval=FLUSH_INTERVAL):
+        self.buffer = buffer
+        self.interval = interval
+        self.thread = None
+        self.thread_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flushed_total = 0
+        self.failures = 0
+        self.last_flush_date = None
+        self.last_flush_duration = None
+
+    def increment(self, product_id, count=1):
+        self.buffer.add(product_id, count)
+        self.start()
+
+    def start(self):
+        if self.thread is not None or self.interval <= 0:
+            return
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='product-view-counter', daemon=True)
+                self.thread.start()
+                atexit.register(self.shutdown)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Mahsulot ko'rishlarini yozib bo'lmadi")
+
+    def flush(self):
+        started = time.monotonic()
+        try:
+            flushed = self.buffer.flush(apply_view_deltas)
+        except Exception:
+            self.failures += 1
+            raise
+        self.flushed_total += flushed
+        self.last_flush_date = time.time()
+        self.last_flush_duration = time.monotonic() - started
+        return flushed
+
+    def shutdown(self):
+        self.stop_event.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Jarayon to'xtashida mahsulot ko'rishlarini yozib bo'lmadi")
+
+    def stats(self):
+        pending_products, pending_views, oldest = self.buffer.stats()
+        return {
+            'backend': 'redis' if isinstance(self.buffer, RedisViewBuffer) else 'local',
+            'pending_products': pending_products,
+            'pending_views': pending_views,
+            # Eng eski yozilmagan ko'rish qancha vaqtdan beri kutmoqda (soniya)
+            'lag_seconds': round(time.time() - oldest, 3) if oldest else 0,
+            'flushed_total': self.flushed_total,
+            'failures': self.failures,
+            'last_flush_date': self.last_flush_date,
+            'last_flush_duration': self.last_flush_duration,
+            'flush_interval': self.interval,
+        }
+
+
+def _make_buffer():
+    url = getattr(settings, 'PRODUCT_VIEWS_REDIS_URL', None)
+    return RedisViewBuffer(url) if url else LocalViewBuffer()
+
+
+view_counter = ViewCounter(_make_buffer())
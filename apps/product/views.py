@@ -1,9 +1,20 @@
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, generics, status, permissions
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from config.cache import CachedListMixin
+from config.exports import EXPORT_FORMATS
+from config.pagination import KeysetPagination
+from .exports import price_list_response
+from .filters import ProductSearchFilter
+from .leaderboards import WINDOW_DAYS, get_leaderboard_ids
+from .view_counter import view_counter
 from .utils import CreateViewSetMixin
 from .models import (
     Category,
@@ -14,6 +25,7 @@ from .models import (
     Wishlist,
     Like,
     Comment, Rank, CommentImage,
+    Leaderboard,
 )
 from .serializers import (
     CategorySerializer,
@@ -37,7 +49,7 @@ from .permissions import (
 )
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -48,6 +60,15 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Category.objects.filter(parent__isnull=True)
 
+    def get_list_data(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        roots = Category.objects.attach_tree(page if page is not None else queryset)
+        serializer = self.get_serializer(roots, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data).data
+        return serializer.data
+
     def get_object(self):
         queryset = self.queryset
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
@@ -62,6 +83,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
         self.check_object_permissions(self.request, obj)
         return obj
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = Category.objects.attach_tree([self.get_object()])[0]
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         self.perform_destroy(instance)
@@ -82,16 +108,36 @@ class TagViewSet(viewsets.ModelViewSet):
 
 
 class ProductViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    queryset = Product.objects.for_listing()
     model = Product
     parser_classes = (MultiPartParser, FormParser)
     serializer_class = ProductSerializer
     serializer_post_class = ProductPostSerializer
     permission_classes = [IsAdminOrReadOnly]
-    filter_backends = (SearchFilter, DjangoFilterBackend, OrderingFilter)
+    filter_backends = (ProductSearchFilter, DjangoFilterBackend, OrderingFilter)
     search_fields = ['name']
     filterset_fields = ['category', ]
     ordering_fields = ['views', 'id', 'sold_count']
+    pagination_class = KeysetPagination
+    # Katalog katta, shuning uchun umumiy son taxminiy hisoblanadi (?count=exact bilan aniq son olinadi)
+    count_mode = 'estimate'
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        view_counter.increment(response.data['id'])
+        return response
+
+    @action(detail=False, methods=['get'], url_path='view-stats', permission_classes=[permissions.IsAdminUser])
+    def view_stats(self, request):
+        return Response(view_counter.stats())
+
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """Narxlar ro'yxati: ?output=csv (default) yoki ?output=xlsx, ?category= va ?search= filtrlari bilan."""
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': "output faqat csv yoki xlsx bo'lishi mumkin."})
+        return price_list_response(self.filter_queryset(Product.objects.all()), output)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -117,14 +163,43 @@ class ProductImageViewSet(viewsets.ModelViewSet):
         return Response({'deleted': True}, status=status.HTTP_200_OK)
 
 
-class BestSellingProductsAPIView(generics.ListAPIView):
-    queryset = Product.objects.order_by('-sold_count')  # Ko'p sotilganlarni kamayish tartibida /
+class LeaderboardListMixin:
+    """
+    Oldindan hisoblangan reytingdagi (Leaderboard) tartiblangan id ro'yxatini sahifalaydi
+    va sahifadagi mahsulotlarni bitta so'rov bilan yuklaydi. ?window=day|week|all, ?category=<id>.
+    """
+    leaderboard_kind = None
     serializer_class = ProductSerializer
+    pagination_class = LimitOffsetPagination
 
+    def get_queryset(self):
+        return Product.objects.for_listing()
 
-class NewlyAddedProductsAPIView(generics.ListAPIView):
-    queryset = Product.objects.order_by('-created_date')  # Yangi qo‘shilganlarni kamayish tartibida
-    serializer_class = ProductSerializer
+    def list(self, request, *args, **kwargs):
+        window = request.query_params.get('window', 'all')
+        if window not in WINDOW_DAYS:
+            raise ValidationError({'window': f"Noto'g'ri qiymat. Mumkin: {', '.join(WINDOW_DAYS)}."})
+        category = None
+        if request.query_params.get('category'):
+            category = get_object_or_404(Category, pk=request.query_params['category'])
+
+        ids = get_leaderboard_ids(self.leaderboard_kind, window, category)
+        page = self.paginate_queryset(ids)
+        page_ids = page if page is not None else ids
+        products = self.get_queryset().in_bulk(page_ids)
+        # O'chirilgan mahsulotlar keyingi yangilanishgacha reytingdan tushib qoladi
+        serializer = self.get_serializer([products[pk] for pk in page_ids if pk in products], many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+
+class BestSellingProductsAPIView(LeaderboardListMixin, generics.ListAPIView):
+    leaderboard_kind = Leaderboard.BEST_SELLING  # Ko'p sotilganlarni kamayish tartibida
+
+
+class NewlyAddedProductsAPIView(LeaderboardListMixin, generics.ListAPIView):
+    leaderboard_kind = Leaderboard.NEWLY_ADDED  # Yangi qo‘shilganlarni kamayish tartibida
 
 
 # class TradeViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
@@ -145,12 +220,13 @@ class NewlyAddedProductsAPIView(generics.ListAPIView):
 
 class WishlistViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
     model = Wishlist
-    queryset = Wishlist.objects.all()
+    queryset = Wishlist.objects.prefetch_related(Prefetch('product', queryset=Product.objects.for_listing()))
     serializer_class = WishListSerializer
     serializer_post_class = WishListPostSerializer
     permission_classes = [IsAuthor | IsAdminOrReadOnly]
     filter_backends = [SearchFilter, DjangoFilterBackend]
     search_fields = ['product__name']
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -166,12 +242,13 @@ class WishlistViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
 
 class LikeViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
     model = Like
-    queryset = Like.objects.all()
+    queryset = Like.objects.prefetch_related(Prefetch('product', queryset=Product.objects.for_listing()))
     serializer_class = LikeSerializer
     serializer_post_class = LikePostSerializer
     permission_classes = [IsAuthor | IsAdminOrReadOnly]
     filter_backends = [SearchFilter, DjangoFilterBackend]
     search_fields = ['product__name']
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -186,14 +263,14 @@ class LikeViewSet(CreateViewSetMixin, viewsets.ModelViewSet):
 
 
 class RankViewSet(viewsets.ModelViewSet):
-    queryset = Rank.objects.all()
+    queryset = Rank.objects.prefetch_related(Prefetch('product', queryset=Product.objects.for_listing()))
     serializer_class = RankSerializer
     filter_backends = [SearchFilter, DjangoFilterBackend]
     search_fields = ['product__name']
 
     def get_queryset(self):
         if self.request.user.is_superuser:
-            return Rank.objects.all()
+            return self.queryset.all()
         return Rank.objects.none()
 
     def get_serializer_context(self):
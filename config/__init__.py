@@ -1,6 +1,6 @@
-# # This will make sure the app is always imported when
-# # Django starts so that shared_task will use this app.
-# from __future__ import absolute_import, unicode_literals
-# from .celery import app as celery_app
-#
-# __all__ = ('celery_app',)
\ No newline at end of file
+# This will make sure the app is always imported when
+# Django starts so that shared_task will use this app.
+from __future__ import absolute_import, unicode_literals
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
\ No newline at end of file
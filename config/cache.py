@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from rest_framework.response import Response
+
+CACHE_TIMEOUT = getattr(settings, 'VERSIONED_CACHE_TIMEOUT', 60 * 60 * 24)
+# Jarayon xotirasidagi (locmem) keshda versiya faqat yozgan jarayonda oshadi, boshqa jarayonlar eski ro'yxatni
+# ko'rsatmasligi uchun payloadlar shuncha soniyadan ortiq saqlanmaydi
+LOCAL_CACHE_TIMEOUT = getattr(settings, 'VERSIONED_CACHE_LOCAL_TIMEOUT', 5)
+BUILD_LOCK_TIMEOUT = getattr(settings, 'VERSIONED_CACHE_LOCK_TIMEOUT', 10)
+
+# Bitta jarayon ichidagi parallel so'rovlar uchun qulflar (kalit hash bo'yicha taqsimlanadi)
+_local_locks = [threading.Lock() for _ in range(64)]
+
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Versiya kaliti yo'qolgan bo'lsa, eski payloadlar bilan to'qnashmasligi uchun vaqtdan olinadi
+        cache.add(_version_key(namespace), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump_version(namespace):
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), time.time_ns(), timeout=None)
+
+
+def is_process_local():
+    return settings.CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def payload_timeout(timeout=CACHE_TIMEOUT):
+    if is_process_local():
+        return min(timeout, LOCAL_CACHE_TIMEOUT)
+    return timeout
+
+
+def get_or_build(namespace, suffix, build, timeout=CACHE_TIMEOUT):
+    timeout = payload_timeout(timeout)
+    key = f'{namespace}:{get_version(namespace)}:{suffix}'
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _local_locks[hash(key) % len(_local_locks)]:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        # Faqat qulfni olgan jarayon payloadni quradi, qolganlari tayyor bo'lishini kutadi
+        lock_key = f'{key}:lock'
+        if cache.add(lock_key, 1, BUILD_LOCK_TIMEOUT):
+            try:
+                value = build()
+                cache.set(key, value, timeout)
+            finally:
+                cache.delete(lock_key)
+            return value
+
+        deadline = time.monotonic() + BUILD_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return build()
+
+
+def invalidate_on_change(*models):
+    def handler(sender, **kwargs):
+        namespace = sender._meta.label_lower
+        transaction.on_commit(lambda: bump_version(namespace))
+
+    for model in models:
+        post_save.connect(handler, sender=model, weak=False)
+        post_delete.connect(handler, sender=model, weak=False)
+
+
+class CachedListMixin:
+    """
+    list() javobini model versiyasi bo'yicha keshlaydi.
+    Model invalidate_on_change() bilan ro'yxatdan o'tgan bo'lishi kerak.
+    """
+    cache_namespace = None
+
+    def get_cache_namespace(self):
+        return self.cache_namespace or self.get_queryset().model._meta.label_lower
+
+    def get_list_data(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs).data
+
+    def list(self, request, *args, **kwargs):
+        suffix = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        data = get_or_build(self.get_cache_namespace(), suffix,
+                            lambda: self.get_list_data(request, *args, **kwargs))
+        return Response(data)
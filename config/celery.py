@@ -1,35 +1,59 @@
-# from __future__ import absolute_import, unicode_literals
-# import os
-# from dotenv import load_dotenv
-# from celery import Celery
-# from celery.schedules import crontab
-#
-# load_dotenv()
-#
-# # Set the default Django settings module for the 'celery' program.
-# os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-#
-# app = Celery('config')
-# app.conf.enable_utc = False
-# app.conf.update(timezone='Asia/Tashkent')
-# # Using a string here means the worker doesn't have to serialize
-# # the configuration object to child processes.
-# # - namespace='CELERY' means all celery-related configuration keys
-# #   should have a `CELERY_` prefix.
-# app.config_from_object('django.conf:settings', namespace='CELERY')
-#
-# app.conf.beat_schedule = {
-#     'everyday-at-23-59': {
-#         'task': 'app.order.tasks.set_expire',
-#         'schedule': crontab(minute='59', hour='23'),
-#     }
-# }
-#
-# # Load task modules from all registered Django apps.
-# # Celery beat settings
-# app.autodiscover_tasks()
-#
-#
-# @app.task(bind=True)
-# def debug_task(self):
-#     print(f'Request: {self.request!r}')
+from __future__ import absolute_import, unicode_literals
+import os
+from dotenv import load_dotenv
+from celery import Celery
+from celery.schedules import crontab
+
+load_dotenv()
+
+# Set the default Django settings module for the 'celery' program.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+app = Celery('config')
+app.conf.enable_utc = False
+app.conf.update(timezone='Asia/Tashkent')
+# Using a string here means the worker doesn't have to serialize
+# the configuration object to child processes.
+# - namespace='CELERY' means all celery-related configuration keys
+#   should have a `CELERY_` prefix.
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+app.conf.beat_schedule = {
+    'everyday-at-23-59': {
+        'task': 'apps.order.tasks.set_expire',
+        'schedule': crontab(minute='59', hour='23'),
+    },
+    'refresh-leaderboards': {
+        'task': 'apps.product.tasks.refresh_leaderboards',
+        'schedule': crontab(minute='*/10'),
+    },
+    'flush-product-views': {
+        'task': 'apps.product.tasks.flush_product_views',
+        'schedule': 10.0,
+    },
+    'delete-expired-idempotency-keys': {
+        'task': 'apps.order.tasks.delete_expired_idempotency_keys',
+        'schedule': crontab(minute='0', hour='*'),
+    },
+    'sweep-expired-reservations': {
+        'task': 'apps.product.tasks.sweep_expired_reservations',
+        'schedule': crontab(minute='*'),
+    },
+    'auto-dispatch-orders': {
+        'task': 'apps.order.tasks.auto_dispatch_orders',
+        'schedule': 30.0,
+    },
+    'refresh-sales-reports': {
+        'task': 'apps.order.tasks.refresh_sales_reports',
+        'schedule': crontab(minute='*/5'),
+    },
+}
+
+# Load task modules from all registered Django apps.
+# Celery beat settings
+app.autodiscover_tasks()
+
+
+@app.task(bind=True)
+def debug_task(self):
+    print(f'Request: {self.request!r}')
@@ -0,0 +1,178 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Bazadan server tomonidagi kursor orqali bir martada o'qiladigan qatorlar soni
+EXPORT_CHUNK_SIZE = 2000
+# Javobga bir bo'lak qilib uzatiladigan qatorlar soni
+EXPORT_BATCH_ROWS = 500
+# Excel varag'idagi qatorlar chegarasi, undan ko'pi keyingi varaqqa yoziladi
+XLSX_MAX_ROWS = 1_048_576
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+# XML 1.0 da ruxsat etilmagan boshqaruv belgilari
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Shu belgilardan boshlangan CSV katagini Excel formula deb bajaradi (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+_SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PACKAGE_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_END = object()
+
+
+class Echo:
+    """csv.writer yozgan qatorni qaytaradi, StreamingHttpResponse uchun."""
+
+    def write(self, value):
+        return value
+
+
+class ZipStream(io.RawIOBase):
+    """ZipFile yozgan baytlarni yig'ib turadi, ular javobga bo'lak-bo'lak uzatiladi."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def batches(rows, size=EXPORT_BATCH_ROWS):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def cell_text(value, tz=None):
+    # tz eksport boshida bir marta olinadi, har katak uchun timezone.localtime() qimmat
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = value.astimezone(tz or timezone.get_current_timezone()).replace(tzinfo=None)
+        return value.isoformat(' ', 'seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_cell(value, tz=None):
+    # csv.writer qolgan turlarni (None ham) o'zi yozadi, sana-vaqt mahalliy vaqtga o'giriladi, formulaga o'xshagan
+    # matn oldiga ' qo'yiladi. Sonlar (manfiy ham) matn emas, ular o'zgarmaydi
+    if isinstance(value, datetime):
+        return cell_text(value, tz)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows):
+    """CSV qatorlari bo'laklari. Boshidagi BOM Excel UTF-8 ni to'g'ri ochishi uchun."""
+    writer = csv.writer(Echo())
+    tz = timezone.get_current_timezone()
+    yield '\ufeff' + writer.writerow(header)
+    for batch in batches(rows):
+        yield ''.join(writer.writerow([csv_cell(value, tz) for value in row]) for row in batch)
+
+
+def xlsx_cell(value, tz=None):
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    text = _ILLEGAL_XML.sub('', cell_text(value, tz))
+    if not text:
+        return '<c/>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def xlsx_row(values, tz=None):
+    return '<row>' + ''.join(xlsx_cell(value, tz) for value in values) + '</row>'
+
+
+def stream_xlsx(header, rows, sheet_name='Sheet'):
+    """
+    XLSX (zip ichidagi XML) ni qatorlar kelishi bilan siqib uzatadi, xotirada bir bo'lakdan ko'p qator turmaydi.
+    Matnlar inlineStr bo'lib yoziladi (sharedStrings jadvali butun faylni xotirada ushlashni talab qiladi).
+    Qatorlar Excel chegarasidan oshsa keyingi varaqlarga bo'linadi, workbook.xml oxirida yoziladi.
+    """
+    stream = ZipStream()
+    tz = timezone.get_current_timezone()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        rows = iter(rows)
+        sheets = 0
+        while True:
+            sheets += 1
+            # Hajmi oldindan noma'lum, 4 GB dan oshsa ham yozish uchun ZIP64 sarlavhasi kerak
+            with archive.open(f'xl/worksheets/sheet{sheets}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write(f'{_XML_HEADER}<worksheet xmlns="{_SPREADSHEET_NS}"><sheetData>'.encode())
+                sheet.write(xlsx_row(header).encode())
+                yield stream.pop()
+                for batch in batches(islice(rows, XLSX_MAX_ROWS - 1)):
+                    sheet.write(''.join(xlsx_row(row, tz) for row in batch).encode())
+                    yield stream.pop()
+                sheet.write(b'</sheetData></worksheet>')
+            yield stream.pop()
+            next_row = next(rows, _END)
+            if next_row is _END:
+                break
+            rows = chain([next_row], rows)
+
+        names = [sheet_name if sheets == 1 else f'{sheet_name} {number}' for number in range(1, sheets + 1)]
+        archive.writestr('[Content_Types].xml', _XML_HEADER + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + ''.join(f'<Override PartName="/xl/worksheets/sheet{number}.xml" '
+                      f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      for number in range(1, sheets + 1))
+            + '</Types>'))
+        archive.writestr('_rels/.rels', _XML_HEADER + (
+            f'<Relationships xmlns="{_PACKAGE_NS}"><Relationship Id="rId1" '
+            f'Type="{_RELATIONSHIPS_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'))
+        archive.writestr('xl/workbook.xml', _XML_HEADER + (
+            f'<workbook xmlns="{_SPREADSHEET_NS}" xmlns:r="{_RELATIONSHIPS_NS}"><sheets>'
+            + ''.join(f'<sheet name="{escape(name[:31])}" sheetId="{number}" r:id="rId{number}"/>'
+                      for number, name in enumerate(names, start=1))
+            + '</sheets></workbook>'))
+        archive.writestr('xl/_rels/workbook.xml.rels', _XML_HEADER + (
+            f'<Relationships xmlns="{_PACKAGE_NS}">'
+            + ''.join(f'<Relationship Id="rId{number}" Type="{_RELATIONSHIPS_NS}/worksheet" '
+                      f'Target="worksheets/sheet{number}.xml"/>' for number in range(1, sheets + 1))
+            + '</Relationships>'))
+    yield stream.pop()
+
+
+def export_response(output, header, rows, filename, sheet_name='Sheet'):
+    """output - 'csv' yoki 'xlsx'. rows - qiymatlar kortejlari iteratori (odatda values_list().iterator())."""
+    if output == 'xlsx':
+        content = stream_xlsx(header, rows, sheet_name)
+    else:
+        content = stream_csv(header, rows)
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
@@ -0,0 +1,212 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def table_estimate(model):
+    """PostgreSQL dagi jadval qatorlari taxminiy soni (pg_class.reltuples). Jadval hali ANALYZE qilinmagan bo'lsa -1."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Millionlab qatorli jadvallar uchun admin paginatori: filtrsiz ro'yxatda COUNT(*) o'rniga jadval statistikasi
+    ishlatiladi. Filtrlangan ro'yxat, baho exact_threshold dan kichik bo'lsa yoki baza PostgreSQL bo'lmasa aniq son
+    hisoblanadi: EXPLAIN bahosi filtrlarda ko'p marta adashadi, sahifalar soni esa noto'g'ri chiqadi.
+    ModelAdmin da show_full_result_count = False bilan birga ishlatiladi, aks holda ikkinchi COUNT bajariladi.
+    """
+    exact_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        object_list = self.object_list
+        if (connection.vendor == 'postgresql' and isinstance(object_list, QuerySet) and not object_list.query.where
+                and not object_list.query.distinct):
+            estimate = table_estimate(object_list.model)
+            if estimate >= self.exact_threshold:
+                return estimate
+        return super().count
+
+
+class KeysetPagination(BasePagination):
+    """
+    Offset o'rniga oxirgi ko'rilgan qatorning tartiblash qiymatlari (cursor) bo'yicha sahifalash:
+    WHERE (sold_count, id) oxirgi qiymatdan keyin ... LIMIT n. Shuning uchun N-sahifa 1-sahifa bilan bir xil turadi.
+
+    Tartib OrderingFilter dan, bo'lmasa queryset yoki view.ordering dan olinadi va har doim 'id' bilan
+    yakunlanadi. Umumiy son ?count=exact|estimate|none bilan boshqariladi, standart qiymat view.count_mode dan olinadi.
+    LimitOffsetPagination kabi, ?limit berilmasa va PAGE_SIZE yo'q bo'lsa ro'yxat sahifalanmaydi.
+    """
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 1000
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_mode = 'exact'
+    default_ordering = ('id',)
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        ordering = list(ordering or queryset.query.order_by or getattr(view, 'ordering', None)
+                        or self.default_ordering)
+        ordering = ['id' if field == 'pk' else '-id' if field == '-pk' else field for field in ordering]
+        if 'id' not in ordering and '-id' not in ordering:
+            ordering.append('id')
+        return ordering
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'o': self.ordering, 'v': values, 'r': reverse}, cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = payload['v'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound('Invalid cursor')
+        if payload.get('o') != self.ordering or len(values) != len(self.ordering):
+            raise NotFound('Invalid cursor')
+        return values, reverse
+
+    def keyset_filter(self, values, reverse):
+        # (a, b, c) > (x, y, z)  =>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        conditions = []
+        for position, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            after = field.startswith('-') == reverse
+            lookup = {f'{name}__gt' if after else f'{name}__lt': values[position]}
+            for previous_field, value in zip(self.ordering[:position], values):
+                lookup[previous_field.lstrip('-')] = value
+            conditions.append(Q(**lookup))
+
+        # Birinchi ustun bo'yicha qo'shimcha chegara indeksni shu joydan o'qishni boshlashga yordam beradi
+        first = self.ordering[0]
+        bound = f"{first.lstrip('-')}__{'gte' if first.startswith('-') == reverse else 'lte'}"
+        return Q(**{bound: values[0]}) & reduce(or_, conditions)
+
+    @staticmethod
+    def get_value(obj, field):
+        for attr in field.lstrip('-').split('__'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def get_count(self, request, queryset, view):
+        mode = request.query_params.get(self.count_query_param, getattr(view, 'count_mode', self.count_mode))
+        if mode == 'none':
+            return None
+        if mode == 'estimate' and connection.vendor == 'postgresql':
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows'])
+        return queryset.count()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.request = request
+        self.ordering = self.get_ordering(request, queryset, view)
+        cursor = self.decode_cursor(request)
+        self.count = self.get_count(request, queryset, view)
+
+        reverse = cursor is not None and cursor[1]
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        else:
+            ordering = self.ordering
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(*cursor))
+
+        rows = list(queryset[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.first_values = [self.get_value(rows[0], field) for field in self.ordering] if rows else None
+        self.last_values = [self.get_value(rows[-1], field) for field in self.ordering] if rows else None
+        return rows
+
+    def get_link(self, values, reverse):
+        url = self.request.build_absolute_uri()
+        if values is None:
+            return None
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.get_link(self.last_values, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_values is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.get_link(self.first_values, True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True, 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.limit_query_param, 'required': False, 'in': 'query',
+             'schema': {'type': 'integer'}, 'description': 'Number of results to return per page.'},
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'schema': {'type': 'string'}, 'description': 'The pagination cursor value.'},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'schema': {'type': 'string', 'enum': ['exact', 'estimate', 'none']},
+             'description': 'How the total count is computed.'},
+        ]
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'drf_spectacular',
     'rest_framework',
@@ -102,6 +103,52 @@ DATABASES = {
     }
 }
 
+# Cache
+# REDIS_URL berilmasa, har bir jarayon o'zining xotirasidagi keshdan foydalanadi
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+VERSIONED_CACHE_TIMEOUT = 60 * 60 * 24
+# REDIS_URL yo'q bo'lsa (locmem) versiyalangan kesh payloadlari shuncha soniya yashaydi, chunki versiya oshirilishi
+# boshqa jarayonlarga yetib bormaydi. Bir nechta jarayon bilan ishlaganda REDIS_URL berilishi kerak.
+VERSIONED_CACHE_LOCAL_TIMEOUT = 5
+# Har bir reytingda saqlanadigan mahsulotlar soni
+LEADERBOARD_SIZE = 100
+# Reyting shundan (soniya) eski bo'lsa o'qilayotganda qayta quriladi
+LEADERBOARD_MAX_AGE = 30 * 60
+
+# Mahsulot ko'rishlari buferi: REDIS_URL bo'lsa barcha jarayonlar uchun umumiy, aks holda jarayon xotirasida
+PRODUCT_VIEWS_REDIS_URL = os.getenv('REDIS_URL')
+PRODUCT_VIEWS_FLUSH_INTERVAL = 10
+# Saqlangan buyurtmalar kunlari savdo hisobotida shuncha soniyada bir marta qayta hisoblanadi
+SALES_ROLLUP_FLUSH_INTERVAL = 5
+
+# Savatchadagi mahsulot bronining amal qilish muddati (soniya)
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Idempotency-Key bilan saqlangan javoblarning amal qilish muddati (soniya)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Bajarilmoqda holatida qolgan kalit shu vaqtdan keyin tashlab ketilgan hisoblanadi (soniya)
+IDEMPOTENCY_LEASE = 10 * 60
+
+# Promo kodlar keshda saqlanadigan vaqt (soniya)
+PROMO_CACHE_TIMEOUT = 60
+
+# Thumbnail va PDF chek yaratuvchi jarayonlar soni (0 - so'rov ichida bajariladi)
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 2))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -248,11 +295,13 @@ SIMPLE_JWT = {
 }
 
 # CELERY settings
-# CELERY_BROKER_URL = 'redis://127.0.0.1:6379'
-# CELERY_ACCEPT_CONTENT = ['application/json']
-# CELERY_RESULT_SERIALIZER = 'json'
-# CELERY_TASK_SERIALIZER = 'json'
-# CELERY_TIMEZONE = 'Asia/Tashkent'
+# Davriy vazifalar (config/celery.py dagi beat_schedule) `celery -A config worker -B` bilan ishga tushadi.
+# CELERY_BROKER_URL berilmasa cheklar jarayonlar pulida yaratiladi
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
+CELERY_ACCEPT_CONTENT = ['application/json']
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_TIMEZONE = 'Asia/Tashkent'
 
 
 # LOGGING = {
@@ -0,0 +1,110 @@
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from drf_spectacular.utils import extend_schema_field
+from rest_framework import serializers
+
+from config.workers import submit
+
+# Nom: (eng katta kenglik, eng katta balandlik). Rasm nisbati saqlanadi
+THUMBNAIL_VARIANTS = getattr(settings, 'THUMBNAIL_VARIANTS', {
+    'list': (200, 200),
+    'card': (480, 480),
+    'detail': (1080, 1080),
+})
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+THUMBNAIL_QUALITY = 82
+THUMBNAIL_ROOT = 'thumbnails'
+
+
+def thumbnail_name(name, variant, extension):
+    # products/olma.png -> thumbnails/card/products/olma.png.webp
+    # Asl kengaytma saqlanadi, aks holda olma.png va olma.jpg bir xil thumbnailga yozilib qoladi
+    return posixpath.join(THUMBNAIL_ROOT, variant, f'{name}.{extension}')
+
+
+def thumbnail_urls(name):
+    """Hali yaratilmagan (yoki xato bilan tugagan) thumbnail o'rniga asl rasm manzili qaytariladi."""
+    original = default_storage.url(name)
+    urls = {}
+    for variant in THUMBNAIL_VARIANTS:
+        urls[variant] = {}
+        for extension in THUMBNAIL_FORMATS:
+            path = thumbnail_name(name, variant, extension)
+            urls[variant][extension] = default_storage.url(path) if default_storage.exists(path) else original
+    return urls
+
+
+def generate_thumbnails(name, force=False):
+    """Bitta asl rasm uchun barcha o'lcham va formatlarni yaratadi. Yaratilgan fayllar sonini qaytaradi."""
+    from PIL import Image, ImageOps
+
+    targets = [(variant, extension) for variant in THUMBNAIL_VARIANTS for extension in THUMBNAIL_FORMATS
+               if force or not default_storage.exists(thumbnail_name(name, variant, extension))]
+    if not targets:
+        return 0
+
+    with default_storage.open(name, 'rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+
+    created = 0
+    for variant, extension in targets:
+        image = original.copy()
+        image.thumbnail(THUMBNAIL_VARIANTS[variant], Image.LANCZOS)
+        if THUMBNAIL_FORMATS[extension] == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, THUMBNAIL_FORMATS[extension], quality=THUMBNAIL_QUALITY, optimize=True)
+        path = thumbnail_name(name, variant, extension)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(buffer.getvalue()))
+        created += 1
+    return created
+
+
+def schedule_thumbnails(names):
+    """Thumbnaillarni so'rov oqimidan tashqarida, jarayonlar pulida yaratadi."""
+    for name in filter(None, names):
+        submit(f'{name} uchun thumbnail', generate_thumbnails, name)
+
+
+def thumbnails_on_save(model, field_name):
+    """Model saqlanganda (tranzaksiya tasdiqlangach) field_name rasmi uchun thumbnaillarni yaratadi."""
+
+    def handler(sender, instance, update_fields=None, **kwargs):
+        if update_fields is not None and field_name not in update_fields:
+            return
+        name = getattr(instance, field_name).name
+        if name:
+            transaction.on_commit(lambda: schedule_thumbnails([name]))
+
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=f'thumbnails:{model._meta.label}:{field_name}')
+
+
+@extend_schema_field(serializers.DictField(child=serializers.DictField(child=serializers.URLField())))
+class ThumbnailField(serializers.Field):
+    """
+    Rasmning thumbnail manzillari: {'list': {'webp': url, 'jpg': url}, 'card': {...}, 'detail': {...}}.
+    Thumbnail fayli hali mavjud bo'lmasa asl rasm manzili beriladi (bazaga murojaat qilinmaydi).
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        urls = thumbnail_urls(value.name)
+        request = self.context.get('request')
+        if request is not None:
+            urls = {variant: {extension: request.build_absolute_uri(url) for extension, url in formats.items()}
+                    for variant, formats in urls.items()}
+        return urls
@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Og'ir ishlar (rasm, PDF) uchun jarayonlar soni. 0 bo'lsa ish shu jarayonning o'zida bajariladi
+BACKGROUND_WORKERS = getattr(settings, 'BACKGROUND_WORKERS', 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def init_worker():
+    # spawn/forkserver bilan ishga tushgan jarayonda Django sozlanmagan bo'ladi
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=BACKGROUND_WORKERS, initializer=init_worker)
+        return _executor
+
+
+def _log_failure(description):
+    def callback(future):
+        if future.exception() is not None:
+            logger.error("%s bajarilmadi: %r", description, future.exception())
+    return callback
+
+
+def _submit(fn, *args):
+    global _executor
+    try:
+        return get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        with _executor_lock:
+            _executor = None
+        return get_executor().submit(fn, *args)
+
+
+def submit(description, fn, *args):
+    """
+    fn(*args) ni jarayonlar pulida bajaradi. Ishchi jarayonda bazaga murojaat qilinmasligi kerak
+    (fork qilingan ulanish ota jarayon bilan umumiy bo'ladi), kerakli ma'lumotlar argument sifatida beriladi.
+    """
+    if BACKGROUND_WORKERS <= 0:
+        return fn(*args)
+    future = _submit(fn, *args)
+    future.add_done_callback(_log_failure(description))
+    return future
+
+
+def imap(fn, iterable, window=None):
+    """
+    fn ni iterable elementlariga jarayonlar pulida qo'llaydi va natijalarni shu tartibda qaytaradi.
+    Bir vaqtda ko'pi bilan window ta vazifa navbatda turadi, shuning uchun uzun ro'yxatda ham xotira o'smaydi.
+    """
+    if BACKGROUND_WORKERS <= 0:
+        for item in iterable:
+            yield fn(item)
+        return
+    window = window or BACKGROUND_WORKERS * 2
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(_submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Mijoz yuklab olishni to'xtatsa, navbatdagi vazifalar bekor qilinadi
+        for future in pending:
+            future.cancel()